@@ -1,28 +1,166 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash  # Added flash
+import time
+_startup_started = time.perf_counter()
+
+from flask import Flask, Request, Response, make_response, render_template, stream_with_context, request, jsonify, session, redirect, url_for, flash, current_app, g  # Added flash
+from flask import before_render_template, template_rendered
 from werkzeug.utils import secure_filename
 from datetime import datetime
 from pathlib import Path
-from functools import wraps
-from utils.disease_predictor import DiseasePredictor
-from utils.location_service import LocationService
+from functools import partial, wraps
+import gzip
+import hmac
+import io
+import json
+import math
+import zipfile
+import numpy as np
+from utils.disease_predictor import DiseasePredictor, INPUT_SIZE
+from utils.location_service import LocationService, StubGeocoder
 from utils.tts_service import TTSService
 from utils.chatbot_service import ChatbotService
+from utils.prediction_cache import PredictionCache
+from utils.request_pipeline import RequestPipeline, StageTimeout
+from utils.diagnosis_jobs import DiagnosisJobs, JobQueueFull, FINISHED_STATUSES
+from utils.service_registry import ServiceRegistry
+from utils.translation_service import TranslationService
+from utils.metrics import metrics
+from utils.upload_storage import UploadStorage
+from utils.outbreaks import OutbreakService
+from utils.image_prefilter import ImagePrefilter, REJECTION_MESSAGES
+from utils.near_duplicates import perceptual_hash
+from utils.user_cache import UserProfileCache, HistoryValidators
+from utils.history_sync import HistorySync
+from utils.history_export import FORMATS, export_chunks, export_filename, export_window, parquet_schema
 from config import Config
-from googletrans import Translator
-from ml_models import Database  # NEW: Import Database class
+from ml_models import Database, disease_key  # NEW: Import Database class
+
+
+class UploadRequest(Request):
+    """Allow a larger body for the batch upload endpoint only"""
+    @property
+    def max_content_length(self):
+        if self.endpoint == 'predict_batch':
+            return current_app.config['BATCH_MAX_CONTENT_LENGTH']
+        return current_app.config['MAX_CONTENT_LENGTH']
+
 
 app = Flask(__name__)
+app.request_class = UploadRequest
 app.config.from_object(Config)
 app.secret_key = 'your-secret-key-change-this-to-random-string'  # NEW: Required for sessions and flash
 
-# Initialize services
+# Initialize services - heavy ones are created on first use or by the warmup thread
 print("🚀 Initializing SCDAS - Smart Rice Disease Detection System...")
-disease_predictor = DiseasePredictor(Config.MODEL_PATH)
-location_service = LocationService()
-tts_service = TTSService()
-chatbot_service = ChatbotService()
-db = Database()  # NEW: Initialize database
-print("✅ All services initialized successfully!")
+services = ServiceRegistry()
+disease_predictor = services.register('disease_predictor', lambda: DiseasePredictor(
+    Config.BACKEND_MODEL_PATHS[Config.INFERENCE_BACKEND],
+    max_batch_size=Config.BATCH_MAX_SIZE,
+    max_wait_ms=Config.BATCH_MAX_WAIT_MS,
+    batching=Config.BATCHING_ENABLED,
+    backend=Config.INFERENCE_BACKEND,
+    num_threads=Config.INFERENCE_THREADS
+))
+location_service = services.register('location_service', lambda: LocationService(
+    geocoder=StubGeocoder() if Config.GEOCODER == 'stub' else None,
+    db=db,
+    regions_file=Config.RICE_REGIONS_FILE,
+    cache_ttl_seconds=Config.GEOCODE_CACHE_TTL_HOURS * 3600,
+    precision=Config.GEOCODE_PRECISION,
+    timeout=Config.GEOCODE_TIMEOUT_SECONDS,
+    max_entries=Config.GEOCODE_CACHE_SIZE
+))
+tts_service = services.register('tts_service', lambda: TTSService(max_cache_mb=Config.TTS_CACHE_MAX_MB, tld=Config.TTS_TLD))
+chatbot_service = services.register('chatbot_service', lambda: ChatbotService(fuzzy_threshold=Config.CHATBOT_FUZZY_THRESHOLD))
+db = Database(Config.DATABASE_PATH)  # NEW: Initialize database
+prediction_cache = PredictionCache(db, max_entries=Config.PREDICTION_CACHE_SIZE,
+                                   near_duplicate_distance=Config.NEAR_DUPLICATE_MAX_DISTANCE,
+                                   near_duplicate_entries=Config.NEAR_DUPLICATE_INDEX_SIZE,
+                                   near_duplicate_sync_seconds=Config.NEAR_DUPLICATE_SYNC_SECONDS)
+translation_service = TranslationService(db, max_entries=Config.TRANSLATION_CACHE_SIZE)
+user_profiles = UserProfileCache(db, ttl_seconds=Config.USER_PROFILE_CACHE_TTL_SECONDS,
+                                 max_entries=Config.USER_PROFILE_CACHE_SIZE)
+history_validators = HistoryValidators(db)
+history_sync = HistorySync(db, page_size=Config.SYNC_PAGE_SIZE, max_page_size=Config.SYNC_MAX_PAGE_SIZE,
+                           retention_days=Config.SYNC_TOMBSTONE_RETENTION_DAYS)
+outbreak_service = OutbreakService(db, max_days=Config.OUTBREAK_MAX_DAYS, max_radius_km=Config.OUTBREAK_MAX_RADIUS_KM,
+                                   max_cells=Config.OUTBREAK_MAX_CELLS)
+# A full micro-batch needs BATCH_MAX_SIZE inference threads waiting on it at once
+pipeline = RequestPipeline(max_workers=Config.PIPELINE_WORKERS, stage_workers=dict(
+    Config.PIPELINE_STAGE_WORKERS,
+    inference=max(Config.BATCH_MAX_SIZE, Config.PIPELINE_STAGE_WORKERS.get('inference', 1))
+))
+image_prefilter = ImagePrefilter(enabled=Config.PREFILTER_ENABLED, size=Config.PREFILTER_SIZE,
+                                 min_plant_ratio=Config.PREFILTER_MIN_PLANT_RATIO,
+                                 min_sharpness=Config.PREFILTER_MIN_SHARPNESS,
+                                 min_brightness=Config.PREFILTER_MIN_BRIGHTNESS,
+                                 max_brightness=Config.PREFILTER_MAX_BRIGHTNESS,
+                                 max_clipped_ratio=Config.PREFILTER_MAX_CLIPPED_RATIO)
+upload_storage = UploadStorage(Config.UPLOAD_FOLDER, thumbnail_size=Config.THUMBNAIL_SIZE,
+                               retention_days=Config.UPLOAD_RETENTION_DAYS,
+                               retention_mode=Config.UPLOAD_RETENTION_MODE)
+app.add_template_filter(upload_storage.thumbnail_url, 'thumbnail_url')
+diagnosis_jobs = DiagnosisJobs(db, lambda job: run_diagnosis_job(job),
+                               max_workers=Config.JOB_WORKERS, max_pending=Config.JOB_MAX_PENDING)
+services.record('app_import', (time.perf_counter() - _startup_started) * 1000)
+if Config.WARMUP_SERVICES:
+    services.warmup(Config.WARMUP_SERVICES)
+if Config.UPLOAD_COMPACTION_INTERVAL_HOURS:
+    upload_storage.start_compaction(db, Config.UPLOAD_COMPACTION_INTERVAL_HOURS)
+print("✅ App ready - remaining services load on first use / in the background")
+
+# Long-lived or scrape endpoints that would swamp the latency histograms and slow log
+UNTIMED_ENDPOINTS = {'static', 'metrics', 'job_events'}
+
+
+@app.before_request
+def start_request_trace():
+    g.request_started = time.perf_counter()
+    g.stage_trace = metrics.start_trace()
+
+
+@app.after_request
+def remember_status(response):
+    g.response_status = response.status_code
+    return response
+
+
+@app.teardown_request
+def record_request_latency(exc):
+    """Request latency histogram, plus a structured log line with stage timings for slow requests"""
+    started = g.pop('request_started', None)
+    trace = g.pop('stage_trace', None) or []
+    metrics.end_trace()
+    if started is None or request.endpoint in UNTIMED_ENDPOINTS:
+        return
+    
+    elapsed = time.perf_counter() - started
+    endpoint = request.endpoint or 'unknown'
+    metrics.observe('request_duration_seconds', elapsed, endpoint=endpoint)
+    if elapsed * 1000 >= Config.SLOW_REQUEST_MS:
+        metrics.increment('slow_requests_total', endpoint=endpoint)
+        print("🐢 Slow request " + json.dumps({
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'method': request.method,
+            'path': request.path,
+            'endpoint': endpoint,
+            'status': g.get('response_status', 500),
+            'user_id': session.get('user_id'),
+            'duration_ms': round(elapsed * 1000, 1),
+            'stages': trace,
+            'error': repr(exc) if exc else None
+        }))
+
+
+@before_render_template.connect_via(app)
+def start_render_timer(sender, template, context, **extra):
+    g.render_started = time.perf_counter()
+
+
+@template_rendered.connect_via(app)
+def record_render_time(sender, template, context, **extra):
+    started = g.pop('render_started', None)
+    if started is not None:
+        metrics.observe_stage('render', time.perf_counter() - started)
 
 
 # NEW: Login required decorator
@@ -36,14 +174,32 @@ def login_required(f):
     return decorated_function
 
 
+def admin_required(f):
+    """Bearer token from Config.ADMIN_TOKEN, for scripts run by the agriculture department rather than farmers"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        if scheme != 'Bearer':
+            token = ''
+        if not Config.ADMIN_TOKEN or not hmac.compare_digest(token.encode(), Config.ADMIN_TOKEN.encode()):
+            return jsonify({'error': 'Admin token required'}), 403
+        return f(*args, **kwargs)
+    return decorated_function
+
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in Config.ALLOWED_EXTENSIONS
 
 
+def upload_filename(timestamp, image_hash, name):
+    """Stored name of an upload; the hash prefix keeps same-second uploads of 'image.jpg' apart"""
+    return f"{timestamp}_{image_hash[:8]}_{secure_filename(name)}"
+
+
 @app.route('/')
 @login_required  # NEW: Protect home page
 def index():
-    return render_template('index.html', user=db.get_user_info(session['user_id']))
+    return render_template('index.html', user=user_profiles.get(session['user_id']))
 
 
 @app.route('/register', methods=['GET', 'POST'])
@@ -78,6 +234,7 @@ def login():
         
         if user_id:
             session['user_id'] = user_id
+            user_profiles.invalidate(user_id)  # A fresh login always shows the current profile
             flash('Login successful!', 'success')
             return redirect(url_for('index'))
         else:
@@ -89,11 +246,73 @@ def login():
 @app.route('/logout')
 def logout():
     """User logout"""
-    session.pop('user_id', None)
+    user_id = session.pop('user_id', None)
+    if user_id is not None:
+        user_profiles.invalidate(user_id)
     flash('You have been logged out', 'info')
     return redirect(url_for('login'))
 
 
+INVALID_IMAGE_MESSAGE = "⚠️ Please upload a valid rice crop image. The uploaded image doesn't appear to be a rice plant or the image quality is too low."
+
+# Location block shown when geocoding times out or fails
+LOCATION_UNAVAILABLE = {
+    'address': 'Location lookup timed out',
+    'region': 'Unknown',
+    'climate_info': 'Location data is temporarily unavailable',
+    'crop_advice': 'General rice cultivation practices apply'
+}
+
+
+def build_result(prediction, filepath, timestamp, location_info):
+    """The diagnosis shown on the result page and stored in history"""
+    return {
+        'disease': prediction['disease'],
+        'disease_key': prediction.get('raw_disease'),
+        'confidence': prediction['confidence'],
+        'symptoms': prediction['symptoms'],
+        'treatment': prediction['treatment'],
+        'prevention': prediction['prevention'],
+        'image_path': str(filepath),
+        'timestamp': timestamp,
+        'location': location_info
+    }
+
+
+def save_upload_in_background(pending_save, user_id=None):
+    """Write an in-memory upload and its thumbnail / model copy off the response path, then cache its prediction.
+    With user_id, that user's history validators change once the thumbnail exists, since the page now shows it."""
+    if pending_save is None:
+        return
+    
+    def write():
+        filepath, image_bytes, image_hash, prediction, phash = pending_save
+        try:
+            upload_storage.save(filepath, image_bytes)
+            print(f"📁 Image saved: {filepath.name}")
+        except Exception as e:
+            print(f"❌ Error saving upload {filepath.name}: {e}")
+            return
+        if user_id is not None:
+            db.touch_history(user_id)
+        
+        # Only cache once the file exists, since a cache hit reuses it
+        if image_hash and not prediction.get('fallback'):
+            prediction_cache.put(image_hash, disease_predictor.model_version, str(filepath), prediction, phash=phash)
+    
+    pipeline.background('save_upload', write)
+
+
+def screen_upload(image_bytes):
+    """Prefilter verdict and perceptual hash of a new upload, both from one downscaled decode"""
+    try:
+        small = image_prefilter.load_small(io.BytesIO(image_bytes))
+    except Exception:
+        return image_prefilter.check(io.BytesIO(image_bytes))[0], None  # Counted and logged as unreadable
+    rejection, _ = image_prefilter.check(small)
+    return rejection, (perceptual_hash(small) if rejection is None else None)
+
+
 @app.route('/predict', methods=['POST'])
 @login_required  # NEW: Protect prediction route
 def predict():
@@ -107,56 +326,395 @@ def predict():
         return jsonify({'error': 'No file selected'}), 400
     
     if file and allowed_file(file.filename):
-        # Save uploaded file
-        filename = secure_filename(file.filename)
+        image_bytes = file.read()
+        image_hash = prediction_cache.hash_bytes(image_bytes)
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"{timestamp}_{filename}"
+        user_id = session['user_id']
+        timeouts = Config.PIPELINE_STAGE_TIMEOUTS
         
-        upload_path = Path(app.config['UPLOAD_FOLDER'])
-        upload_path.mkdir(parents=True, exist_ok=True)
+        cached = prediction_cache.get(image_hash, disease_predictor.model_version)
+        similar = phash = None
+        if not cached:
+            # Screenshots, dark or shaken photos are answered in milliseconds, without inference or a saved upload
+            rejection, phash = screen_upload(image_bytes)
+            if rejection:
+                return render_template('error.html', error_message=REJECTION_MESSAGES[rejection], image_path=None)
+            # A resized, recompressed or re-shot copy of an earlier photo reuses that photo's prediction
+            similar = prediction_cache.get_similar(phash, disease_predictor.model_version)
+        
+        # Stages that don't depend on the prediction start right away and overlap with inference
+        location_stage = pipeline.start('geocode', location_service.get_location_info,
+                                        request.form.get('latitude'), request.form.get('longitude'))
+        user_stage = pipeline.start('user_profile', user_profiles.get, user_id)
         
-        filepath = upload_path / filename
-        file.save(str(filepath))
+        pending_save = None
         
-        print(f"📁 Image saved: {filename}")
+        if cached:
+            # Same photo uploaded before - reuse the stored file and prediction
+            filepath = Path(cached['image_path'])
+            prediction = cached['prediction']
+            print(f"♻️ Reusing cached prediction for {filepath.name}")
+        else:
+            filename = upload_filename(timestamp, image_hash, file.filename)
+            
+            upload_path = Path(app.config['UPLOAD_FOLDER'])
+            upload_path.mkdir(parents=True, exist_ok=True)
+            
+            filepath = upload_path / filename
+            
+            if similar:
+                prediction = similar['prediction']
+                print(f"♻️ Reusing prediction of near-duplicate {Path(similar['image_path']).name} "
+                      f"({similar['distance']} bits apart)")
+            else:
+                # Get disease prediction straight from memory; the original is written once the response is ready
+                try:
+                    prediction = pipeline.start('inference', disease_predictor.predict, io.BytesIO(image_bytes)).result(
+                        timeout=timeouts['inference'], raise_on_timeout=True)
+                except StageTimeout:
+                    return jsonify({'error': 'Diagnosis is taking too long, please try again'}), 503
+            pending_save = (filepath, image_bytes, image_hash, prediction, phash)
         
-        # Get disease prediction
-        prediction = disease_predictor.predict(str(filepath))
         print(f"🔍 Detected: {prediction['disease']} ({prediction['confidence']}%)")
         
         # Validation - Check if confidence is too low
-        MIN_CONFIDENCE_THRESHOLD = 40  # Minimum confidence to consider valid
-        
-        if prediction['confidence'] < MIN_CONFIDENCE_THRESHOLD:
-            return render_template('error.html', 
-                error_message="⚠️ Please upload a valid rice crop image. The uploaded image doesn't appear to be a rice plant or the image quality is too low.",
+        if prediction['confidence'] < Config.MIN_CONFIDENCE_THRESHOLD:
+            metrics.increment('predictions_low_confidence_total', endpoint='predict')
+            response = render_template('error.html', 
+                error_message=INVALID_IMAGE_MESSAGE,
                 image_path=str(filepath))
+            save_upload_in_background(pending_save)
+            return response
         
-        # Get GPS location data
-        latitude = request.form.get('latitude')
-        longitude = request.form.get('longitude')
-        location_info = location_service.get_location_info(latitude, longitude)
+        # A slow or failing geocoder only degrades the location block
+        location_info = location_stage.result(timeout=timeouts['geocode'], default=LOCATION_UNAVAILABLE)
         
         # Prepare result
-        result = {
-            'disease': prediction['disease'],
-            'confidence': prediction['confidence'],
-            'symptoms': prediction['symptoms'],
-            'treatment': prediction['treatment'],
-            'prevention': prediction['prevention'],
-            'image_path': str(filepath),
-            'timestamp': timestamp,
-            'location': location_info
-        }
-        
-        # NEW: Save to user's database history
-        db.add_diagnosis(session['user_id'], result)
-        
-        return render_template('result.html', result=result, user=db.get_user_info(session['user_id']))
+        result = build_result(prediction, filepath, timestamp, location_info)
+        
+        # NEW: Save to user's database history (off the response path)
+        pipeline.background('history_write', db.add_diagnosis, user_id, result)
+        
+        response = render_template('result.html', result=result, advice_text=TTSService.build_advice_text(result),
+                                   user=user_stage.result(timeout=timeouts['user_profile']))
+        save_upload_in_background(pending_save, user_id)
+        return response
     
     return jsonify({'error': 'Invalid file type. Please upload PNG, JPG, or JPEG'}), 400
 
 
+def run_diagnosis_job(job):
+    """Worker side of an async diagnosis: the same pipeline as /predict, from the stored upload"""
+    filepath = Path(job['image_path'])
+    location_stage = pipeline.start('geocode', location_service.get_location_info, job['latitude'], job['longitude'])
+    
+    cached = prediction_cache.get(job['image_hash'], disease_predictor.model_version)
+    if cached:
+        prediction = cached['prediction']
+    else:
+        # The submit path only wrote the original; the model copy is also what we predict from
+        upload_storage.make_derivatives(filepath)
+        phash = perceptual_hash(image_prefilter.load_small(filepath))
+        similar = prediction_cache.get_similar(phash, disease_predictor.model_version)
+        if similar:
+            prediction = similar['prediction']
+        else:
+            prediction = disease_predictor.predict(upload_storage.model_input(filepath))
+        if not prediction.get('fallback'):
+            prediction_cache.put(job['image_hash'], disease_predictor.model_version, str(filepath), prediction,
+                                 phash=phash)
+    
+    if prediction['confidence'] < Config.MIN_CONFIDENCE_THRESHOLD:
+        metrics.increment('predictions_low_confidence_total', endpoint='jobs')
+        return {'valid': False, 'confidence': prediction['confidence'], 'image_path': str(filepath)}
+    
+    location_info = location_stage.result(timeout=Config.PIPELINE_STAGE_TIMEOUTS['geocode'], default=LOCATION_UNAVAILABLE)
+    result = build_result(prediction, filepath, job['timestamp'], location_info)
+    db.add_diagnosis(job['user_id'], result)
+    result['valid'] = True
+    return result
+
+
+def job_payload(job, include_result=False):
+    """Status document for a job, with the URLs a client follows"""
+    payload = {
+        'job_id': job['id'],
+        'status': job['status'],
+        'error': job['error'],
+        'poll_url': url_for('job_status', job_id=job['id']),
+        'events_url': url_for('job_events', job_id=job['id']),
+        'result_url': url_for('job_result', job_id=job['id']) if job['status'] == 'done' else None
+    }
+    if include_result:
+        payload['result'] = job['result']
+    return payload
+
+
+def get_own_job(job_id):
+    job = diagnosis_jobs.get(job_id)
+    if job is None or job['user_id'] != session['user_id']:
+        return None
+    return job
+
+
+@app.route('/jobs', methods=['POST'])
+@login_required
+def submit_job():
+    """Queue a diagnosis and return 202 right away; identical re-uploads map to the same job"""
+    file = request.files.get('file')
+    if not file or file.filename == '':
+        return jsonify({'error': 'No file selected'}), 400
+    if not allowed_file(file.filename):
+        return jsonify({'error': 'Invalid file type. Please upload PNG, JPG, or JPEG'}), 400
+    
+    image_bytes = file.read()
+    image_hash = prediction_cache.hash_bytes(image_bytes)
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    
+    if not prediction_cache.get(image_hash, disease_predictor.model_version):
+        rejection, _ = image_prefilter.check(io.BytesIO(image_bytes))
+        if rejection:
+            return jsonify({'error': REJECTION_MESSAGES[rejection], 'reason': rejection}), 422
+    
+    def store_upload():
+        upload_path = Path(app.config['UPLOAD_FOLDER'])
+        upload_path.mkdir(parents=True, exist_ok=True)
+        filepath = upload_path / upload_filename(timestamp, image_hash, file.filename)
+        upload_storage.save(filepath, image_bytes, derivatives=False)
+        return filepath
+    
+    try:
+        job, created = diagnosis_jobs.submit(session['user_id'], image_hash, store_upload,
+                                             latitude=request.form.get('latitude'),
+                                             longitude=request.form.get('longitude'),
+                                             timestamp=timestamp)
+    except JobQueueFull:
+        return jsonify({'error': 'Server is busy, please try again shortly'}), 503, {'Retry-After': '30'}
+    
+    if created:
+        print(f"📥 Queued diagnosis job {job['id']}")
+    payload = job_payload(job)
+    status = 200 if job['status'] == 'done' else 202
+    return jsonify(payload), status, {'Location': payload['poll_url']}
+
+
+@app.route('/jobs/<job_id>')
+@login_required
+def job_status(job_id):
+    """Polling endpoint"""
+    job = get_own_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job_payload(job, include_result=True))
+
+
+@app.route('/jobs/<job_id>/events')
+@login_required
+def job_events(job_id):
+    """Server-sent events: one 'status' event per status change, ending when the job finishes"""
+    job = get_own_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    payload = job_payload(job)
+    
+    def stream():
+        deadline = time.monotonic() + Config.JOB_EVENTS_MAX_SECONDS
+        next_keepalive = time.monotonic() + Config.JOB_EVENTS_KEEPALIVE_SECONDS
+        last_status = None
+        while True:
+            job = diagnosis_jobs.get(job_id)
+            if job['status'] != last_status:
+                last_status = job['status']
+                payload['status'] = job['status']
+                payload['error'] = job['error']
+                payload['result_url'] = url_for('job_result', job_id=job_id) if job['status'] == 'done' else None
+                yield f"event: status\ndata: {json.dumps(payload)}\n\n"
+            if last_status in FINISHED_STATUSES or time.monotonic() > deadline:
+                return
+            # Re-read on a short interval too: the job may be running in another worker process
+            diagnosis_jobs.wait_for_change(Config.JOB_EVENTS_POLL_SECONDS)
+            if time.monotonic() >= next_keepalive:
+                next_keepalive = time.monotonic() + Config.JOB_EVENTS_KEEPALIVE_SECONDS
+                yield ": keepalive\n\n"
+    
+    # url_for inside the generator needs the request context
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/jobs/<job_id>/result')
+@login_required
+def job_result(job_id):
+    """Result page of a finished job"""
+    job = get_own_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if job['status'] != 'done':
+        return jsonify(job_payload(job)), 409
+    
+    result = job['result']
+    if not result['valid']:
+        return render_template('error.html', error_message=INVALID_IMAGE_MESSAGE, image_path=result['image_path'])
+    return render_template('result.html', result=result, advice_text=TTSService.build_advice_text(result),
+                           user=user_profiles.get(session['user_id']))
+
+
+class BatchTooLarge(Exception):
+    """A zip member or a whole batch that would unpack to more than the configured limits"""
+
+
+def read_zip_member(archive, member):
+    """Decompressed bytes of one archive member, or None if it is corrupt or can't be unpacked"""
+    try:
+        # ZipExtFile stops at the declared file_size, so this is bounded by the checks in collect_batch_uploads
+        with archive.open(member) as f:
+            return f.read()
+    except (zipfile.BadZipFile, NotImplementedError, RuntimeError, EOFError):
+        return None
+
+
+def collect_batch_uploads():
+    """(filename, read) pairs from a multipart image set and/or zip archives, at most BATCH_MAX_FILES;
+    read() returns the image bytes (None for a broken archive), so zip members are only unpacked one at a time.
+    Raises BatchTooLarge when a member or the whole batch would unpack past the size limits."""
+    uploads = []
+    unpacked = 0
+    for file in request.files.getlist('files') + request.files.getlist('archive'):
+        if len(uploads) >= Config.BATCH_MAX_FILES:
+            break
+        if not file or file.filename == '':
+            continue
+        
+        if file.filename.lower().endswith('.zip'):
+            try:
+                # Flask closes request files when the view returns, before the response streams;
+                # the compressed bytes are within BATCH_MAX_CONTENT_LENGTH
+                archive = zipfile.ZipFile(io.BytesIO(file.read()))
+            except zipfile.BadZipFile:
+                uploads.append((file.filename, lambda: None))
+                continue
+            for member in archive.infolist():
+                if len(uploads) >= Config.BATCH_MAX_FILES:
+                    break
+                name = Path(member.filename).name
+                if member.is_dir() or member.filename.startswith('__MACOSX') or not allowed_file(name):
+                    continue
+                # Sizes from the zip directory, checked before anything is decompressed
+                if member.file_size > Config.MAX_CONTENT_LENGTH:
+                    raise BatchTooLarge(f"{name} unpacks to more than {Config.MAX_CONTENT_LENGTH // 2 ** 20} MB")
+                unpacked += member.file_size
+                if unpacked > Config.BATCH_MAX_UNPACKED_BYTES:
+                    raise BatchTooLarge(f"Archives unpack to more than {Config.BATCH_MAX_UNPACKED_BYTES // 2 ** 20} MB")
+                uploads.append((name, partial(read_zip_member, archive, member)))
+        elif allowed_file(file.filename):
+            uploads.append((file.filename, partial(lambda data: data, file.read())))
+    
+    return uploads
+
+
+@app.route('/predict/batch', methods=['POST'])
+@login_required
+def predict_batch():
+    """Diagnose a whole field survey in one request, streaming one JSON line per image"""
+    try:
+        uploads = collect_batch_uploads()
+    except BatchTooLarge as e:
+        return jsonify({'error': str(e)}), 413
+    if not uploads:
+        return jsonify({'error': 'No valid images uploaded. Send PNG/JPG files or a zip archive.'}), 400
+    
+    user_id = session['user_id']
+    location_info = location_service.get_location_info(request.form.get('latitude'), request.form.get('longitude'))
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    upload_path = Path(app.config['UPLOAD_FOLDER'])
+    upload_path.mkdir(parents=True, exist_ok=True)
+    
+    def generate():
+        rows = []
+        pending = []  # (index, filename, filepath, image_bytes, image_hash, phash) waiting for inference
+        # One forward pass worth of pixels; only the uploads waiting for it are held in memory
+        images = np.empty((min(len(uploads), Config.BATCH_PREDICT_SIZE), INPUT_SIZE[1], INPUT_SIZE[0], 3),
+                          dtype='float32')
+        
+        def emit(index, filename, filepath, prediction):
+            valid = prediction['confidence'] >= Config.MIN_CONFIDENCE_THRESHOLD
+            line = {
+                'index': index,
+                'filename': filename,
+                'disease': prediction['disease'],
+                'confidence': prediction['confidence'],
+                'valid': valid,
+                'image_path': str(filepath)
+            }
+            if valid:
+                rows.append({
+                    'disease': prediction['disease'],
+                    'disease_key': prediction.get('raw_disease'),
+                    'confidence': prediction['confidence'],
+                    'symptoms': prediction['symptoms'],
+                    'treatment': prediction['treatment'],
+                    'prevention': prediction['prevention'],
+                    'image_path': str(filepath),
+                    'timestamp': timestamp,
+                    'location': location_info
+                })
+            else:
+                metrics.increment('predictions_low_confidence_total', endpoint='predict_batch')
+            return json.dumps(line) + '\n'
+        
+        def flush():
+            results = disease_predictor.predict_batch(images[:len(pending)], batch_size=Config.BATCH_PREDICT_SIZE)
+            lines = []
+            for (index, name, filepath, image_bytes, image_hash, phash), prediction in zip(pending, results):
+                save_upload_in_background((filepath, image_bytes, image_hash, prediction, phash), user_id)
+                lines.append(emit(index, name, filepath, prediction))
+            pending.clear()
+            return lines
+        
+        # Decode images into the batch array; cached uploads and near-duplicates are answered straight away
+        for index, (name, read) in enumerate(uploads):
+            image_bytes = read()
+            if image_bytes is None:
+                yield json.dumps({'index': index, 'filename': name, 'error': 'Invalid zip archive'}) + '\n'
+                continue
+            
+            image_hash = prediction_cache.hash_bytes(image_bytes)
+            cached = prediction_cache.get(image_hash, disease_predictor.model_version)
+            if cached:
+                yield emit(index, name, cached['image_path'], cached['prediction'])
+                continue
+            
+            rejection, phash = screen_upload(image_bytes)
+            if rejection:
+                yield json.dumps({'index': index, 'filename': name, 'valid': False, 'rejected': rejection,
+                                  'error': REJECTION_MESSAGES[rejection]}) + '\n'
+                continue
+            
+            filepath = upload_path / upload_filename(timestamp, image_hash, name)
+            similar = prediction_cache.get_similar(phash, disease_predictor.model_version)
+            if similar:
+                save_upload_in_background((filepath, image_bytes, image_hash, similar['prediction'], phash), user_id)
+                yield emit(index, name, filepath, similar['prediction'])
+                continue
+            
+            if not disease_predictor.preprocess_into(io.BytesIO(image_bytes), images[len(pending)]):
+                yield json.dumps({'index': index, 'filename': name, 'error': 'Could not decode image'}) + '\n'
+                continue
+            
+            pending.append((index, name, filepath, image_bytes, image_hash, phash))
+            if len(pending) == len(images):
+                yield from flush()
+        
+        if pending:
+            yield from flush()
+        
+        saved = db.add_diagnoses(user_id, rows) if rows else 0
+        print(f"📦 Batch diagnosis: {len(uploads)} images, {saved} saved to history")
+        yield json.dumps({'done': True, 'total': len(uploads), 'saved': saved}) + '\n'
+    
+    return Response(generate(), mimetype='application/x-ndjson')
+
+
 @app.route('/text-to-speech', methods=['POST'])
 @login_required  # NEW: Protect TTS route
 def text_to_speech():
@@ -165,8 +723,9 @@ def text_to_speech():
     language = data.get('language', 'en')
 
     if language == 'te':
-        translator = Translator()
-        text = translator.translate(text, src='en', dest='te').text
+        text = translation_service.translate(text, src='en', dest='te')
+        if text is None:
+            return jsonify({'error': 'Failed to translate advice'}), 500
 
     audio_file = tts_service.convert_to_speech(text, language)
 
@@ -187,15 +746,177 @@ def chatbot():
         
         return jsonify({'response': response})
     
-    return render_template('chatbot.html', user=db.get_user_info(session['user_id']))
+    return render_template('chatbot.html', user=user_profiles.get(session['user_id']))
+
+
+def history_response(render, shows_flashes=False):
+    """render() as a response with ETag / Last-Modified, or 304 without calling it when the client's copy is current"""
+    if shows_flashes and '_flashes' in session:
+        # A 304 would skip the render that shows (and consumes) pending flash messages, and a stored copy
+        # holding them must not be reused later, so this one is neither conditional nor cached
+        response = make_response(render())
+        response.headers['Cache-Control'] = 'private, no-store'
+        return response
+    etag, last_modified = history_validators.validators(session['user_id'], request.full_path)
+    if history_validators.is_fresh(request.endpoint, etag, last_modified,
+                                   request.if_none_match, request.if_modified_since):
+        response = Response(status=304)
+    else:
+        response = make_response(render())
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    # Per user, and always revalidated, so a new diagnosis shows up on the next visit
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 
 @app.route('/history')
 @login_required  # NEW: Protect history route
 def history():
-    # NEW: Get user's history from database
-    diagnosis_history = db.get_user_history(session['user_id'])
-    return render_template('history.html', history=diagnosis_history, user=db.get_user_info(session['user_id']))
+    # NEW: Get user's history from database, one page at a time
+    cursor = request.args.get('cursor')
+    
+    def render():
+        page = db.get_user_history_page(session['user_id'], cursor=cursor, limit=Config.HISTORY_PAGE_SIZE)
+        return render_template('history.html', history=page['items'], next_cursor=page['next_cursor'],
+                               is_first_page=not cursor, user=user_profiles.get(session['user_id']))
+    
+    return history_response(render, shows_flashes=True)
+
+
+@app.route('/api/history')
+@login_required
+def history_api():
+    """Keyset-paginated history as JSON: ?cursor=<next_cursor>&limit=<n>"""
+    limit = min(max(request.args.get('limit', Config.HISTORY_PAGE_SIZE, type=int), 1), Config.HISTORY_MAX_PAGE_SIZE)
+    return history_response(lambda: jsonify(
+        db.get_user_history_page(session['user_id'], cursor=request.args.get('cursor'), limit=limit)))
+
+
+@app.route('/api/sync')
+@login_required
+def history_sync_api():
+    """Delta sync for offline clients: ?cursor=<cursor from the last response>&limit=<n>, gzip-compressed"""
+    page = history_sync.sync(session['user_id'], cursor=request.args.get('cursor'),
+                             limit=request.args.get('limit', type=int))
+    raw = json.dumps(page, separators=(',', ':')).encode('utf-8')
+    body = raw
+    response = Response(mimetype='application/json')
+    if len(raw) >= Config.SYNC_GZIP_MIN_BYTES and request.accept_encodings['gzip']:
+        body = gzip.compress(raw, compresslevel=6)
+        response.headers['Content-Encoding'] = 'gzip'
+    response.set_data(body)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'private, no-store'
+    history_sync.record_response(len(raw), len(body))
+    return response
+
+
+def outbreak_query_args():
+    """Common query arguments of the outbreak endpoints; raises ValueError on bad input"""
+    args = request.args
+    days = args.get('days', Config.OUTBREAK_DEFAULT_DAYS, type=int)
+    # Rollups are keyed by disease_key(), so 'Brown Spot' and 'brown_spot' select the same cases
+    disease = disease_key(args['disease']) if args.get('disease', '').strip() else None
+    if 'lat' in args and 'lon' in args:
+        lat, lon = float(args['lat']), float(args['lon'])
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            raise ValueError('lat/lon out of range')
+        radius_km = float(args.get('radius_km', Config.OUTBREAK_DEFAULT_RADIUS_KM))
+        if not (0 < radius_km < math.inf):
+            raise ValueError('radius_km must be a positive number')
+        return {'center': (lat, lon), 'radius_km': radius_km, 'days': days, 'disease': disease}
+    box = tuple(float(args[name]) for name in ('min_lat', 'max_lat', 'min_lon', 'max_lon'))
+    # Comparisons are False for NaN, so non-finite values fail here too
+    if not (all(-90 <= value <= 90 for value in box[:2]) and all(-180 <= value <= 180 for value in box[2:])):
+        raise ValueError('bounding box out of range')
+    if box[0] > box[1] or box[2] > box[3]:
+        raise ValueError('empty bounding box')
+    return {'box': box, 'days': days, 'disease': disease}
+
+
+@app.route('/api/outbreaks/heatmap')
+@login_required
+def outbreak_heatmap():
+    """Cases per grid cell and disease: ?lat=&lon=&radius_km= or ?min_lat=&max_lat=&min_lon=&max_lon=, plus &days=&disease="""
+    try:
+        query = outbreak_query_args()
+    except (KeyError, ValueError) as e:
+        return jsonify({'error': f'Invalid query: {e}'}), 400
+    return jsonify(outbreak_service.heatmap(**query))
+
+
+@app.route('/api/outbreaks/nearby')
+@login_required
+def outbreak_nearby():
+    """Exact case counts within a radius: ?lat=&lon=&radius_km=&days=&disease="""
+    try:
+        query = outbreak_query_args()
+        if 'center' not in query:
+            raise ValueError('lat and lon are required')
+    except (KeyError, ValueError) as e:
+        return jsonify({'error': f'Invalid query: {e}'}), 400
+    return jsonify(outbreak_service.nearby_cases(*query['center'], query['radius_km'],
+                                                 days=query['days'], disease=query['disease']))
+
+
+@app.route('/admin/export/history')
+@admin_required
+def export_history():
+    """Stream diagnosis history as CSV or Parquet: ?format=&since=&until= (YYYY-MM-DD) or &month=YYYY-MM, &region=&disease="""
+    args = request.args
+    fmt = args.get('format', 'csv')
+    try:
+        if fmt not in FORMATS:
+            raise ValueError(f'format must be one of {sorted(FORMATS)}')
+        since, until = export_window(args.get('since'), args.get('until'), args.get('month'))
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query: {e}'}), 400
+    if fmt == 'parquet':
+        try:
+            parquet_schema()
+        except ImportError:
+            return jsonify({'error': 'Parquet export needs pyarrow on the server; use format=csv'}), 501
+    
+    pieces = export_chunks(db, fmt, since, until, region=args.get('region'), disease=args.get('disease'))
+    print(f"📤 History export ({fmt}) {since or 'start'} - {until or 'now'} started")
+    return Response(stream_with_context(pieces), mimetype=FORMATS[fmt]['mimetype'],
+                    headers={'Content-Disposition': f'attachment; filename="{export_filename(fmt, since, until)}"'})
+
+
+@app.route('/stats')
+@login_required
+def stats():
+    """Batching, cache and prefilter counters"""
+    return jsonify({
+        'batching': disease_predictor.get_batch_stats() if services.is_ready('disease_predictor') else {},
+        'prediction_cache': prediction_cache.get_stats(),
+        'tts_cache': tts_service.get_stats() if services.is_ready('tts_service') else {},
+        'translation_cache': translation_service.get_stats(),
+        'geocode_cache': location_service.get_stats() if services.is_ready('location_service') else {},
+        'pipeline': pipeline.get_stats(),
+        'upload_storage_bytes': upload_storage.disk_usage(),
+        'jobs': diagnosis_jobs.get_stats(),
+        'prefilter': image_prefilter.get_stats(),
+        'user_profiles': user_profiles.get_stats(),
+        'history_revalidation': history_validators.get_stats(),
+        'history_sync': history_sync.get_stats()
+    })
+
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Stage latency histograms and counters in the Prometheus text format"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/ready')
+def ready():
+    """Readiness probe: which services are loaded and how long startup took"""
+    status = services.status()
+    status['ready'] = all(services.is_ready(name) for name in Config.REQUIRED_SERVICES)
+    return jsonify(status), 200 if status['ready'] else 503
 
 
 @app.route('/clear-history')
@@ -216,6 +937,16 @@ def delete_diagnosis(diagnosis_id):
     return redirect(url_for('history'))
 
 
+def drain_background_work():
+    """Finish background history writes and running jobs before the process exits (serve.py calls this)"""
+    diagnosis_jobs.shutdown()
+    pipeline.shutdown()
+
+
+# Resume jobs interrupted by a restart (after the routes, since the worker needs run_diagnosis_job)
+diagnosis_jobs.recover(requeue_running=Config.JOB_RECOVER_RUNNING)
+
+
 if __name__ == '__main__':
     print("📂 Creating necessary directories...")
     Path(app.config['UPLOAD_FOLDER']).mkdir(parents=True, exist_ok=True)
@@ -0,0 +1,105 @@
+"""Intent matching benchmark: per-message regex loop vs the compiled IntentMatcher, on a synthetic 10k-pattern file.
+
+    python -m benchmarks.chatbot_matching --patterns 10000 --write-intents /tmp/intents_10k.json
+"""
+import argparse
+import json
+import random
+import re
+import statistics
+import time
+
+from utils.intent_matcher import IntentMatcher
+
+SYLLABLES = ['ka', 'ri', 'pa', 'dy', 'ne', 'lo', 'su', 'ma', 'to', 'vi', 'ra', 'gu',
+             'వ', 'రి', 'పం', 'ట', 'నీ', 'రు', 'ఎ', 'రు', 'వు']
+
+
+def synthetic_intents(pattern_count, patterns_per_intent=10, seed=7):
+    """Random multi-word FAQ patterns mixing Latin and Telugu syllables"""
+    rng = random.Random(seed)
+
+    def word():
+        return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+    intents = []
+    seen = set()
+    while sum(len(intent['patterns']) for intent in intents) < pattern_count:
+        patterns = []
+        while len(patterns) < patterns_per_intent:
+            pattern = ' '.join(word() for _ in range(rng.randint(1, 3)))
+            if pattern not in seen:
+                seen.add(pattern)
+                patterns.append(pattern)
+        intents.append({'tag': f'faq_{len(intents)}', 'patterns': patterns, 'responses': [f'Answer {len(intents)}']})
+    return {'intents': intents}
+
+
+def legacy_match(intents, message):
+    """The old ChatbotService.get_response loop"""
+    message = message.lower()
+    for index, intent in enumerate(intents):
+        for pattern in intent['patterns']:
+            if re.search(r'\b' + pattern + r'\b', message):
+                return index
+    return None
+
+
+def misspell(rng, text):
+    chars = list(text)
+    position = rng.randrange(len(chars))
+    chars[position] = rng.choice('aeiou')
+    return ''.join(chars)
+
+
+def time_queries(match, queries):
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        match(query)
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    return {
+        'p50_ms': round(statistics.median(latencies), 4),
+        'p95_ms': round(latencies[int(len(latencies) * 0.95)], 4),
+        'mean_ms': round(statistics.mean(latencies), 4)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--patterns', type=int, default=10000)
+    parser.add_argument('--queries', type=int, default=300)
+    parser.add_argument('--write-intents', help='Also save the synthetic intents file here')
+    args = parser.parse_args()
+
+    data = synthetic_intents(args.patterns)
+    intents = data['intents']
+    if args.write_intents:
+        with open(args.write_intents, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+
+    rng = random.Random(11)
+    all_patterns = [(pattern, index) for index, intent in enumerate(intents) for pattern in intent['patterns']]
+    hits = [f"please tell me about {rng.choice(all_patterns)[0]} today" for _ in range(args.queries)]
+    misses = [f"what should i spray on my field number {i}" for i in range(args.queries)]
+    typos = [misspell(rng, rng.choice(all_patterns)[0]) for _ in range(args.queries)]
+
+    started = time.perf_counter()
+    matcher = IntentMatcher(intents)
+    build_ms = (time.perf_counter() - started) * 1000
+
+    agree = sum(legacy_match(intents, q) == matcher.automaton.best_intent(q.lower()) for q in hits[:50] + misses[:50])
+    fuzzy_found = sum(matcher.match(q) is not None for q in typos)
+
+    print(f"Patterns: {len(all_patterns)} in {len(intents)} intents, matcher built in {build_ms:.0f} ms")
+    print(f"Exact-match agreement with legacy on 100 queries: {agree}/100")
+    print(f"Fuzzy fallback resolved {fuzzy_found}/{len(typos)} misspelled patterns")
+    for label, queries in [('matching message', hits), ('no match', misses)]:
+        print(f"{label:18s} legacy  {time_queries(lambda q: legacy_match(intents, q), queries[:50])}")
+        print(f"{label:18s} matcher {time_queries(matcher.match, queries)}")
+    print(f"{'misspelled':18s} matcher {time_queries(matcher.match, typos)}")
+
+
+if __name__ == '__main__':
+    main()
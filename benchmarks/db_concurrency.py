@@ -0,0 +1,108 @@
+"""Concurrency benchmark for ml_models.Database: writes/sec and read latency, one connection per call vs pooled WAL.
+
+    python -m benchmarks.db_concurrency --writers 4 --readers 8 --seconds 5
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+from ml_models import Database
+
+SAMPLE_RESULT = {
+    'disease': 'Blast',
+    'confidence': 91.5,
+    'symptoms': 'Diamond-shaped lesions with gray centers and brown margins on leaves.',
+    'treatment': 'Apply Tricyclazole 75% WP (0.6g/L).',
+    'prevention': 'Use resistant varieties.',
+    'image_path': 'static/uploads/bench.jpg',
+    'timestamp': '20250101_000000',
+    'location': {'region': 'Andhra Pradesh/Telangana', 'address': 'Guntur'}
+}
+
+
+class LegacyDatabase(Database):
+    """Baseline matching the old behaviour: default rollback journal and a fresh connection per call"""
+
+    def __init__(self, db_path):
+        super().__init__(db_path, pooled=False)
+
+    def _open(self):
+        return sqlite3.connect(self.db_path, check_same_thread=False)
+
+
+def run(db, writers, readers, seconds, users=50, history_rows=20):
+    """Hammer the database from writer and reader threads and collect throughput / latency"""
+    user_ids = [db.create_user(f'bench-{time.time_ns()}-{i}', '1234', f'User {i}') for i in range(users)]
+    # Readers look at users with a fixed-size history; writers append to a separate user
+    for user_id in user_ids:
+        db.add_diagnoses(user_id, [SAMPLE_RESULT] * history_rows)
+    write_user = db.create_user(f'bench-writer-{time.time_ns()}', '1234', 'Writer')
+    stop = threading.Event()
+    writes = [0] * writers
+    locked_errors = [0]
+    read_latencies = [[] for _ in range(readers)]
+
+    def writer(slot):
+        i = 0
+        while not stop.is_set():
+            try:
+                db.add_diagnosis(write_user, SAMPLE_RESULT)
+                writes[slot] += 1
+            except sqlite3.OperationalError:
+                locked_errors[0] += 1
+            i += 1
+
+    def reader(slot):
+        i = slot
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                db.get_user_info(user_ids[i % users])
+                db.get_user_history(user_ids[i % users])
+                read_latencies[slot].append((time.perf_counter() - started) * 1000)
+            except sqlite3.OperationalError:
+                locked_errors[0] += 1
+            i += 1
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(writers)]
+    threads += [threading.Thread(target=reader, args=(n,)) for n in range(readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    latencies = sorted(l for per_thread in read_latencies for l in per_thread)
+    return {
+        'writes_per_sec': round(sum(writes) / seconds, 1),
+        'reads': len(latencies),
+        'read_p50_ms': round(statistics.median(latencies), 3) if latencies else None,
+        'read_p95_ms': round(latencies[int(len(latencies) * 0.95)], 3) if latencies else None,
+        'locked_errors': locked_errors[0]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+
+    for label, factory in [('connect-per-call (rollback journal)', LegacyDatabase),
+                           ('pooled WAL', Database)]:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, 'bench.db')
+            db = factory(db_path)
+            result = run(db, args.writers, args.readers, args.seconds)
+            db.close()
+        print(f"{label:40s} {result}")
+
+
+if __name__ == '__main__':
+    main()
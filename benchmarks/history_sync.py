@@ -0,0 +1,134 @@
+"""Load test of /api/sync against reloading history.html: bytes transferred and server CPU per sync.
+
+    python -m benchmarks.history_sync --users 20 --history 200 --rounds 50
+
+Each round a user's history changes (or not) and the client catches up either by reloading the history page,
+by revalidating it with its ETag, or with one delta sync call.
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from benchmarks.db_concurrency import SAMPLE_RESULT
+from config import Config
+
+SCENARIOS = ('unchanged', 'one_new', 'one_deleted')
+DISEASES = ['Blast', 'Brown Spot', 'Bacterial Leaf Blight', 'Tungro', 'Hispa']
+
+
+def diagnosis(rng):
+    """SAMPLE_RESULT with the disease, confidence, place and time varied, so compression isn't flattered"""
+    disease = rng.choice(DISEASES)
+    lat, lon = rng.uniform(8, 30), rng.uniform(70, 90)
+    return dict(SAMPLE_RESULT, disease=disease, confidence=round(rng.uniform(50, 99), 2),
+                symptoms=f'{disease}: {SAMPLE_RESULT["symptoms"]}', treatment=f'{disease}: {SAMPLE_RESULT["treatment"]}',
+                timestamp=f'2025{rng.randrange(1, 13):02d}{rng.randrange(1, 29):02d}_{rng.randrange(240000):06d}',
+                image_path=f'static/uploads/{rng.getrandbits(64):016x}.jpg',
+                location={'latitude': lat, 'longitude': lon, 'region': 'Andhra Pradesh/Telangana',
+                          'address': f'Village {rng.randrange(5000)}, Guntur'})
+
+
+def measure(client, path, headers=None):
+    """(bytes on the wire, CPU ms) of one request; the test client runs the app on this thread"""
+    started = time.thread_time()
+    response = client.get(path, headers=headers or {})
+    cpu_ms = (time.thread_time() - started) * 1000
+    assert response.status_code in (200, 304), (path, response.status_code)
+    return response, len(response.get_data()), cpu_ms
+
+
+def sync_page(response):
+    body = response.get_data()
+    if response.headers.get('Content-Encoding') == 'gzip':
+        body = gzip.decompress(body)
+    return json.loads(body)
+
+
+def run(app_module, users, history, rounds):
+    db = app_module.db
+    samples = {(scenario, method): {'bytes': [], 'cpu_ms': []}
+               for scenario in ('initial', *SCENARIOS) for method in ('page', 'page_etag', 'sync')}
+    accept_gzip = {'Accept-Encoding': 'gzip'}
+    rng = random.Random(0)
+
+    for index in range(users):
+        client = app_module.app.test_client()
+        phone = f'bench-sync-{index}'
+        client.post('/register', data={'phone': phone, 'pin': '1234', 'full_name': 'Bench', 'village': 'V'})
+        client.post('/login', data={'phone': phone, 'pin': '1234'})
+        user_id = db.verify_user(phone, '1234')
+        db.add_diagnoses(user_id, [diagnosis(rng) for _ in range(history)])
+
+        def record(scenario, method, size, cpu_ms):
+            samples[(scenario, method)]['bytes'].append(size)
+            samples[(scenario, method)]['cpu_ms'].append(cpu_ms)
+
+        # First contact: the client has nothing yet
+        response, size, cpu_ms = measure(client, '/history')
+        etag = response.headers['ETag']
+        record('initial', 'page', size, cpu_ms)
+        record('initial', 'page_etag', size, cpu_ms)
+        cursor, has_more = None, True
+        total_size = total_cpu = 0
+        while has_more:
+            response, size, cpu_ms = measure(client, '/api/sync' + (f'?cursor={cursor}' if cursor else ''),
+                                             accept_gzip)
+            page = sync_page(response)
+            cursor, has_more = page['cursor'], page['has_more']
+            total_size += size
+            total_cpu += cpu_ms
+        record('initial', 'sync', total_size, total_cpu)
+
+        for round_index in range(rounds):
+            scenario = SCENARIOS[round_index % len(SCENARIOS)]
+            if scenario == 'one_new':
+                db.add_diagnosis(user_id, diagnosis(rng))
+            elif scenario == 'one_deleted':
+                newest = db.get_user_history_page(user_id, limit=1)['items'][0]['id']
+                db.delete_diagnosis(newest, user_id)
+
+            _, size, cpu_ms = measure(client, '/history')
+            record(scenario, 'page', size, cpu_ms)
+            response, size, cpu_ms = measure(client, '/history', {'If-None-Match': etag})
+            etag = response.headers['ETag']
+            record(scenario, 'page_etag', size, cpu_ms)
+            response, size, cpu_ms = measure(client, f'/api/sync?cursor={cursor}', accept_gzip)
+            page = sync_page(response)
+            assert not page['reset'] and not page['has_more'], page
+            cursor = page['cursor']
+            record(scenario, 'sync', size, cpu_ms)
+
+    return {key: {'bytes': round(statistics.mean(values['bytes'])),
+                  'cpu_ms': round(statistics.median(values['cpu_ms']), 3)}
+            for key, values in samples.items() if values['bytes']}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--history', type=int, default=200, help='Diagnoses per user before the rounds start')
+    parser.add_argument('--rounds', type=int, default=30, help='Change + catch-up rounds per user')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    Config.DATABASE_PATH = os.path.join(tmp, 'bench.db')
+    Config.UPLOAD_FOLDER = os.path.join(tmp, 'uploads')
+    Config.WARMUP_SERVICES = []
+    Config.UPLOAD_COMPACTION_INTERVAL_HOURS = 0
+    Config.SLOW_REQUEST_MS = float('inf')
+    import app as app_module
+    app_module.app.config['TESTING'] = True
+
+    results = run(app_module, args.users, args.history, args.rounds)
+    print(f"{'scenario':12s} {'method':10s} {'bytes':>9s} {'cpu_ms':>8s}")
+    for (scenario, method), result in results.items():
+        print(f"{scenario:12s} {method:10s} {result['bytes']:9,d} {result['cpu_ms']:8.3f}")
+
+
+if __name__ == '__main__':
+    main()
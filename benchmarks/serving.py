@@ -0,0 +1,203 @@
+"""Throughput of the development server (python app.py) against serve.py on the same machine.
+
+    python -m benchmarks.serving --requests 200 --concurrency 8 --workers 4
+
+Both servers get the synthetic model, a fresh database and unique uploads, so every request runs inference.
+Memory is the proportional set size (PSS) of the whole process tree, which counts shared pages once.
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import textwrap
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+from benchmarks.suite import summarize, synthetic_jpeg
+
+ROOT = Path(__file__).resolve().parent.parent
+
+LAUNCHERS = {
+    'dev': '''
+        import app
+        app.app.run(debug=True, host='127.0.0.1', port={port})
+    ''',
+    'serve': '''
+        import serve
+        serve.SCDASServer({workers}, {threads}, '127.0.0.1:{port}', {max_requests}).run()
+    '''
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def launcher_script(kind, tmp, model_path, port, workers, threads, max_requests):
+    """Python source that points Config at the temp directory and starts one kind of server"""
+    overrides = f'''
+        import sys
+        sys.path.insert(0, {str(ROOT)!r})
+        from config import Config
+        Config.BACKEND_MODEL_PATHS = dict(Config.BACKEND_MODEL_PATHS, keras={model_path!r})
+        Config.INFERENCE_BACKEND = 'keras'
+        Config.DATABASE_PATH = {os.path.join(tmp, 'bench.db')!r}
+        Config.UPLOAD_FOLDER = {os.path.join(tmp, 'uploads')!r}
+        Config.GEOCODER = 'stub'
+        Config.MIN_CONFIDENCE_THRESHOLD = 0
+        Config.UPLOAD_COMPACTION_INTERVAL_HOURS = 0
+        Config.SLOW_REQUEST_MS = float('inf')
+    '''
+    body = LAUNCHERS[kind].format(port=port, workers=workers, threads=threads, max_requests=max_requests)
+    return textwrap.dedent(overrides) + textwrap.dedent(body)
+
+
+def process_tree(pid):
+    """pid and all its descendants (Linux /proc)"""
+    children = {}
+    for entry in Path('/proc').iterdir():
+        if entry.name.isdigit():
+            try:
+                ppid = int((entry / 'stat').read_text().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(ppid, []).append(int(entry.name))
+    tree, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        tree.append(current)
+        stack.extend(children.get(current, []))
+    return tree
+
+
+def tree_memory_mb(pid):
+    """Total PSS and RSS of a process tree in MB, or None where /proc has no smaps_rollup"""
+    pss = rss = 0
+    for member in process_tree(pid):
+        try:
+            for line in Path(f'/proc/{member}/smaps_rollup').read_text().splitlines():
+                if line.startswith('Pss:'):
+                    pss += int(line.split()[1])
+                elif line.startswith('Rss:'):
+                    rss += int(line.split()[1])
+        except OSError:
+            return None
+    return {'pss_mb': round(pss / 1024, 1), 'rss_mb': round(rss / 1024, 1)}
+
+
+def wait_ready(base_url, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f'{base_url}/ready', timeout=2).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def run_load(base_url, image, requests_count, concurrency):
+    """POST unique uploads to /predict from logged-in clients; returns throughput and latency percentiles"""
+    def login(index):
+        session = requests.Session()
+        account = {'phone': f'load-{index}-{time.time_ns()}', 'pin': '1234'}
+        session.post(f'{base_url}/register', data=dict(account, full_name='Load', village='V'))
+        session.post(f'{base_url}/login', data=account)
+        return session
+
+    sessions = [login(i) for i in range(concurrency)]
+    counter = iter(range(requests_count))
+    counter_lock = threading.Lock()
+    latencies, errors = [], []
+
+    def client(session):
+        while True:
+            with counter_lock:
+                n = next(counter, None)
+            if n is None:
+                return
+            # Bytes after the JPEG end marker change the hash, so the prediction cache never hits
+            data = image + n.to_bytes(8, 'big') + os.urandom(8)
+            started = time.perf_counter()
+            response = session.post(f'{base_url}/predict', files={'file': ('leaf.jpg', data, 'image/jpeg')},
+                                    data={'latitude': '16.5', 'longitude': '80.6'})
+            elapsed = (time.perf_counter() - started) * 1000
+            (latencies if response.status_code == 200 else errors).append(elapsed)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(client, sessions))
+    seconds = time.perf_counter() - started
+
+    results = {'requests_per_sec': round(len(latencies) / seconds, 2), 'errors': len(errors)}
+    if latencies:
+        results.update(summarize(latencies))
+    return results
+
+
+def bench_server(kind, model_path, image, args):
+    tmp = tempfile.mkdtemp()
+    port = free_port()
+    script = Path(tmp, f'launch_{kind}.py')
+    script.write_text(launcher_script(kind, tmp, model_path, port, args.workers, args.threads, args.max_requests))
+    log = open(Path(tmp, f'{kind}.log'), 'w')
+    env = dict(os.environ, TF_CPP_MIN_LOG_LEVEL='3', PYTHONUNBUFFERED='1')
+    started = time.perf_counter()
+    # Own process group, so the dev server's reloader child is stopped along with it
+    process = subprocess.Popen([sys.executable, str(script)], cwd=ROOT, stdout=log, stderr=subprocess.STDOUT,
+                               env=env, start_new_session=True)
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        if not wait_ready(base_url, args.startup_timeout):
+            raise RuntimeError(f'{kind} server not ready, see {log.name}')
+        results = {'startup_seconds': round(time.perf_counter() - started, 1)}
+        run_load(base_url, image, max(args.concurrency, args.requests // 10), args.concurrency)  # Warm every worker
+        results.update(run_load(base_url, image, args.requests, args.concurrency))
+        results['memory'] = tree_memory_mb(process.pid)
+        return results
+    finally:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=args.startup_timeout)
+        log.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='serve.py workers')
+    parser.add_argument('--threads', type=int, default=4, help='serve.py threads per worker')
+    parser.add_argument('--max-requests', type=int, default=0, help='serve.py worker recycling (0 = off)')
+    parser.add_argument('--startup-timeout', type=float, default=180)
+    parser.add_argument('--output', help='Also write the results to this JSON file')
+    args = parser.parse_args()
+
+    from benchmarks.suite import build_synthetic_model
+
+    model_path = build_synthetic_model(os.path.join(tempfile.mkdtemp(), 'synthetic_model.h5'))
+    image = synthetic_jpeg((3264, 2448))
+    report = {
+        'meta': {'cpus': os.cpu_count(), 'requests': args.requests, 'concurrency': args.concurrency,
+                 'workers': args.workers, 'threads': args.threads},
+        'dev': bench_server('dev', model_path, image, args),
+        'serve': bench_server('serve', model_path, image, args)
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
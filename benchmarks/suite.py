@@ -0,0 +1,579 @@
+"""Benchmark suite with a synthetic stand-in model: preprocessing, uploads, inference, database, history export, near-duplicate index, chatbot and end-to-end /predict.
+
+    python -m benchmarks.suite --output bench.json
+    python -m benchmarks.suite --output new.json --baseline bench.json --tolerance 0.2   # exits 1 on a regression
+
+Metric names ending in _ms are lower-is-better, names ending in _per_sec higher-is-better.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from benchmarks.db_concurrency import SAMPLE_RESULT
+
+# Typical phone camera resolutions
+PHONE_SIZES = {
+    '12mp': (4000, 3000),
+    '8mp': (3264, 2448),
+    '2mp': (1600, 1200)
+}
+BATCH_SIZES = (1, 8, 32)
+LINK_KBPS = {'2g': 50, '3g': 384}  # Typical rural uplinks, kbit/s
+CHAT_MESSAGES = ['hello', 'how to control blast disease', 'what fertilizer for rice', 'brown spot treatment',
+                 'when to plant paddy', 'water management tips', 'thank you', 'tell me about pests',
+                 'fertlizer dose', 'something unrelated entirely']
+
+
+def build_synthetic_model(path, classes=10, seed=0):
+    """Small CNN with the production interface: (None, 224, 224, 3) -> softmax over the disease classes"""
+    import tensorflow as tf
+
+    tf.keras.utils.set_random_seed(seed)
+    model = tf.keras.Sequential([
+        tf.keras.Input(shape=(224, 224, 3)),
+        tf.keras.layers.Conv2D(16, 3, strides=2, activation='relu'),
+        tf.keras.layers.Conv2D(32, 3, strides=2, activation='relu'),
+        tf.keras.layers.Conv2D(64, 3, strides=2, activation='relu'),
+        tf.keras.layers.GlobalAveragePooling2D(),
+        tf.keras.layers.Dense(classes, activation='softmax')
+    ])
+    model.save(path)
+    return path
+
+
+def synthetic_jpeg(size, seed=0, quality=90):
+    """Leaf-coloured gradient with sensor-like noise, so the file size is close to a real phone photo"""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    # Build at 1/4 scale and upscale, which keeps generation fast and leaves realistic low-frequency structure
+    small = np.zeros((height // 4, width // 4, 3), dtype='float32')
+    small[..., 0] = np.linspace(30, 90, width // 4)[None, :]
+    small[..., 1] = np.linspace(110, 190, height // 4)[:, None]
+    small[..., 2] = 40
+    small += rng.normal(0, 25, small.shape)
+    image = Image.fromarray(np.clip(small, 0, 255).astype('uint8')).resize(size, Image.BILINEAR)
+    noisy = np.asarray(image, dtype='int16') + rng.integers(-12, 12, (height, width, 3), dtype='int16')
+    buffer = io.BytesIO()
+    Image.fromarray(np.clip(noisy, 0, 255).astype('uint8')).save(buffer, 'JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def summarize(samples_ms):
+    ordered = sorted(samples_ms)
+    return {
+        'p50_ms': round(statistics.median(ordered), 3),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+        'mean_ms': round(statistics.fmean(ordered), 3)
+    }
+
+
+def timed_runs(fn, repeat, warmup=1):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def bench_preprocess(predictor, images, repeat):
+    from utils.image_prefilter import ImagePrefilter
+    from config import Config
+
+    prefilter = ImagePrefilter(size=Config.PREFILTER_SIZE)
+    results = {}
+    for label, data in images.items():
+        samples = timed_runs(lambda: predictor.preprocess_image(io.BytesIO(data)), repeat)
+        for key, value in summarize(samples).items():
+            results[f'preprocess.{label}.{key}'] = value
+        results[f'preprocess.{label}.file_kb'] = round(len(data) / 1024)
+        # What a rejected upload costs instead of preprocessing + inference
+        samples = timed_runs(lambda: prefilter.scores(prefilter.load_small(io.BytesIO(data))), repeat)
+        results[f'preprocess.{label}.prefilter_p50_ms'] = summarize(samples)['p50_ms']
+    return results
+
+
+def browser_downscale(data, max_edge, quality):
+    """What the upload form sends: the photo scaled to max_edge on a canvas and re-encoded as JPEG"""
+    with Image.open(io.BytesIO(data)) as img:
+        img = img.convert('RGB')
+        img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        buffer = io.BytesIO()
+        img.save(buffer, 'JPEG', quality=round(quality * 100))
+        return buffer.getvalue()
+
+
+def bench_uploads(images, repeat):
+    """Transfer time and server decode work per new upload: camera original vs downscaled in the browser"""
+    from config import Config
+    from utils.disease_predictor import DiseasePredictor, INPUT_SIZE
+    from utils.image_prefilter import ImagePrefilter
+    from utils.upload_storage import UploadStorage
+
+    prefilter = ImagePrefilter(size=Config.PREFILTER_SIZE)
+    out = np.empty((INPUT_SIZE[1], INPUT_SIZE[0], 3), dtype='float32')
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = UploadStorage(tmp, thumbnail_size=Config.THUMBNAIL_SIZE)
+
+        def server_decode(data):
+            # On the response path: prefilter + perceptual hash input, then the inference input
+            prefilter.load_small(io.BytesIO(data))
+            DiseasePredictor.preprocess_into(io.BytesIO(data), out)
+
+        def server_store(data):
+            # In the background: thumbnail and model copy
+            storage.make_derivatives(os.path.join(tmp, 'upload.jpg'), data)
+
+        for label, original in images.items():
+            variants = {'original': original,
+                        f'client{Config.UPLOAD_MAX_EDGE}': browser_downscale(original, Config.UPLOAD_MAX_EDGE,
+                                                                             Config.UPLOAD_JPEG_QUALITY),
+                        f'client{max(INPUT_SIZE)}': browser_downscale(original, max(INPUT_SIZE),
+                                                                      Config.UPLOAD_JPEG_QUALITY)}
+            for variant, data in variants.items():
+                prefix = f'uploads.{label}.{variant}'
+                results[f'{prefix}.file_kb'] = round(len(data) / 1024)
+                for link, kbps in LINK_KBPS.items():
+                    results[f'{prefix}.transfer_{link}_ms'] = round(len(data) * 8 / kbps)
+                results[f'{prefix}.server_decode_p50_ms'] = summarize(timed_runs(lambda: server_decode(data),
+                                                                                 repeat))['p50_ms']
+                results[f'{prefix}.server_store_p50_ms'] = summarize(timed_runs(lambda: server_store(data),
+                                                                                repeat))['p50_ms']
+    return results
+
+
+def bench_predict(predictor, repeat):
+    results = {}
+    for batch_size in BATCH_SIZES:
+        batch = np.random.default_rng(batch_size).random((batch_size, 224, 224, 3), dtype='float32')
+        samples = timed_runs(lambda: predictor._forward(batch), repeat)
+        stats = summarize(samples)
+        results[f'predict.batch{batch_size}.p50_ms'] = stats['p50_ms']
+        results[f'predict.batch{batch_size}.images_per_sec'] = round(batch_size * 1000 / stats['mean_ms'], 1)
+    return results
+
+
+def bench_database(row_counts, repeat, users=1000, rows_per_upload=100):
+    from ml_models import Database
+
+    results = {}
+    for rows in row_counts:
+        with tempfile.TemporaryDirectory() as tmp:
+            db = Database(os.path.join(tmp, 'bench.db'))
+            user_ids = [db.create_user(f'bench-{i}', '1234', f'User {i}') for i in range(users)]
+            # One heavy user owns 1% of the rows so deep pagination is exercised
+            heavy_user = user_ids[0]
+            heavy_rows = max(rows // 100, 100)
+
+            started = time.perf_counter()
+            inserted = db.add_diagnoses(heavy_user, [SAMPLE_RESULT] * heavy_rows)
+            rng = random.Random(rows)
+            while inserted < rows:
+                user_id = user_ids[rng.randrange(1, users)]
+                inserted += db.add_diagnoses(user_id, [SAMPLE_RESULT] * min(rows_per_upload, rows - inserted))
+            insert_seconds = time.perf_counter() - started
+
+            label = f'db.{rows // 1000}k'
+            results[f'{label}.insert_rows_per_sec'] = round(rows / insert_seconds, 1)
+
+            samples = timed_runs(lambda: db.add_diagnosis(user_ids[1], SAMPLE_RESULT), repeat)
+            results[f'{label}.insert_one.p50_ms'] = summarize(samples)['p50_ms']
+
+            samples = timed_runs(lambda: db.get_user_history_page(rng.choice(user_ids)), repeat)
+            results[f'{label}.history_first_page.p50_ms'] = summarize(samples)['p50_ms']
+
+            # Page 20 of the heavy user's history, following cursors like the UI does
+            cursor = None
+            for _ in range(19):
+                cursor = db.get_user_history_page(heavy_user, cursor=cursor)['next_cursor']
+            samples = timed_runs(lambda: db.get_user_history_page(heavy_user, cursor=cursor), repeat)
+            results[f'{label}.history_page20.p50_ms'] = summarize(samples)['p50_ms']
+
+            samples = timed_runs(lambda: db.get_user_info(rng.choice(user_ids)), repeat)
+            results[f'{label}.user_info.p50_ms'] = summarize(samples)['p50_ms']
+            db.close()
+    return results
+
+
+def bench_outbreaks(row_counts, repeat, days=90):
+    """Heatmap and radius queries over diagnoses scattered across India and the last 90 days"""
+    from ml_models import Database
+    from utils.outbreaks import OutbreakService
+
+    diseases = ['Blast', 'Brown Spot', 'Bacterial Leaf Blight', 'Tungro', 'Hispa']
+    results = {}
+    for rows in row_counts:
+        with tempfile.TemporaryDirectory() as tmp:
+            db = Database(os.path.join(tmp, 'bench.db'))
+            user_id = db.create_user('bench-outbreaks', '1234', 'Bench')
+            now = datetime.utcnow().replace(microsecond=0)
+            rng = random.Random(rows)
+
+            # created_at is spread over the window explicitly, so this bypasses add_diagnoses
+            start = time.perf_counter()
+            for offset in range(0, rows, 10000):
+                batch = []
+                for _ in range(min(10000, rows - offset)):
+                    lat, lon = rng.uniform(8, 30), rng.uniform(70, 90)
+                    created = now - timedelta(seconds=rng.randrange(days * 86400))
+                    batch.append((user_id, rng.choice(diseases), 'static/uploads/bench.jpg', '20250101_000000',
+                                  json.dumps({'latitude': lat, 'longitude': lon}), lat, lon,
+                                  created.strftime('%Y-%m-%d %H:%M:%S')))
+                with db.connection() as conn:
+                    conn.executemany('''
+                        INSERT INTO diagnosis_history
+                        (user_id, disease, confidence, image_path, timestamp, location_data, latitude, longitude, created_at)
+                        VALUES (?, ?, 90.0, ?, ?, ?, ?, ?, ?)
+                    ''', batch)
+            insert_seconds = time.perf_counter() - start
+
+            service = OutbreakService(db, max_days=days)
+            label = f'outbreaks.{rows // 1000}k'
+            results[f'{label}.insert_rows_per_sec'] = round(rows / insert_seconds, 1)
+
+            def center():
+                return rng.uniform(10, 28), rng.uniform(72, 88)
+
+            samples = timed_runs(lambda: service.heatmap(center=center(), radius_km=50, days=7, now=now), repeat)
+            results[f'{label}.heatmap_50km_7d.p50_ms'] = summarize(samples)['p50_ms']
+            samples = timed_runs(lambda: service.heatmap(box=(8, 30, 70, 90), days=30, now=now), repeat)
+            results[f'{label}.heatmap_country_30d.p50_ms'] = summarize(samples)['p50_ms']
+            samples = timed_runs(lambda: service.nearby_cases(*center(), radius_km=20, days=7, now=now), repeat)
+            results[f'{label}.nearby_20km_7d.p50_ms'] = summarize(samples)['p50_ms']
+
+            # What the same radius count costs without the index: a scan over the history table
+            since = (now - timedelta(days=7)).strftime('%Y-%m-%d %H:%M:%S')
+
+            def scan():
+                lat, lon = center()
+                with db.connection() as conn:
+                    conn.execute('''
+                        SELECT disease, COUNT(*) FROM diagnosis_history
+                        WHERE latitude BETWEEN ? AND ? AND longitude BETWEEN ? AND ? AND created_at >= ?
+                        GROUP BY disease
+                    ''', (lat - 0.2, lat + 0.2, lon - 0.2, lon + 0.2, since)).fetchall()
+
+            samples = timed_runs(scan, max(3, repeat // 5))
+            results[f'{label}.table_scan_20km_7d.p50_ms'] = summarize(samples)['p50_ms']
+            db.close()
+    return results
+
+
+def bench_history_export(row_counts, repeat, users=1000):
+    """CSV / Parquet export throughput and peak memory, and import throughput of the exported CSV"""
+    import tracemalloc
+
+    from ml_models import Database
+    from utils.history_export import export_chunks, import_history
+
+    diseases = ['Blast', 'Brown Spot', 'Bacterial Leaf Blight', 'Tungro', 'Hispa']
+    regions = ['Telangana', 'Andhra Pradesh', 'Odisha', 'West Bengal', 'Punjab']
+    results = {}
+    for rows in row_counts:
+        with tempfile.TemporaryDirectory() as tmp:
+            db = Database(os.path.join(tmp, 'bench.db'))
+            user_ids = [db.create_user(f'bench-export-{i}', '1234', 'Bench', village=f'Village {i}')
+                        for i in range(users)]
+            now = datetime.utcnow().replace(microsecond=0)
+            rng = random.Random(rows)
+            for offset in range(0, rows, 10000):
+                batch = []
+                for _ in range(min(10000, rows - offset)):
+                    lat, lon = rng.uniform(8, 30), rng.uniform(70, 90)
+                    created = now - timedelta(seconds=rng.randrange(365 * 86400))
+                    location = {'latitude': lat, 'longitude': lon, 'region': rng.choice(regions), 'address': 'Bench'}
+                    batch.append((rng.choice(user_ids), rng.choice(diseases), rng.uniform(50, 99),
+                                  'static/uploads/bench.jpg', created.strftime('%Y%m%d_%H%M%S'),
+                                  json.dumps(location), lat, lon, created.strftime('%Y-%m-%d %H:%M:%S')))
+                with db.connection() as conn:
+                    conn.executemany('''
+                        INSERT INTO diagnosis_history
+                        (user_id, disease, confidence, image_path, timestamp, location_data, latitude, longitude, created_at)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', batch)
+
+            label = f'export.{rows // 1000}k'
+            csv_path = os.path.join(tmp, 'export.csv')
+
+            def export(fmt, path=None):
+                mode = 'w' if fmt == 'csv' else 'wb'
+                with open(path or os.devnull, mode, **({'newline': ''} if fmt == 'csv' else {})) as f:
+                    for piece in export_chunks(db, fmt):
+                        f.write(piece)
+
+            formats = ['csv']
+            try:
+                import pyarrow  # noqa: F401
+                formats.append('parquet')
+            except ImportError:
+                print("⚠️ pyarrow not installed, skipping the Parquet export benchmark")
+            runs = max(1, repeat // 10)
+            for fmt in formats:
+                samples = timed_runs(lambda: export(fmt), runs, warmup=0)
+                results[f'{label}.{fmt}_rows_per_sec'] = round(rows / (min(samples) / 1000), 1)
+                # Separately, since tracemalloc slows the export down several times
+                tracemalloc.start()
+                export(fmt)
+                results[f'{label}.{fmt}_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 1e6, 1)
+                tracemalloc.stop()
+
+            export('csv', csv_path)
+            target = Database(os.path.join(tmp, 'import.db'))
+            for i in range(users):
+                target.create_user(f'bench-export-{i}', '1234', 'Bench', village=f'Village {i}')
+            stats = import_history(target, csv_path, 'csv')
+            results[f'{label}.import_csv_rows_per_sec'] = stats['rows_per_sec']
+            target.close()
+            db.close()
+    return results
+
+
+def near_duplicate_variants(image):
+    """Copies of a photo as they reach us a second time: forwarded, re-exported or re-shot a little differently"""
+    def jpeg(img, quality):
+        buffer = io.BytesIO()
+        img.save(buffer, format='JPEG', quality=quality)
+        return buffer.getvalue()
+
+    width, height = image.size
+    return {
+        'whatsapp': jpeg(image.resize((width // 2, height // 2), Image.BILINEAR), 40),
+        'brighter': jpeg(Image.eval(image, lambda v: min(255, int(v * 1.15))), 80),
+        'crop_5pct': jpeg(image.crop((width // 20, height // 20, width, height)), 80),
+        'rotate_3deg': jpeg(image.rotate(3, resample=Image.BILINEAR), 80)
+    }
+
+
+def bench_near_duplicates(entry_counts, repeat, photo_dir):
+    """Perceptual-hash index: lookup latency with N entries, and how often real photos' variants are found.
+
+    The index is filled with uniformly random hashes plus half of the photos in photo_dir. Variants of those
+    photos should match; the other half's originals should not (false_match_rate).
+    """
+    from config import Config
+    from utils.image_prefilter import ImagePrefilter
+    from utils.near_duplicates import NearDuplicateIndex, perceptual_hash
+
+    prefilter = ImagePrefilter(size=Config.PREFILTER_SIZE)
+    photos = {}
+    for path in sorted(Path(photo_dir).glob('*')):
+        try:
+            with Image.open(path) as img:
+                image = img.convert('RGB')
+        except Exception:
+            continue
+        # Identical uploads under different names would count as false matches
+        photos.setdefault(image.resize((16, 16)).tobytes(), (path.read_bytes(), image))
+    photos = list(photos.values())
+    indexed, held_out = photos[::2], photos[1::2]
+
+    def phash(data):
+        return perceptual_hash(prefilter.load_small(io.BytesIO(data)))
+
+    originals = [phash(data) for data, _ in indexed]
+    variants = [(name, phash(data)) for _, image in indexed for name, data in near_duplicate_variants(image).items()]
+    others = [phash(data) for data, _ in held_out]
+
+    results = {'near_duplicates.photos': len(photos)}
+    for entries in entry_counts:
+        rng = random.Random(entries)
+        index = NearDuplicateIndex(max_entries=entries + len(originals), max_distance=Config.NEAR_DUPLICATE_MAX_DISTANCE)
+        started = time.perf_counter()
+        for i in range(entries):
+            index.add(f'filler-{i}', rng.getrandbits(64))
+        for i, original in enumerate(originals):
+            index.add(f'photo-{i}', original)
+        label = f'near_duplicates.{entries // 1000}k'
+        results[f'{label}.insert_per_sec'] = round(len(index) / (time.perf_counter() - started), 1)
+
+        for name in sorted({name for name, _ in variants}):
+            found = [index.nearest(h) for variant, h in variants if variant == name]
+            results[f'{label}.{name}.hit_rate'] = round(sum(1 for match in found if match) / max(len(found), 1), 3)
+        if others:
+            results[f'{label}.false_match_rate'] = round(sum(1 for h in others if index.nearest(h)) / len(others), 3)
+
+        for key, value in summarize(timed_runs(lambda: index.nearest(rng.choice(variants)[1]), repeat * 10)).items():
+            results[f'{label}.lookup_hit.{key}'] = value
+        for key, value in summarize(timed_runs(lambda: index.nearest(rng.getrandbits(64)), repeat * 10)).items():
+            results[f'{label}.lookup_miss.{key}'] = value
+        results[f'{label}.candidates_per_lookup'] = index.get_stats()['candidates_per_lookup']
+    return results
+
+
+def bench_chatbot(repeat):
+    from utils.chatbot_service import ChatbotService
+
+    chatbot = ChatbotService()
+    samples = []
+    for message in CHAT_MESSAGES:
+        samples.extend(timed_runs(lambda: chatbot.get_response(message), repeat))
+    return {f'chatbot.get_response.{key}': value for key, value in summarize(samples).items()}
+
+
+def bench_end_to_end(model_path, image, requests_count, concurrency):
+    """POST /predict through the Flask test client, each upload unique so the prediction cache never hits"""
+    from config import Config
+
+    tmp = tempfile.mkdtemp()
+    Config.BACKEND_MODEL_PATHS = dict(Config.BACKEND_MODEL_PATHS, keras=model_path)
+    Config.INFERENCE_BACKEND = 'keras'
+    Config.DATABASE_PATH = os.path.join(tmp, 'bench.db')
+    Config.UPLOAD_FOLDER = os.path.join(tmp, 'uploads')
+    Config.GEOCODER = 'stub'
+    Config.MIN_CONFIDENCE_THRESHOLD = 0  # The untrained model is never confident; exercise the full result path
+    Config.WARMUP_SERVICES = []
+    Config.SLOW_REQUEST_MS = float('inf')
+
+    import app as app_module
+    app_module.app.config['TESTING'] = True
+
+    def client(index):
+        c = app_module.app.test_client()
+        c.post('/register', data={'phone': f'bench-{index}', 'pin': '1234', 'full_name': 'Bench', 'village': 'V'})
+        c.post('/login', data={'phone': f'bench-{index}', 'pin': '1234'})
+        return c
+
+    def upload(c, n):
+        # Bytes after the JPEG end marker change the hash without changing the decoded image
+        data = image + n.to_bytes(8, 'big')
+        form = {'file': (io.BytesIO(data), 'leaf.jpg'), 'latitude': '16.5', 'longitude': '80.6'}
+        response = c.post('/predict', data=form, content_type='multipart/form-data')
+        assert response.status_code == 200, response.status_code
+
+    warm = client('warm')
+    upload(warm, 0)  # Loads the model
+
+    results = {}
+    for workers in sorted({1, concurrency}):
+        clients = [client(f'{workers}-{i}') for i in range(workers)]
+        latencies = [[] for _ in range(workers)]
+        per_worker = max(1, requests_count // workers)
+
+        def run(slot):
+            for i in range(per_worker):
+                started = time.perf_counter()
+                upload(clients[slot], (workers * 1000 + slot) * 100000 + i + 1)
+                latencies[slot].append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=run, args=(slot,)) for slot in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        samples = [latency for per_thread in latencies for latency in per_thread]
+        stats = summarize(samples)
+        results[f'e2e.predict.c{workers}.requests_per_sec'] = round(len(samples) / elapsed, 2)
+        results[f'e2e.predict.c{workers}.p50_ms'] = stats['p50_ms']
+        results[f'e2e.predict.c{workers}.p95_ms'] = stats['p95_ms']
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Metrics that got worse than the baseline by more than the tolerance"""
+    regressions = []
+    for name, old in baseline.items():
+        new = results.get(name)
+        if new is None or not old:
+            continue
+        if name.endswith('_ms') and new > old * (1 + tolerance):
+            regressions.append((name, old, new))
+        elif name.endswith('_per_sec') and new < old * (1 - tolerance):
+            regressions.append((name, old, new))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', help='Earlier results file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative slowdown before failing')
+    parser.add_argument('--only', help='Comma-separated subset: preprocess,uploads,predict,db,outbreaks,export,near_duplicates,chatbot,e2e')
+    parser.add_argument('--db-rows', default='10000,100000', help='Row counts for the database benchmark, e.g. 10000,1000000')
+    parser.add_argument('--outbreak-rows', default='100000', help='Row counts for the outbreak benchmark, e.g. 100000,1000000')
+    parser.add_argument('--export-rows', default='100000', help='Row counts for the export / import benchmark, e.g. 1000000')
+    parser.add_argument('--near-duplicate-entries', default='100000', help='Index sizes for the near-duplicate benchmark, e.g. 100000,1000000')
+    parser.add_argument('--photos', default='static/uploads', help='Real photos for the near-duplicate hit rates')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--e2e-requests', type=int, default=40)
+    parser.add_argument('--e2e-concurrency', type=int, default=4)
+    parser.add_argument('--keep-model', help='Also save the synthetic model here (e.g. models/crop_disease_model.h5)')
+    args = parser.parse_args()
+
+    selected = set(args.only.split(',')) if args.only else {'preprocess', 'uploads', 'predict', 'db', 'outbreaks', 'export', 'near_duplicates', 'chatbot', 'e2e'}
+    tmp = tempfile.mkdtemp()
+    model_path = build_synthetic_model(args.keep_model or os.path.join(tmp, 'synthetic_model.h5'))
+    images = {label: synthetic_jpeg(size, seed=i) for i, (label, size) in enumerate(PHONE_SIZES.items())}
+
+    results = {}
+    if selected & {'preprocess', 'predict'}:
+        from utils.disease_predictor import DiseasePredictor
+        predictor = DiseasePredictor(model_path, batching=False, backend='keras')
+        if 'preprocess' in selected:
+            results.update(bench_preprocess(predictor, images, args.repeat))
+        if 'predict' in selected:
+            results.update(bench_predict(predictor, args.repeat))
+    if 'uploads' in selected:
+        results.update(bench_uploads(images, args.repeat))
+    if 'db' in selected:
+        results.update(bench_database([int(n) for n in args.db_rows.split(',')], args.repeat))
+    if 'outbreaks' in selected:
+        results.update(bench_outbreaks([int(n) for n in args.outbreak_rows.split(',')], args.repeat))
+    if 'export' in selected:
+        results.update(bench_history_export([int(n) for n in args.export_rows.split(',')], args.repeat))
+    if 'near_duplicates' in selected:
+        results.update(bench_near_duplicates([int(n) for n in args.near_duplicate_entries.split(',')], args.repeat,
+                                             args.photos))
+    if 'chatbot' in selected:
+        results.update(bench_chatbot(args.repeat))
+    if 'e2e' in selected:
+        results.update(bench_end_to_end(model_path, images['8mp'], args.e2e_requests, args.e2e_concurrency))
+
+    report = {
+        'meta': {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'repeat': args.repeat
+        },
+        'results': results
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+    for name in sorted(results):
+        print(f"{name:48s} {results[name]}")
+    print(f"📊 Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        for name, old, new in regressions:
+            print(f"❌ Regression: {name} {old} -> {new}")
+        if regressions:
+            sys.exit(1)
+        print(f"✅ No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
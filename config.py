@@ -1,10 +1,148 @@
+import os
+
+
 class Config:
     SECRET_KEY = 'rice-disease-detection-secret-key-2025'
     UPLOAD_FOLDER = 'static/uploads'
+    DATABASE_PATH = 'scdas.db'
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     MODEL_PATH = 'models/crop_disease_model.h5'  # Your trained model
     
+    # The upload form downscales photos in the browser and re-encodes them as JPEG before sending (0 disables).
+    # 1024 px keeps result and history images sharp; 224 makes uploads model-sized, which the server predicts
+    # from without scaling them down or storing a model copy
+    UPLOAD_MAX_EDGE = 1024
+    UPLOAD_JPEG_QUALITY = 0.85
+    
+    # Inference backend: 'keras' (MODEL_PATH), 'tflite' or 'onnx'.
+    # Create the lighter artifacts with: python -m utils.model_export convert
+    INFERENCE_BACKEND = 'keras'
+    BACKEND_MODEL_PATHS = {
+        'keras': MODEL_PATH,
+        'tflite': 'models/crop_disease_model_fp16.tflite',
+        'onnx': 'models/crop_disease_model.onnx'
+    }
+    INFERENCE_THREADS = None  # None lets the runtime decide
+    
+    # Startup: services load lazily; these are created by a background thread right after import
+    WARMUP_SERVICES = ['disease_predictor', 'chatbot_service', 'location_service', 'tts_service']
+    REQUIRED_SERVICES = ['disease_predictor']  # /ready reports 503 until these are loaded
+    
+    # Micro-batching: concurrent /predict calls share one forward pass
+    BATCHING_ENABLED = True
+    BATCH_MAX_SIZE = 16  # Max images per forward pass
+    BATCH_MAX_WAIT_MS = 10  # How long the first request waits for others to join
+    
+    # Repeat uploads of the same photo reuse the stored prediction
+    PREDICTION_CACHE_SIZE = 1024  # In-memory entries; SQLite keeps the rest
+    # ... and so do resized / recompressed / slightly re-framed copies, matched by 64-bit perceptual hash.
+    # Distinct leaf photos are 22+ bits apart; WhatsApp-style recompression moves the hash 0-2 bits.
+    NEAR_DUPLICATE_MAX_DISTANCE = 6  # Hamming distance that still counts as the same photo (0 disables)
+    NEAR_DUPLICATE_INDEX_SIZE = 100000  # Most recent cached predictions searched (~60MB per worker)
+    NEAR_DUPLICATE_SYNC_SECONDS = 30  # How often a worker picks up hashes stored by other workers
+    
+    # /predict/batch - whole field survey in one request
+    BATCH_PREDICT_SIZE = 32  # Images per forward pass
+    BATCH_MAX_FILES = 500
+    BATCH_MAX_UNPACKED_BYTES = 1024 * 1024 * 1024  # 1GB unpacked from zip archives; each member also at most MAX_CONTENT_LENGTH
+    BATCH_MAX_CONTENT_LENGTH = 512 * 1024 * 1024  # 512MB for multi-image / zip uploads
+    MIN_CONFIDENCE_THRESHOLD = 40  # Minimum confidence to consider valid
+    
+    # Prefilter: cheap checks on a small copy of each new upload; obvious non-leaf photos never reach the model
+    PREFILTER_ENABLED = True
+    PREFILTER_SIZE = 128  # Longest side (px) of the copy the checks run on
+    PREFILTER_MIN_PLANT_RATIO = 0.12  # Share of green, saturated pixels
+    PREFILTER_MIN_SHARPNESS = 40.0  # Variance of the Laplacian at PREFILTER_SIZE
+    PREFILTER_MIN_BRIGHTNESS = 30  # Mean gray level, 0-255
+    PREFILTER_MAX_BRIGHTNESS = 235
+    PREFILTER_MAX_CLIPPED_RATIO = 0.5  # Share of pure black / white pixels
+    
+    # Text-to-speech audio cache (static/audio, keyed by hash of text + language + voice)
+    TTS_CACHE_MAX_MB = 200
+    TTS_TLD = 'com'  # gTTS accent / voice
+    
+    # Translations are memoized in SQLite; pre-build with: python -m utils.translation_service build
+    TRANSLATION_CACHE_SIZE = 2048  # In-memory entries
+    
+    # Chatbot: minimum share of a pattern's character trigrams a misspelled message must cover (0 disables)
+    CHATBOT_FUZZY_THRESHOLD = 0.6
+    
+    # Reverse geocoding: 'nominatim' or 'stub' (offline, for tests); addresses cached per geohash cell
+    GEOCODER = 'nominatim'
+    GEOCODE_CACHE_TTL_HOURS = 30 * 24
+    GEOCODE_PRECISION = 6  # Geohash length; 6 is a ~1.2 km x 0.6 km cell
+    GEOCODE_CACHE_SIZE = 10000  # In-memory cells; SQLite keeps the rest
+    GEOCODE_TIMEOUT_SECONDS = 3  # Nominatim network timeout, so abandoned lookups free their thread
+    RICE_REGIONS_FILE = 'data/rice_regions.json'
+    
+    # /predict runs independent stages concurrently on a shared executor
+    PIPELINE_WORKERS = 16
+    PIPELINE_STAGE_WORKERS = {  # Stages with a pool of their own, so slow geocoding never queues inference
+        # Each inference thread waits on one image's batch slot, so fewer than BATCH_MAX_SIZE threads would cap
+        # every micro-batch at the pool size; app.py raises it to BATCH_MAX_SIZE if set lower
+        'inference': 16,
+        'geocode': 4
+    }
+    PIPELINE_STAGE_TIMEOUTS = {  # Seconds
+        'inference': 60,  # Inference only; the model loads on the request thread first (see WARMUP_SERVICES)
+        'geocode': 3,
+        'user_profile': 2
+    }
+    
+    # Async diagnosis jobs (POST /jobs returns 202; poll /jobs/<id> or stream /jobs/<id>/events)
+    JOB_WORKERS = 2
+    JOB_MAX_PENDING = 100  # Further submissions get 503 + Retry-After
+    JOB_EVENTS_KEEPALIVE_SECONDS = 15
+    JOB_EVENTS_MAX_SECONDS = 300  # Clients reconnect or fall back to polling after this
+    JOB_EVENTS_POLL_SECONDS = 1  # Jobs finished by another worker process are noticed this quickly
+    JOB_RECOVER_RUNNING = True  # Re-queue 'running' jobs at startup; serve.py does this once in the master instead
+    
+    # Production server (python serve.py): pre-forked gunicorn workers sharing a model loaded in the master
+    SERVING_BIND = '0.0.0.0:5000'
+    SERVING_WORKERS = None  # None = one per CPU core
+    SERVING_THREADS = 4  # Request threads per worker; concurrent /predict calls share forward passes
+    SERVING_INTRA_OP_THREADS = None  # TensorFlow threads per worker; None = cores // workers
+    SERVING_INTER_OP_THREADS = 1
+    SERVING_MAX_REQUESTS = 2000  # Recycle a worker after this many requests (0 = never)
+    SERVING_MAX_REQUESTS_JITTER = 200  # So workers don't all restart at once
+    SERVING_GRACEFUL_TIMEOUT = 90  # Seconds in-flight requests get to finish after SIGTERM
+    SERVING_TIMEOUT = 120  # A worker silent for this long is killed and replaced
+    
+    # Requests slower than this are logged with their per-stage timings (see /metrics for histograms)
+    SLOW_REQUEST_MS = 2000
+    
+    # Upload storage tiers: originals are kept UPLOAD_RETENTION_DAYS, then archived as smaller WebP
+    # ('archive') or removed leaving only the thumbnail ('delete'); run by hand with python -m utils.upload_storage compact
+    THUMBNAIL_SIZE = 320
+    UPLOAD_RETENTION_DAYS = 30
+    UPLOAD_RETENTION_MODE = 'archive'
+    UPLOAD_COMPACTION_INTERVAL_HOURS = 24  # 0 disables the background job
+    
+    # Outbreak queries (/api/outbreaks/heatmap, /api/outbreaks/nearby)
+    OUTBREAK_DEFAULT_DAYS = 7
+    OUTBREAK_DEFAULT_RADIUS_KM = 20
+    OUTBREAK_MAX_DAYS = 90
+    OUTBREAK_MAX_RADIUS_KM = 200
+    OUTBREAK_MAX_CELLS = 2500  # Heatmaps of larger areas switch to the 1 degree grid
+    
+    # Profiles shown on every page are cached per process; logins refresh them
+    USER_PROFILE_CACHE_TTL_SECONDS = 300
+    USER_PROFILE_CACHE_SIZE = 10000
+    
+    # History pages (keyset pagination)
+    HISTORY_PAGE_SIZE = 20
+    HISTORY_MAX_PAGE_SIZE = 100
+    
+    # Delta sync for offline clients (/api/sync): new, rewritten and deleted diagnoses since the client's cursor
+    SYNC_PAGE_SIZE = 200
+    SYNC_MAX_PAGE_SIZE = 1000
+    SYNC_TOMBSTONE_RETENTION_DAYS = 90  # Clients away longer than this download their history afresh
+    SYNC_GZIP_MIN_BYTES = 512  # Smaller responses aren't worth compressing
+    
+    # Admin endpoints (/admin/export/history) take 'Authorization: Bearer <token>'; unset disables them
+    ADMIN_TOKEN = os.environ.get('SCDAS_ADMIN_TOKEN')
+    
     # Rice crop disease classes (10 classes based on your trained model)
     DISEASE_CLASSES = [
         'bacterial_leaf_blight',
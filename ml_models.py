@@ -1,87 +1,515 @@
 import sqlite3
+import queue
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
+import base64
 import json
+from utils.metrics import metrics
+from utils.near_duplicates import to_signed, to_unsigned
+
+# Outbreak rollups bucket cases on fixed lat/lon grids, in cells per degree: 10 (~11 km) for district views,
+# 1 (~111 km) so country-wide heatmaps stay small. Changing these needs a new migration.
+ROLLUP_RESOLUTIONS = (10, 1)
+# Offsetting by 90 / 180 keeps the value positive, so CAST truncation is a floor
+CELL_Y_SQL = "CAST(({row}.latitude + 90) * {resolution} AS INTEGER)"
+CELL_X_SQL = "CAST(({row}.longitude + 180) * {resolution} AS INTEGER)"
+# Days since 2000-01-01, the time axis of the R*Tree
+DAY_NUMBER_SQL = "(julianday({column}) - 2451544.5)"
+
+
+def rollup_insert_sql(row):
+    """Trigger statements adding one case for a diagnosis row at every rollup resolution"""
+    return '\n'.join(f'''
+        INSERT INTO outbreak_rollup (resolution, cell_y, cell_x, day, disease_key, cases)
+        VALUES ({resolution}, {CELL_Y_SQL.format(row=row, resolution=resolution)},
+                {CELL_X_SQL.format(row=row, resolution=resolution)},
+                substr({row}.created_at, 1, 10), COALESCE({row}.disease_key, {row}.disease), 1)
+        ON CONFLICT (resolution, cell_y, cell_x, day, disease_key) DO UPDATE SET cases = cases + 1;'''
+        for resolution in ROLLUP_RESOLUTIONS)
+
+
+def rollup_delete_sql(row):
+    """Trigger statements removing one case for a diagnosis row, dropping cells that reach zero"""
+    statements = []
+    for resolution in ROLLUP_RESOLUTIONS:
+        key = f'''resolution = {resolution} AND cell_y = {CELL_Y_SQL.format(row=row, resolution=resolution)}
+            AND cell_x = {CELL_X_SQL.format(row=row, resolution=resolution)} AND day = substr({row}.created_at, 1, 10)
+            AND disease_key = COALESCE({row}.disease_key, {row}.disease)'''
+        statements.append(f'''
+        UPDATE outbreak_rollup SET cases = cases - 1 WHERE {key};
+        DELETE FROM outbreak_rollup WHERE {key} AND cases <= 0;''')
+    return '\n'.join(statements)
+
+
+# Schema migrations, applied in order and tracked with PRAGMA user_version
+MIGRATIONS = [
+    (1, [
+        'CREATE INDEX IF NOT EXISTS idx_diagnosis_user_created ON diagnosis_history (user_id, created_at)'
+    ]),
+    # History stores a disease key + advice version instead of copying the advice text into every row
+    (2, [
+        '''CREATE TABLE IF NOT EXISTS advice_versions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            disease_key TEXT NOT NULL,
+            symptoms TEXT,
+            treatment TEXT,
+            prevention TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (disease_key, symptoms, treatment, prevention)
+        )''',
+        'ALTER TABLE diagnosis_history ADD COLUMN disease_key TEXT',
+        'ALTER TABLE diagnosis_history ADD COLUMN advice_id INTEGER REFERENCES advice_versions (id)',
+        # Compact existing rows: one advice_versions row per distinct advice text
+        '''INSERT OR IGNORE INTO advice_versions (disease_key, symptoms, treatment, prevention)
+           SELECT DISTINCT lower(replace(disease, ' ', '_')), symptoms, treatment, prevention
+           FROM diagnosis_history''',
+        '''UPDATE diagnosis_history SET
+               disease_key = lower(replace(disease, ' ', '_')),
+               advice_id = (
+                   SELECT a.id FROM advice_versions a
+                   WHERE a.disease_key = lower(replace(diagnosis_history.disease, ' ', '_'))
+                     AND a.symptoms IS diagnosis_history.symptoms
+                     AND a.treatment IS diagnosis_history.treatment
+                     AND a.prevention IS diagnosis_history.prevention
+               )''',
+        '''UPDATE diagnosis_history SET symptoms = NULL, treatment = NULL, prevention = NULL
+           WHERE advice_id IS NOT NULL'''
+    ]),
+    # Memoized translations of fixed advice / chatbot text
+    (3, [
+        '''CREATE TABLE IF NOT EXISTS translations (
+            source_hash TEXT NOT NULL,
+            src TEXT NOT NULL,
+            dest TEXT NOT NULL,
+            translated TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (source_hash, src, dest)
+        )'''
+    ]),
+    # Reverse-geocoded addresses per geohash cell
+    (4, [
+        '''CREATE TABLE IF NOT EXISTS geocode_cache (
+            cell TEXT PRIMARY KEY,
+            address TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )'''
+    ]),
+    # Asynchronous diagnosis jobs; the id is derived from (user, image hash) so re-uploads share a job
+    (5, [
+        '''CREATE TABLE IF NOT EXISTS diagnosis_jobs (
+            id TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            image_hash TEXT NOT NULL,
+            image_path TEXT NOT NULL,
+            latitude TEXT,
+            longitude TEXT,
+            timestamp TEXT NOT NULL,
+            status TEXT NOT NULL,
+            result TEXT,
+            error TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )''',
+        'CREATE INDEX IF NOT EXISTS idx_diagnosis_jobs_status ON diagnosis_jobs (status)'
+    ]),
+    # Upload compaction rewrites image_path references
+    (6, [
+        'CREATE INDEX IF NOT EXISTS idx_diagnosis_image_path ON diagnosis_history (image_path)',
+        'CREATE INDEX IF NOT EXISTS idx_prediction_cache_image_path ON prediction_cache (image_path)'
+    ]),
+    # Coordinates as real columns, an R*Tree over (lat, lon, day) and disease x grid cell x day rollups.
+    # Triggers keep the index and rollups in step with every insert/delete on diagnosis_history.
+    (7, [
+        'ALTER TABLE diagnosis_history ADD COLUMN latitude REAL',
+        'ALTER TABLE diagnosis_history ADD COLUMN longitude REAL',
+        '''UPDATE diagnosis_history
+           SET latitude = CAST(NULLIF(json_extract(location_data, '$.latitude'), '') AS REAL),
+               longitude = CAST(NULLIF(json_extract(location_data, '$.longitude'), '') AS REAL)
+           WHERE json_valid(location_data)''',
+        '''UPDATE diagnosis_history SET latitude = NULL, longitude = NULL
+           WHERE latitude IS NULL OR longitude IS NULL
+              OR latitude NOT BETWEEN -90 AND 90 OR longitude NOT BETWEEN -180 AND 180
+              OR (latitude = 0 AND longitude = 0)''',
+        '''CREATE VIRTUAL TABLE IF NOT EXISTS diagnosis_location_index USING rtree(
+            id, min_lat, max_lat, min_lon, max_lon, min_day, max_day
+        )''',
+        '''CREATE TABLE IF NOT EXISTS outbreak_rollup (
+            resolution INTEGER NOT NULL,
+            cell_y INTEGER NOT NULL,
+            cell_x INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            disease_key TEXT NOT NULL,
+            cases INTEGER NOT NULL,
+            PRIMARY KEY (resolution, cell_y, cell_x, day, disease_key)
+        ) WITHOUT ROWID''',
+        f'''CREATE TRIGGER IF NOT EXISTS diagnosis_geo_insert AFTER INSERT ON diagnosis_history
+           WHEN NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL
+           BEGIN
+               INSERT INTO diagnosis_location_index VALUES (
+                   NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude,
+                   {DAY_NUMBER_SQL.format(column='NEW.created_at')}, {DAY_NUMBER_SQL.format(column='NEW.created_at')}
+               );
+               {rollup_insert_sql('NEW')}
+           END''',
+        f'''CREATE TRIGGER IF NOT EXISTS diagnosis_geo_delete AFTER DELETE ON diagnosis_history
+           WHEN OLD.latitude IS NOT NULL AND OLD.longitude IS NOT NULL
+           BEGIN
+               DELETE FROM diagnosis_location_index WHERE id = OLD.id;
+               {rollup_delete_sql('OLD')}
+           END''',
+        f'''INSERT INTO diagnosis_location_index
+           SELECT id, latitude, latitude, longitude, longitude,
+                  {DAY_NUMBER_SQL.format(column='created_at')}, {DAY_NUMBER_SQL.format(column='created_at')}
+           FROM diagnosis_history WHERE latitude IS NOT NULL''',
+        *(f'''INSERT INTO outbreak_rollup (resolution, cell_y, cell_x, day, disease_key, cases)
+           SELECT {resolution}, {CELL_Y_SQL.format(row='diagnosis_history', resolution=resolution)},
+                  {CELL_X_SQL.format(row='diagnosis_history', resolution=resolution)},
+                  substr(created_at, 1, 10), COALESCE(disease_key, disease), COUNT(*)
+           FROM diagnosis_history WHERE latitude IS NOT NULL
+           GROUP BY 2, 3, 4, 5''' for resolution in ROLLUP_RESOLUTIONS)
+    ]),
+    # Perceptual hash of each cached upload, for near-duplicate reuse (utils/near_duplicates.py)
+    (8, [
+        'ALTER TABLE prediction_cache ADD COLUMN phash INTEGER'
+    ]),
+    # History validators for ETag / Last-Modified: latest diagnosis id, plus a count of deletes and rewrites
+    (9, [
+        'ALTER TABLE users ADD COLUMN history_last_id INTEGER NOT NULL DEFAULT 0',
+        'ALTER TABLE users ADD COLUMN history_changes INTEGER NOT NULL DEFAULT 0',
+        'ALTER TABLE users ADD COLUMN history_modified_at DATETIME',
+        '''UPDATE users SET
+               history_last_id = COALESCE((SELECT MAX(id) FROM diagnosis_history WHERE user_id = users.id), 0),
+               history_modified_at = (SELECT MAX(created_at) FROM diagnosis_history WHERE user_id = users.id)''',
+        '''CREATE TRIGGER IF NOT EXISTS diagnosis_history_version_insert AFTER INSERT ON diagnosis_history
+           BEGIN
+               UPDATE users SET history_last_id = NEW.id, history_modified_at = CURRENT_TIMESTAMP
+               WHERE id = NEW.user_id;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS diagnosis_history_version_delete AFTER DELETE ON diagnosis_history
+           BEGIN
+               UPDATE users SET history_changes = history_changes + 1, history_modified_at = CURRENT_TIMESTAMP
+               WHERE id = OLD.user_id;
+           END''',
+        # Upload compaction rewrites image_path, which changes the thumbnail URL on the page
+        '''CREATE TRIGGER IF NOT EXISTS diagnosis_history_version_update AFTER UPDATE OF image_path ON diagnosis_history
+           BEGIN
+               UPDATE users SET history_changes = history_changes + 1, history_modified_at = CURRENT_TIMESTAMP
+               WHERE id = NEW.user_id;
+           END'''
+    ]),
+    # Date-range exports (utils/history_export.py) read in created_at order
+    (10, [
+        'CREATE INDEX IF NOT EXISTS idx_diagnosis_created ON diagnosis_history (created_at)'
+    ]),
+    # Delta sync (utils/history_sync.py): tombstones of deleted diagnoses and markers of rewritten ones, in one
+    # sequence a client's cursor follows; new diagnoses are found by id, which AUTOINCREMENT never reuses
+    (11, [
+        '''CREATE TABLE IF NOT EXISTS diagnosis_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            diagnosis_id INTEGER NOT NULL,
+            deleted INTEGER NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )''',
+        'CREATE INDEX IF NOT EXISTS idx_diagnosis_changes_user ON diagnosis_changes (user_id, seq)',
+        'CREATE INDEX IF NOT EXISTS idx_diagnosis_user_id ON diagnosis_history (user_id, id)',
+        '''CREATE TRIGGER IF NOT EXISTS diagnosis_changes_delete AFTER DELETE ON diagnosis_history
+           BEGIN
+               INSERT INTO diagnosis_changes (user_id, diagnosis_id, deleted) VALUES (OLD.user_id, OLD.id, 1);
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS diagnosis_changes_update AFTER UPDATE OF image_path ON diagnosis_history
+           BEGIN
+               INSERT INTO diagnosis_changes (user_id, diagnosis_id, deleted) VALUES (NEW.user_id, NEW.id, 0);
+           END'''
+    ]),
+]
+
+DIAGNOSIS_INSERT = '''
+    INSERT INTO diagnosis_history
+    (user_id, disease, disease_key, advice_id, confidence, image_path, timestamp, location_data, latitude, longitude)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# History rows joined with their advice version
+# Flat columns of a history export, which is also the import format
+EXPORT_COLUMNS = ('id', 'created_at', 'timestamp', 'user_id', 'village', 'disease', 'disease_key', 'confidence',
+                  'latitude', 'longitude', 'region', 'address', 'image_path')
+LOCATION_FIELD_SQL = "CASE WHEN json_valid(h.location_data) THEN json_extract(h.location_data, '$.{field}') END"
+DISEASE_KEY_SQL = "COALESCE(h.disease_key, lower(replace(h.disease, ' ', '_')))"
+
+EXPORT_SELECT = f'''
+    SELECT h.id, h.created_at, h.timestamp, h.user_id, u.village, h.disease, {DISEASE_KEY_SQL}, h.confidence,
+           h.latitude, h.longitude, {LOCATION_FIELD_SQL.format(field='region')},
+           {LOCATION_FIELD_SQL.format(field='address')}, h.image_path
+    FROM diagnosis_history h
+    LEFT JOIN users u ON u.id = h.user_id
+'''
+
+# Imported rows for unknown users are skipped rather than failing the chunk
+IMPORT_INSERT = '''
+    INSERT INTO diagnosis_history
+    (user_id, disease, disease_key, advice_id, confidence, image_path, timestamp, location_data, latitude, longitude,
+     created_at)
+    SELECT ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP)
+    WHERE EXISTS (SELECT 1 FROM users WHERE id = ?)
+'''
+
+HISTORY_SELECT = '''
+    SELECT h.id, h.disease, h.confidence,
+           COALESCE(h.symptoms, a.symptoms), COALESCE(h.treatment, a.treatment),
+           COALESCE(h.prevention, a.prevention),
+           h.image_path, h.timestamp, h.location_data, h.created_at
+    FROM diagnosis_history h
+    LEFT JOIN advice_versions a ON a.id = h.advice_id
+'''
+
+# Sync rows reference their advice version instead of repeating its text; only legacy rows carry it inline
+SYNC_SELECT = '''
+    SELECT id, disease, confidence, advice_id, symptoms, treatment, prevention,
+           image_path, timestamp, location_data, created_at
+    FROM diagnosis_history
+'''
+SYNC_COLUMNS = ('id', 'disease', 'confidence', 'advice_id', 'symptoms', 'treatment', 'prevention',
+                'image_path', 'timestamp', 'location', 'created_at')
+
+
+def disease_key(disease_name):
+    """'Bacterial Leaf Blight' -> 'bacterial_leaf_blight'"""
+    return disease_name.strip().lower().replace(' ', '_')
+
+
+def encode_cursor(created_at, row_id):
+    """Opaque keyset cursor for the (created_at, id) position of the last row on a page"""
+    raw = json.dumps([created_at, row_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; returns None for a missing or malformed cursor"""
+    if not cursor:
+        return None
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return str(created_at), int(row_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def location_coordinates(location):
+    """(latitude, longitude) floats from a location dict, or (None, None) when missing or out of range"""
+    try:
+        latitude = float(location.get('latitude'))
+        longitude = float(location.get('longitude'))
+    except (AttributeError, TypeError, ValueError):
+        return None, None
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180) or (latitude == 0 and longitude == 0):
+        return None, None
+    return latitude, longitude
+
+
+def history_row_to_dict(row):
+    return {
+        'id': row[0],
+        'disease': row[1],
+        'confidence': row[2],
+        'symptoms': row[3],
+        'treatment': row[4],
+        'prevention': row[5],
+        'image_path': row[6],
+        'timestamp': row[7],
+        'location': json.loads(row[8]) if row[8] else {},
+        'created_at': row[9]
+    }
+
+
+def sync_row_to_dict(row):
+    item = {name: value for name, value in zip(SYNC_COLUMNS, row) if value is not None}
+    item['location'] = json.loads(row[9]) if row[9] else {}
+    return item
+
+
+JOB_COLUMNS = ('id', 'user_id', 'image_hash', 'image_path', 'latitude', 'longitude',
+               'timestamp', 'status', 'result', 'error', 'created_at', 'updated_at')
+
+
+def job_row_to_dict(row):
+    job = dict(zip(JOB_COLUMNS, row))
+    job['result'] = json.loads(job['result']) if job['result'] else None
+    return job
+
 
 class Database:
-    def __init__(self, db_path='scdas.db'):
+    def __init__(self, db_path='scdas.db', pool_size=8, busy_timeout_ms=5000, pooled=True):
         self.db_path = db_path
+        self.pool_size = pool_size
+        self.busy_timeout_ms = busy_timeout_ms
+        self.pooled = pooled
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self._created = 0
+        self._pool_lock = threading.Lock()
+        self._advice_ids = {}
         self.create_tables()
-    
+        self.migrate()
+
+    def _open(self):
+        """Open a connection with WAL journaling and tuned pragmas"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout_ms / 1000,
+            check_same_thread=False,
+            cached_statements=256  # Prepared statements are reused per connection
+        )
+        conn.execute('PRAGMA journal_mode=WAL')  # Readers no longer block the writer
+        conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout_ms)}')
+        conn.execute('PRAGMA synchronous=NORMAL')  # Safe with WAL, avoids an fsync per commit
+        conn.execute('PRAGMA cache_size=-16000')  # 16MB page cache
+        conn.execute('PRAGMA temp_store=MEMORY')
+        return conn
+
+    def _acquire(self):
+        if not self.pooled:
+            return self._open()
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+        with self._pool_lock:
+            if self._created < self.pool_size:
+                self._created += 1
+                return self._open()
+        return self._pool.get()
+
+    def _release(self, conn):
+        if not self.pooled:
+            conn.close()
+            return
+        self._pool.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a pooled connection; commits on success and rolls back on error"""
+        started = time.perf_counter()
+        conn = self._acquire()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            self._advice_ids.clear()  # May hold ids inserted by the rolled-back transaction
+            raise
+        finally:
+            self._release(conn)
+            metrics.observe_stage('db', time.perf_counter() - started)
+
+    def close(self):
+        """Close every idle pooled connection"""
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._pool_lock:
+            self._created = 0
+
     def create_tables(self):
         """Create users and diagnosis_history tables"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Users table with phone number as primary identifier
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                phone TEXT UNIQUE NOT NULL,
-                pin TEXT NOT NULL,
-                full_name TEXT NOT NULL,
-                village TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Diagnosis history table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS diagnosis_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                disease TEXT NOT NULL,
-                confidence REAL NOT NULL,
-                symptoms TEXT,
-                treatment TEXT,
-                prevention TEXT,
-                image_path TEXT NOT NULL,
-                timestamp TEXT NOT NULL,
-                location_data TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
-    
+        with self.connection() as conn:
+            cursor = conn.cursor()
+
+            # Users table with phone number as primary identifier
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS users (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    phone TEXT UNIQUE NOT NULL,
+                    pin TEXT NOT NULL,
+                    full_name TEXT NOT NULL,
+                    village TEXT,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+
+            # Diagnosis history table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS diagnosis_history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL,
+                    disease TEXT NOT NULL,
+                    confidence REAL NOT NULL,
+                    symptoms TEXT,
+                    treatment TEXT,
+                    prevention TEXT,
+                    image_path TEXT NOT NULL,
+                    timestamp TEXT NOT NULL,
+                    location_data TEXT,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (user_id) REFERENCES users (id)
+                )
+            ''')
+
+            # Prediction cache keyed by image content hash and model version
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS prediction_cache (
+                    image_hash TEXT NOT NULL,
+                    model_version TEXT NOT NULL,
+                    image_path TEXT NOT NULL,
+                    result_data TEXT NOT NULL,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (image_hash, model_version)
+                )
+            ''')
+
+    def migrate(self):
+        """Apply pending schema migrations, each in its own transaction under the write lock"""
+        conn = self._open()
+        conn.isolation_level = None  # Explicit transactions: DDL must not autocommit on its own
+        try:
+            for version, statements in MIGRATIONS:
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    # Re-read under the lock: another process may have applied it while we waited
+                    if conn.execute('PRAGMA user_version').fetchone()[0] >= version:
+                        conn.execute('ROLLBACK')
+                        continue
+                    for statement in statements:
+                        conn.execute(statement)
+                    conn.execute(f'PRAGMA user_version={version}')
+                    conn.execute('COMMIT')
+                except Exception:
+                    conn.execute('ROLLBACK')
+                    raise
+                print(f"🗄️ Applied database migration {version}")
+        finally:
+            conn.close()
+
     def create_user(self, phone, pin, full_name, village=None):
         """Register a new user with phone number"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
         try:
-            cursor.execute('''
-                INSERT INTO users (phone, pin, full_name, village)
-                VALUES (?, ?, ?, ?)
-            ''', (phone, pin, full_name, village))
-            conn.commit()
-            user_id = cursor.lastrowid
-            conn.close()
-            return user_id
+            with self.connection() as conn:
+                cursor = conn.execute('''
+                    INSERT INTO users (phone, pin, full_name, village)
+                    VALUES (?, ?, ?, ?)
+                ''', (phone, pin, full_name, village))
+                return cursor.lastrowid
         except sqlite3.IntegrityError:
-            conn.close()
             return None  # Phone number already exists
-    
+
     def verify_user(self, phone, pin):
         """Verify user login with phone and PIN"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('SELECT id FROM users WHERE phone = ? AND pin = ?', (phone, pin))
-        user = cursor.fetchone()
-        conn.close()
-        
+        with self.connection() as conn:
+            user = conn.execute('SELECT id FROM users WHERE phone = ? AND pin = ?', (phone, pin)).fetchone()
+
         if user:
             return user[0]  # Return user_id
         return None
-    
+
     def get_user_info(self, user_id):
         """Get user information"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('SELECT id, phone, full_name, village FROM users WHERE id = ?', (user_id,))
-        user = cursor.fetchone()
-        conn.close()
-        
+        with self.connection() as conn:
+            user = conn.execute('SELECT id, phone, full_name, village FROM users WHERE id = ?', (user_id,)).fetchone()
+
         if user:
             return {
                 'id': user[0],
@@ -90,71 +518,429 @@ class Database:
                 'village': user[3]
             }
         return None
-    
-    def add_diagnosis(self, user_id, result):
-        """Add diagnosis to user's history"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO diagnosis_history 
-            (user_id, disease, confidence, symptoms, treatment, prevention, image_path, timestamp, location_data)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
+
+    def get_history_version(self, user_id):
+        """(latest diagnosis id, deletes + rewrites, last change time) of a user's history"""
+        with self.connection() as conn:
+            row = conn.execute('''
+                SELECT history_last_id, history_changes, history_modified_at FROM users WHERE id = ?
+            ''', (user_id,)).fetchone()
+        return tuple(row) if row else (0, 0, None)
+
+    def _advice_id(self, conn, result):
+        """Id of the advice_versions row holding this result's advice text, created on first use"""
+        key = disease_key(result.get('disease_key') or result['disease'])
+        content = (key, result['symptoms'], result['treatment'], result['prevention'])
+        advice_id = self._advice_ids.get(content)
+        if advice_id is None:
+            conn.execute('''
+                INSERT OR IGNORE INTO advice_versions (disease_key, symptoms, treatment, prevention)
+                VALUES (?, ?, ?, ?)
+            ''', content)
+            advice_id = conn.execute('''
+                SELECT id FROM advice_versions
+                WHERE disease_key = ? AND symptoms IS ? AND treatment IS ? AND prevention IS ?
+            ''', content).fetchone()[0]
+            self._advice_ids[content] = advice_id
+        return key, advice_id
+
+    def _diagnosis_row(self, conn, user_id, result):
+        key, advice_id = self._advice_id(conn, result)
+        latitude, longitude = location_coordinates(result['location'])
+        return (
             user_id,
             result['disease'],
+            key,
+            advice_id,
             result['confidence'],
-            result['symptoms'],
-            result['treatment'],
-            result['prevention'],
             result['image_path'],
             result['timestamp'],
-            json.dumps(result['location'])
-        ))
-        conn.commit()
-        conn.close()
-    
+            json.dumps(result['location']),
+            latitude,
+            longitude
+        )
+
+    def add_diagnosis(self, user_id, result):
+        """Add diagnosis to user's history (the geo triggers update the location index and outbreak rollups)"""
+        with self.connection() as conn:
+            conn.execute(DIAGNOSIS_INSERT, self._diagnosis_row(conn, user_id, result))
+
+    def add_diagnoses(self, user_id, results):
+        """Add many diagnoses to user's history in a single transaction"""
+        with self.connection() as conn:
+            conn.executemany(DIAGNOSIS_INSERT, [self._diagnosis_row(conn, user_id, result) for result in results])
+        return len(results)
+
     def get_user_history(self, user_id):
         """Get diagnosis history for specific user"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT id, disease, confidence, symptoms, treatment, prevention, 
-                   image_path, timestamp, location_data, created_at
-            FROM diagnosis_history
-            WHERE user_id = ?
-            ORDER BY created_at DESC
-        ''', (user_id,))
-        rows = cursor.fetchall()
-        conn.close()
-        
-        history = []
-        for row in rows:
-            history.append({
-                'id': row[0],
-                'disease': row[1],
-                'confidence': row[2],
-                'symptoms': row[3],
-                'treatment': row[4],
-                'prevention': row[5],
-                'image_path': row[6],
-                'timestamp': row[7],
-                'location': json.loads(row[8]) if row[8] else {},
-                'created_at': row[9]
-            })
-        return history
-    
+        with self.connection() as conn:
+            rows = conn.execute(HISTORY_SELECT + '''
+                WHERE h.user_id = ?
+                ORDER BY h.created_at DESC, h.id DESC
+            ''', (user_id,)).fetchall()
+
+        return [history_row_to_dict(row) for row in rows]
+
+    def get_user_history_page(self, user_id, cursor=None, limit=20):
+        """One page of a user's history, newest first, using a (created_at, id) keyset cursor"""
+        position = decode_cursor(cursor)
+        with self.connection() as conn:
+            if position is None:
+                rows = conn.execute(HISTORY_SELECT + '''
+                    WHERE h.user_id = ?
+                    ORDER BY h.created_at DESC, h.id DESC
+                    LIMIT ?
+                ''', (user_id, limit + 1)).fetchall()
+            else:
+                created_at, row_id = position
+                rows = conn.execute(HISTORY_SELECT + '''
+                    WHERE h.user_id = ?
+                      AND (h.created_at < ? OR (h.created_at = ? AND h.id < ?))
+                    ORDER BY h.created_at DESC, h.id DESC
+                    LIMIT ?
+                ''', (user_id, created_at, created_at, row_id, limit + 1)).fetchall()
+
+        items = [history_row_to_dict(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = items[-1]
+            next_cursor = encode_cursor(last['created_at'], last['id'])
+        return {'items': items, 'next_cursor': next_cursor}
+
+    def touch_history(self, user_id):
+        """Change a user's history validators when the page changes without a row changing (a new thumbnail)"""
+        with self.connection() as conn:
+            conn.execute('''
+                UPDATE users SET history_changes = history_changes + 1, history_modified_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (user_id,))
+
     def clear_user_history(self, user_id):
         """Clear all history for user"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM diagnosis_history WHERE user_id = ?', (user_id,))
-        conn.commit()
-        conn.close()
-    
+        with self.connection() as conn:
+            conn.execute('DELETE FROM diagnosis_history WHERE user_id = ?', (user_id,))
+
     def delete_diagnosis(self, diagnosis_id, user_id):
         """Delete specific diagnosis"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM diagnosis_history WHERE id = ? AND user_id = ?', (diagnosis_id, user_id))
-        conn.commit()
-        conn.close()
+        with self.connection() as conn:
+            conn.execute('DELETE FROM diagnosis_history WHERE id = ? AND user_id = ?', (diagnosis_id, user_id))
+
+    def get_history_changes(self, user_id, last_id=0, change_seq=None, limit=200):
+        """Diagnoses added after last_id, and deletions / rewrites of the ones up to it after change_seq,
+        at most limit of them; change_seq None starts from the user's latest change (a full download)"""
+        with self.connection() as conn:
+            if change_seq is None:
+                change_seq = conn.execute(
+                    'SELECT COALESCE(MAX(seq), 0) FROM diagnosis_changes WHERE user_id = ?', (user_id,)
+                ).fetchone()[0]
+            changes = conn.execute('''
+                SELECT seq, diagnosis_id, deleted FROM diagnosis_changes
+                WHERE user_id = ? AND seq > ?
+                ORDER BY seq
+                LIMIT ?
+            ''', (user_id, change_seq, limit + 1)).fetchall()
+            has_more = len(changes) > limit
+            changes = changes[:limit]
+            if changes:
+                change_seq = changes[-1][0]
+            # Rows the client never received (id > last_id) arrive below in their current state, if at all
+            deleted = sorted({row_id for _, row_id, was_deleted in changes if was_deleted and row_id <= last_id})
+            rewritten = {row_id for _, row_id, was_deleted in changes if not was_deleted and row_id <= last_id}
+            rewritten -= set(deleted)
+
+            rows = []
+            if rewritten:
+                placeholders = ','.join('?' * len(rewritten))
+                rows = conn.execute(SYNC_SELECT + f'WHERE user_id = ? AND id IN ({placeholders}) ORDER BY id',
+                                    (user_id, *sorted(rewritten))).fetchall()
+            if not has_more:
+                remaining = limit - len(changes)
+                added = conn.execute(SYNC_SELECT + 'WHERE user_id = ? AND id > ? ORDER BY id LIMIT ?',
+                                     (user_id, last_id, remaining + 1)).fetchall()
+                has_more = len(added) > remaining
+                added = added[:remaining]
+                if added:
+                    last_id = added[-1][0]
+                rows += added
+
+            advice_ids = sorted({row[3] for row in rows if row[3] is not None})
+            advice = {}
+            if advice_ids:
+                placeholders = ','.join('?' * len(advice_ids))
+                for advice_id, symptoms, treatment, prevention in conn.execute(f'''
+                    SELECT id, symptoms, treatment, prevention FROM advice_versions WHERE id IN ({placeholders})
+                ''', advice_ids):
+                    advice[advice_id] = {'symptoms': symptoms, 'treatment': treatment, 'prevention': prevention}
+
+        return {
+            'upserts': [sync_row_to_dict(row) for row in rows],
+            'deleted': deleted,
+            'advice': advice,
+            'last_id': last_id,
+            'change_seq': change_seq,
+            'has_more': has_more
+        }
+
+    def prune_diagnosis_changes(self, older_than_days):
+        """Drop tombstones and rewrite markers older than the given age; returns how many"""
+        with self.connection() as conn:
+            return conn.execute("DELETE FROM diagnosis_changes WHERE created_at < datetime('now', ?)",
+                                (f'-{older_than_days} days',)).rowcount
+
+    def iter_history_export(self, since=None, until=None, region=None, disease=None, chunk_size=5000):
+        """Yield lists of up to chunk_size EXPORT_COLUMNS rows, oldest first, one keyset query per chunk;
+        since / until bound created_at (until exclusive), region matches part of the region name"""
+        clauses, params = [], []
+        if since:
+            clauses.append('h.created_at >= ?')
+            params.append(since)
+        if until:
+            clauses.append('h.created_at < ?')
+            params.append(until)
+        if region:
+            clauses.append(f"{LOCATION_FIELD_SQL.format(field='region')} LIKE ?")
+            params.append(f'%{region}%')
+        if disease:
+            clauses.append(f'{DISEASE_KEY_SQL} = ?')
+            params.append(disease_key(disease))
+        # Each chunk holds a pooled connection only while it is read, not while a slow client downloads it.
+        # created_at order comes straight off idx_diagnosis_created, so nothing is sorted or buffered.
+        query = EXPORT_SELECT + ' WHERE ' + ' AND '.join(clauses + ['(h.created_at, h.id) > (?, ?)'])
+        query += ' ORDER BY h.created_at, h.id LIMIT ?'
+        last = ('', 0)
+        while True:
+            with self.connection() as conn:
+                rows = conn.execute(query, [*params, *last, chunk_size]).fetchall()
+            if not rows:
+                break
+            yield rows
+            if len(rows) < chunk_size:
+                break
+            last = (rows[-1][1], rows[-1][0])
+
+    def import_diagnoses(self, records, disease_info=None):
+        """Insert export-shaped dicts (see EXPORT_COLUMNS) in one transaction with the current advice for each disease;
+        returns how many were inserted. A disease with no advice yet gets it from disease_info
+        ({disease_key: {'symptoms', 'treatment', 'prevention'}}); rows of unknown users or diseases are skipped."""
+        disease_info = disease_info or {}
+        advice_ids = {}
+        with self.connection() as conn:
+            params = []
+            for record in records:
+                key = disease_key(record.get('disease_key') or record['disease'])
+                if key not in advice_ids:
+                    advice_ids[key] = conn.execute(
+                        'SELECT MAX(id) FROM advice_versions WHERE disease_key = ?', (key,)
+                    ).fetchone()[0]
+                    if advice_ids[key] is None and key in disease_info:
+                        info = disease_info[key]
+                        advice_ids[key] = self._advice_id(conn, {
+                            'disease_key': key, 'disease': record['disease'], 'symptoms': info.get('symptoms'),
+                            'treatment': info.get('treatment'), 'prevention': info.get('prevention')
+                        })[1]
+                if advice_ids[key] is None:
+                    continue
+                latitude, longitude = location_coordinates(record)
+                location = {field: record[field] for field in ('latitude', 'longitude', 'region', 'address')
+                            if record.get(field) not in (None, '')}
+                params.append((
+                    record['user_id'], record['disease'], key, advice_ids[key], record['confidence'],
+                    record.get('image_path') or '', record.get('timestamp') or record.get('created_at') or '',
+                    json.dumps(location), latitude, longitude, record.get('created_at'), record['user_id']
+                ))
+            return conn.executemany(IMPORT_INSERT, params).rowcount
+
+    def outbreak_heatmap(self, min_lat, max_lat, min_lon, max_lon, since_day, until_day, disease=None,
+                         resolution=ROLLUP_RESOLUTIONS[0]):
+        """Case counts per grid cell and disease in a bounding box and day range, read from the rollups"""
+        # The 1e-9 nudge keeps a bound lying exactly on a cell edge from rounding into the cell below
+        rows_y = range(int((min_lat + 90) * resolution + 1e-9), int((max_lat + 90) * resolution + 1e-9) + 1)
+        cols_x = range(int((min_lon + 180) * resolution + 1e-9), int((max_lon + 180) * resolution + 1e-9) + 1)
+        # IN lists rather than BETWEEN, so the primary key seeks straight to each cell's day range
+        query = f'''
+            SELECT cell_y, cell_x, disease_key, SUM(cases) FROM outbreak_rollup
+            WHERE resolution = ? AND cell_y IN ({','.join('?' * len(rows_y))})
+              AND cell_x IN ({','.join('?' * len(cols_x))}) AND day BETWEEN ? AND ?
+        '''
+        params = [resolution, *rows_y, *cols_x, since_day, until_day]
+        if disease:
+            query += ' AND disease_key = ?'
+            params.append(disease)
+        query += ' GROUP BY cell_y, cell_x, disease_key'
+        with self.connection() as conn:
+            rows = conn.execute(query, params).fetchall()
+        return [{
+            'lat': round((cell_y + 0.5) / resolution - 90, 6),
+            'lon': round((cell_x + 0.5) / resolution - 180, 6),
+            'disease': disease_key,
+            'cases': cases
+        } for cell_y, cell_x, disease_key, cases in rows]
+
+    def cases_in_box(self, min_lat, max_lat, min_lon, max_lon, since, until=None, disease=None):
+        """(id, latitude, longitude, disease_key) of diagnoses in a box and created_at window, via the R*Tree"""
+        query = f'''
+            SELECT h.id, h.latitude, h.longitude, COALESCE(h.disease_key, h.disease)
+            FROM diagnosis_location_index i JOIN diagnosis_history h ON h.id = i.id
+            WHERE i.max_lat >= ? AND i.min_lat <= ? AND i.max_lon >= ? AND i.min_lon <= ?
+              AND i.max_day >= {DAY_NUMBER_SQL.format(column='?')} AND i.min_day <= {DAY_NUMBER_SQL.format(column='?')}
+              AND h.latitude BETWEEN ? AND ? AND h.longitude BETWEEN ? AND ?
+              AND h.created_at BETWEEN ? AND ?
+        '''
+        until = until or '9999-12-31 23:59:59'
+        # The R*Tree stores 32-bit floats rounded outwards, so the exact columns make the final cut
+        box = [min_lat, max_lat, min_lon, max_lon]
+        params = box + [since, until] + box + [since, until]
+        if disease:
+            query += ' AND COALESCE(h.disease_key, h.disease) = ?'
+            params.append(disease)
+        with self.connection() as conn:
+            return conn.execute(query, params).fetchall()
+
+    def get_cached_prediction(self, image_hash, model_version):
+        """Look up a stored prediction for an image hash"""
+        with self.connection() as conn:
+            row = conn.execute('''
+                SELECT image_path, result_data FROM prediction_cache
+                WHERE image_hash = ? AND model_version = ?
+            ''', (image_hash, model_version)).fetchone()
+
+        if row:
+            return {'image_path': row[0], 'prediction': json.loads(row[1])}
+        return None
+
+    def save_cached_prediction(self, image_hash, model_version, image_path, prediction, phash=None):
+        """Store a prediction for an image hash"""
+        with self.connection() as conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO prediction_cache (image_hash, model_version, image_path, result_data, phash)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (image_hash, model_version, image_path, json.dumps(prediction),
+                  to_signed(phash) if phash is not None else None))
+
+    def get_perceptual_hashes(self, model_version, after_rowid=0, limit=100000):
+        """(rowid, image_hash, phash) of the newest cached predictions stored after after_rowid, oldest first"""
+        with self.connection() as conn:
+            rows = conn.execute('''
+                SELECT rowid, image_hash, phash FROM prediction_cache
+                WHERE model_version = ? AND phash IS NOT NULL AND rowid > ?
+                ORDER BY rowid DESC LIMIT ?
+            ''', (model_version, after_rowid, limit)).fetchall()
+        return [(rowid, image_hash, to_unsigned(phash)) for rowid, image_hash, phash in reversed(rows)]
+
+    def delete_cached_prediction(self, image_hash, model_version):
+        """Drop a cached prediction whose stored file has gone missing"""
+        with self.connection() as conn:
+            conn.execute('''
+                DELETE FROM prediction_cache WHERE image_hash = ? AND model_version = ?
+            ''', (image_hash, model_version))
+
+    def get_translation(self, source_hash, src, dest):
+        """Look up a memoized translation"""
+        with self.connection() as conn:
+            row = conn.execute('''
+                SELECT translated FROM translations WHERE source_hash = ? AND src = ? AND dest = ?
+            ''', (source_hash, src, dest)).fetchone()
+        return row[0] if row else None
+
+    def save_translation(self, source_hash, src, dest, translated):
+        """Memoize a translation"""
+        with self.connection() as conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO translations (source_hash, src, dest, translated)
+                VALUES (?, ?, ?, ?)
+            ''', (source_hash, src, dest, translated))
+
+    def get_geocode(self, cell):
+        """Cached (address, created_at) for a geohash cell"""
+        with self.connection() as conn:
+            row = conn.execute('''
+                SELECT address, created_at FROM geocode_cache WHERE cell = ?
+            ''', (cell,)).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def save_geocode(self, cell, address, created_at):
+        """Cache the address of a geohash cell"""
+        with self.connection() as conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO geocode_cache (cell, address, created_at)
+                VALUES (?, ?, ?)
+            ''', (cell, address, created_at))
+
+    def replace_image_path(self, old_path, new_path):
+        """Point every reference to a moved upload at its new location; returns the history rows changed"""
+        # Rows written on Windows store the path with backslashes
+        variants = (old_path, old_path.replace('/', '\\'))
+        with self.connection() as conn:
+            cursor = conn.execute(
+                'UPDATE diagnosis_history SET image_path = ? WHERE image_path IN (?, ?)', (new_path, *variants)
+            )
+            conn.execute('UPDATE prediction_cache SET image_path = ? WHERE image_path IN (?, ?)', (new_path, *variants))
+            conn.execute('UPDATE diagnosis_jobs SET image_path = ? WHERE image_path IN (?, ?)', (new_path, *variants))
+            # Finished jobs also carry the path inside their stored result, served by /jobs/<id>/result
+            conn.execute('''
+                UPDATE diagnosis_jobs SET result = json_set(result, '$.image_path', ?)
+                WHERE result IS NOT NULL AND json_extract(result, '$.image_path') IN (?, ?)
+            ''', (new_path, *variants))
+        return cursor.rowcount
+
+    def create_job(self, job_id, user_id, image_hash, image_path, latitude, longitude, timestamp):
+        """Insert a queued job; returns False if a job with this id already exists"""
+        with self.connection() as conn:
+            cursor = conn.execute('''
+                INSERT OR IGNORE INTO diagnosis_jobs
+                    (id, user_id, image_hash, image_path, latitude, longitude, timestamp, status)
+                VALUES (?, ?, ?, ?, ?, ?, ?, 'queued')
+            ''', (job_id, user_id, image_hash, image_path, latitude, longitude, timestamp))
+        return cursor.rowcount == 1
+
+    def retry_failed_job(self, job_id, image_path, latitude, longitude, timestamp):
+        """Re-queue a failed job with a fresh upload; returns False if it isn't failed"""
+        with self.connection() as conn:
+            cursor = conn.execute('''
+                UPDATE diagnosis_jobs
+                SET status = 'queued', image_path = ?, latitude = ?, longitude = ?, timestamp = ?,
+                    result = NULL, error = NULL, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND status = 'failed'
+            ''', (image_path, latitude, longitude, timestamp, job_id))
+        return cursor.rowcount == 1
+
+    def get_job(self, job_id):
+        with self.connection() as conn:
+            row = conn.execute(
+                f"SELECT {', '.join(JOB_COLUMNS)} FROM diagnosis_jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return job_row_to_dict(row) if row else None
+
+    def update_job(self, job_id, status, result=None, error=None):
+        with self.connection() as conn:
+            conn.execute('''
+                UPDATE diagnosis_jobs SET status = ?, result = ?, error = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (status, json.dumps(result) if result is not None else None, error, job_id))
+
+    def claim_job(self, job_id):
+        """Mark a queued job running; False if another worker already took it"""
+        with self.connection() as conn:
+            cursor = conn.execute('''
+                UPDATE diagnosis_jobs SET status = 'running', updated_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND status = 'queued'
+            ''', (job_id,))
+        return cursor.rowcount == 1
+
+    def requeue_running_jobs(self):
+        """Put jobs left 'running' by a stopped server back in the queue"""
+        with self.connection() as conn:
+            cursor = conn.execute('''
+                UPDATE diagnosis_jobs SET status = 'queued', updated_at = CURRENT_TIMESTAMP
+                WHERE status = 'running'
+            ''')
+        return cursor.rowcount
+
+    def get_queued_jobs(self):
+        """Jobs waiting for a worker, oldest first"""
+        with self.connection() as conn:
+            rows = conn.execute(
+                f"SELECT {', '.join(JOB_COLUMNS)} FROM diagnosis_jobs "
+                "WHERE status = 'queued' ORDER BY created_at"
+            ).fetchall()
+        return [job_row_to_dict(row) for row in rows]
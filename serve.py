@@ -0,0 +1,155 @@
+"""Production server: gunicorn workers forked from a master that has already loaded the model.
+
+    python serve.py                                   # one worker per core, settings from Config.SERVING_*
+    python serve.py --workers 4 --threads 8 --bind 0.0.0.0:8000
+
+SIGTERM (systemd, docker stop, kill) stops accepting connections and gives in-flight diagnoses up to
+SERVING_GRACEFUL_TIMEOUT seconds to finish. Workers are recycled after SERVING_MAX_REQUESTS requests.
+`python app.py` remains the single-process development server.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from gunicorn.app.base import BaseApplication
+from gunicorn.workers.gthread import ThreadWorker
+
+from config import Config
+
+
+def thread_counts(workers, intra_op=None, inter_op=None):
+    """TensorFlow threads per worker, so that workers x threads does not oversubscribe the cores"""
+    cores = os.cpu_count() or 1
+    return intra_op or max(1, cores // workers), inter_op or 1
+
+
+def preload_model(intra_op, inter_op):
+    """Load the model in the master before forking, so all workers share its weights copy-on-write"""
+    from utils.inference_backends import configure_tensorflow_threads, preload_backend
+
+    backend = Config.INFERENCE_BACKEND
+    model_path = Config.BACKEND_MODEL_PATHS[backend]
+    num_threads = Config.INFERENCE_THREADS or intra_op
+    # TensorFlow / XNNPACK thread pools don't survive fork(); single-threaded inference runs on the
+    # calling thread, so only then is a model loaded before the fork usable in the workers
+    if num_threads != 1:
+        print(f"⚠️ {num_threads} inference threads per worker: each worker loads its own model")
+        return False
+    if not os.path.exists(model_path):
+        print(f"⚠️ Model not found at {model_path}, nothing to preload")
+        return False
+
+    started = time.perf_counter()
+    if backend == 'keras':
+        configure_tensorflow_threads(intra_op, inter_op)
+    preload_backend(model_path, backend, num_threads=num_threads)
+    print(f"✅ Model preloaded in the master in {(time.perf_counter() - started) * 1000:.0f} ms")
+    return True
+
+
+def start_compaction_runner(interval_hours):
+    """Upload compaction once for the whole server, as a subprocess of the master, instead of in every worker"""
+    def run():
+        while True:
+            subprocess.run([sys.executable, '-m', 'utils.upload_storage', 'compact'])
+            time.sleep(interval_hours * 3600)
+
+    thread = threading.Thread(target=run, name='upload-compaction', daemon=True)
+    thread.start()
+    return thread
+
+
+class RecyclingThreadWorker(ThreadWorker):
+    """gthread worker that stops accepting as soon as it decides to exit (max_requests or SIGTERM)"""
+
+    def accept(self, server, listener):
+        # gthread drops connections it accepted but had not started reading when its loop ends;
+        # left in the listen backlog they go to another worker or the replacement instead
+        if self.alive:
+            super().accept(server, listener)
+
+
+class SCDASServer(BaseApplication):
+    """gunicorn application with the SCDAS startup and shutdown hooks"""
+
+    def __init__(self, workers, threads, bind, max_requests, intra_op=None, inter_op=None):
+        self.workers = workers
+        self.threads = threads
+        self.bind = bind
+        self.max_requests = max_requests
+        self.intra_op, self.inter_op = thread_counts(workers, intra_op, inter_op)
+        self.preloaded = False
+        super().__init__()
+
+    def load_config(self):
+        settings = {
+            'bind': self.bind,
+            'workers': self.workers,
+            'worker_class': RecyclingThreadWorker,
+            'threads': self.threads,
+            'max_requests': self.max_requests,
+            'max_requests_jitter': min(Config.SERVING_MAX_REQUESTS_JITTER, self.max_requests // 10),
+            'graceful_timeout': Config.SERVING_GRACEFUL_TIMEOUT,
+            'timeout': Config.SERVING_TIMEOUT,
+            # A recycled worker drops idle keep-alive connections, and a client's next request on one fails;
+            # closing after each response costs little next to an image upload
+            'keepalive': 0,
+            'on_starting': self.on_starting,
+            'post_fork': self.post_fork,
+            'worker_exit': self.worker_exit
+        }
+        for key, value in settings.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from app import app
+        return app
+
+    def on_starting(self, server):
+        """Master, before any worker exists: one-off startup work, then the model"""
+        from ml_models import Database
+
+        db = Database(Config.DATABASE_PATH)
+        requeued = db.requeue_running_jobs()
+        db.close()  # SQLite connections must not be inherited across fork()
+        if requeued:
+            print(f"♻️ Re-queued {requeued} diagnosis jobs interrupted by the last shutdown")
+        # Workers inherit this Config: a 'running' job now belongs to a live worker
+        Config.JOB_RECOVER_RUNNING = False
+
+        if Config.UPLOAD_COMPACTION_INTERVAL_HOURS:
+            start_compaction_runner(Config.UPLOAD_COMPACTION_INTERVAL_HOURS)
+            Config.UPLOAD_COMPACTION_INTERVAL_HOURS = 0
+
+        Config.INFERENCE_THREADS = Config.INFERENCE_THREADS or self.intra_op
+        self.preloaded = preload_model(self.intra_op, self.inter_op)
+        print(f"🚀 {self.workers} workers x {self.threads} threads, "
+              f"TensorFlow {self.intra_op} intra-op / {self.inter_op} inter-op threads each")
+
+    def post_fork(self, server, worker):
+        if not self.preloaded and Config.INFERENCE_BACKEND == 'keras':
+            from utils.inference_backends import configure_tensorflow_threads
+            configure_tensorflow_threads(self.intra_op, self.inter_op)
+
+    def worker_exit(self, server, worker):
+        """Requests have drained by now; wait for history writes and running jobs as well"""
+        app_module = sys.modules.get('app')
+        if app_module is not None:
+            app_module.drain_background_work()
+            print(f"👋 Worker {worker.pid} drained and exiting")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run SCDAS with pre-forked gunicorn workers')
+    parser.add_argument('--bind', default=Config.SERVING_BIND)
+    parser.add_argument('--workers', type=int, default=Config.SERVING_WORKERS or os.cpu_count() or 1)
+    parser.add_argument('--threads', type=int, default=Config.SERVING_THREADS)
+    parser.add_argument('--max-requests', type=int, default=Config.SERVING_MAX_REQUESTS)
+    parser.add_argument('--intra-op-threads', type=int, default=Config.SERVING_INTRA_OP_THREADS)
+    args = parser.parse_args()
+
+    SCDASServer(args.workers, args.threads, args.bind, args.max_requests,
+                intra_op=args.intra_op_threads, inter_op=Config.SERVING_INTER_OP_THREADS).run()
@@ -1,99 +1,265 @@
+(function() {
 // Mobile-optimized file input handling
 const fileInput = document.getElementById('fileInput');
 const fileLabel = document.getElementById('fileLabel');
 const submitBtn = document.getElementById('submitBtn');
 const imagePreview = document.getElementById('imagePreview');
 const locationStatus = document.getElementById('locationStatus');
+const uploadForm = document.getElementById('uploadForm');
+const uploadMaxEdge = uploadForm ? parseInt(uploadForm.dataset.maxEdge || '0', 10) : 0;
+const uploadQuality = uploadForm ? parseFloat(uploadForm.dataset.jpegQuality || '0.85') : 0.85;
+let pendingUpload = null;  // Promise of the (possibly downscaled) file to send
 
-// Ensure file input triggers on mobile devices
-fileLabel.addEventListener('click', function(e) {
-    // For mobile devices, explicitly trigger the file input
-    if ('ontouchstart' in window) {
+// Only on pages with the label-based file picker; other pages bind their own handlers
+if (fileLabel) {
+    // Ensure file input triggers on mobile devices
+    fileLabel.addEventListener('click', function(e) {
+        // For mobile devices, explicitly trigger the file input
+        if ('ontouchstart' in window) {
+            e.preventDefault();
+            fileInput.click();
+        }
+    });
+
+    // Also handle touch events
+    fileLabel.addEventListener('touchend', function(e) {
         e.preventDefault();
         fileInput.click();
-    }
-});
-
-// Also handle touch events
-fileLabel.addEventListener('touchend', function(e) {
-    e.preventDefault();
-    fileInput.click();
-});
+    });
 
-// Image preview and button enable
-fileInput.addEventListener('change', function(e) {
-    const file = e.target.files[0];
-    if (file) {
-        // Enable submit button
-        submitBtn.disabled = false;
+    // Image preview and button enable
+    fileInput.addEventListener('change', function(e) {
+        const file = e.target.files[0];
+        if (file) {
+            // Enable submit button
+            submitBtn.disabled = false;
         
-        // Show preview
-        const reader = new FileReader();
-        reader.onload = function(event) {
-            imagePreview.innerHTML = `<img src="${event.target.result}" alt="Preview">`;
-        };
-        reader.readAsDataURL(file);
+            // Show preview
+            const reader = new FileReader();
+            reader.onload = function(event) {
+                imagePreview.innerHTML = `<img src="${event.target.result}" alt="Preview">`;
+            };
+            reader.readAsDataURL(file);
         
-        // Update label text
-        fileLabel.querySelector('.upload-text').textContent = '✓ Image selected';
-    }
-});
+            // Update label text
+            fileLabel.querySelector('.upload-text').textContent = '✓ Image selected';
+        }
+    });
 
-// GPS Location with better error handling
-if (navigator.geolocation) {
-    // Set a timeout for location request
-    const locationTimeout = setTimeout(function() {
-        locationStatus.innerHTML = '<p style="color: orange;">⚠️ Location timeout. Continuing without location data.</p>';
-    }, 5000);
+    // GPS Location with better error handling
+    if (navigator.geolocation) {
+        // Set a timeout for location request
+        const locationTimeout = setTimeout(function() {
+            locationStatus.innerHTML = '<p style="color: orange;">⚠️ Location timeout. Continuing without location data.</p>';
+        }, 5000);
     
-    navigator.geolocation.getCurrentPosition(
-        function(position) {
-            clearTimeout(locationTimeout);
-            document.getElementById('latitude').value = position.coords.latitude;
-            document.getElementById('longitude').value = position.coords.longitude;
-            locationStatus.innerHTML = '<p style="color: green;">✅ Location detected successfully!</p>';
-        },
-        function(error) {
-            clearTimeout(locationTimeout);
-            console.log('Location error:', error);
+        navigator.geolocation.getCurrentPosition(
+            function(position) {
+                clearTimeout(locationTimeout);
+                document.getElementById('latitude').value = position.coords.latitude;
+                document.getElementById('longitude').value = position.coords.longitude;
+                locationStatus.innerHTML = '<p style="color: green;">✅ Location detected successfully!</p>';
+            },
+            function(error) {
+                clearTimeout(locationTimeout);
+                console.log('Location error:', error);
             
-            let errorMessage = '';
-            switch(error.code) {
-                case error.PERMISSION_DENIED:
-                    errorMessage = '⚠️ Location access denied. Continuing without location-based advice.';
-                    break;
-                case error.POSITION_UNAVAILABLE:
-                    errorMessage = '⚠️ Location information unavailable. Continuing without location data.';
-                    break;
-                case error.TIMEOUT:
-                    errorMessage = '⚠️ Location request timeout. Continuing without location data.';
-                    break;
-                default:
-                    errorMessage = '⚠️ Location error. Continuing without location data.';
-            }
+                let errorMessage = '';
+                switch(error.code) {
+                    case error.PERMISSION_DENIED:
+                        errorMessage = '⚠️ Location access denied. Continuing without location-based advice.';
+                        break;
+                    case error.POSITION_UNAVAILABLE:
+                        errorMessage = '⚠️ Location information unavailable. Continuing without location data.';
+                        break;
+                    case error.TIMEOUT:
+                        errorMessage = '⚠️ Location request timeout. Continuing without location data.';
+                        break;
+                    default:
+                        errorMessage = '⚠️ Location error. Continuing without location data.';
+                }
             
-            locationStatus.innerHTML = `<p style="color: orange;">${errorMessage}</p>`;
-        },
-        {
-            enableHighAccuracy: false,
-            timeout: 5000,
-            maximumAge: 0
+                locationStatus.innerHTML = `<p style="color: orange;">${errorMessage}</p>`;
+            },
+            {
+                enableHighAccuracy: false,
+                timeout: 5000,
+                maximumAge: 0
+            }
+        );
+    } else {
+        locationStatus.innerHTML = '<p style="color: red;">❌ Geolocation not supported by browser.</p>';
+    }
+
+    // Prevent double-tap zoom on buttons (mobile)
+    document.querySelectorAll('.btn, .file-label').forEach(function(element) {
+        element.addEventListener('touchend', function(e) {
+            e.preventDefault();
+            element.click();
+        }, { passive: false });
+    });
+}
+
+// Downscale photos in the browser before upload: the model only sees 224 x 224 pixels, and a 3-8 MB camera
+// original takes minutes over 2G/3G. Anything unsupported along the way sends the original instead.
+function downscaleImage(file, maxEdge, quality) {
+    if (!maxEdge || !window.createImageBitmap || !/^image\/(jpeg|png|webp)$/.test(file.type)) {
+        return Promise.resolve(file);
+    }
+    return createImageBitmap(file, { imageOrientation: 'from-image' }).then(function(bitmap) {
+        const scale = Math.min(1, maxEdge / Math.max(bitmap.width, bitmap.height));
+        if (scale === 1 && file.type === 'image/jpeg') {
+            bitmap.close();
+            return file;  // Already small enough
+        }
+        const width = Math.round(bitmap.width * scale);
+        const height = Math.round(bitmap.height * scale);
+        let canvas;
+        if (window.OffscreenCanvas) {
+            canvas = new OffscreenCanvas(width, height);
+        } else {
+            canvas = document.createElement('canvas');
+            canvas.width = width;
+            canvas.height = height;
         }
-    );
-} else {
-    locationStatus.innerHTML = '<p style="color: red;">❌ Geolocation not supported by browser.</p>';
+        const context = canvas.getContext('2d');
+        context.imageSmoothingQuality = 'high';
+        context.fillStyle = '#fff';  // JPEG has no alpha; transparent PNG areas would turn black
+        context.fillRect(0, 0, width, height);
+        context.drawImage(bitmap, 0, 0, width, height);
+        bitmap.close();
+        const encoded = canvas.convertToBlob
+            ? canvas.convertToBlob({ type: 'image/jpeg', quality: quality })
+            : new Promise(function(resolve) { canvas.toBlob(resolve, 'image/jpeg', quality); });
+        return encoded.then(function(blob) {
+            if (!blob || blob.size >= file.size) return file;
+            const name = file.name.replace(/\.[^.]*$/, '') + '.jpg';
+            return new File([blob], name, { type: 'image/jpeg', lastModified: file.lastModified });
+        });
+    }).catch(function(error) {
+        console.log('Downscaling failed, uploading the original:', error);
+        return file;
+    });
+}
+
+if (fileInput && uploadMaxEdge) {
+    fileInput.addEventListener('change', function(e) {
+        const file = e.target.files[0];
+        if (!file) return;
+        pendingUpload = downscaleImage(file, uploadMaxEdge, uploadQuality).then(function(upload) {
+            if (upload !== file) {
+                console.log('Downscaled upload:', (file.size / 1024).toFixed(0) + ' KB ->',
+                            (upload.size / 1024).toFixed(0) + ' KB');
+                // Swap it into the input too, so a plain form post sends it as well (doesn't fire 'change')
+                try {
+                    const transfer = new DataTransfer();
+                    transfer.items.add(upload);
+                    fileInput.files = transfer.files;
+                } catch (error) {
+                    // Older browsers: only the fetch path below sends the downscaled file
+                }
+            }
+            return upload;
+        });
+    });
 }
 
 // Form submission handling
-document.getElementById('uploadForm').addEventListener('submit', function(e) {
+uploadForm.addEventListener('submit', function(e) {
+    if (e.defaultPrevented) return;
     submitBtn.innerHTML = '⏳ Analyzing rice disease...';
     submitBtn.disabled = true;
-});
-
-// Prevent double-tap zoom on buttons (mobile)
-document.querySelectorAll('.btn, .file-label').forEach(function(element) {
-    element.addEventListener('touchend', function(e) {
+    
+    // Submit as a background job so a slow network or proxy timeout doesn't lose the diagnosis
+    if (uploadForm.dataset.jobsUrl && window.fetch && window.FormData) {
         e.preventDefault();
-        element.click();
-    }, { passive: false });
+        (pendingUpload || Promise.resolve(null)).then(function(upload) {
+            submitDiagnosisJob(uploadForm, upload);
+        });
+    }
 });
+
+function showJobStatus(message) {
+    submitBtn.innerHTML = message;
+}
+
+function submitDiagnosisJob(form, upload) {
+    const data = new FormData(form);
+    if (upload && data.set) {
+        data.set('file', upload, upload.name);
+    }
+    fetch(form.dataset.jobsUrl, { method: 'POST', body: data, credentials: 'same-origin' })
+        .then(function(response) {
+            return response.json().then(function(job) {
+                if (response.status === 422) return { status: 'failed', error: job.error, rejected: true };
+                if (!response.ok) throw new Error(job.error || 'Upload failed');
+                return job;
+            });
+        })
+        .then(followJob)
+        .catch(function(error) {
+            console.log('Job submission failed, falling back to direct upload:', error);
+            form.submit();
+        });
+}
+
+function followJob(job) {
+    if (job.status === 'done') {
+        window.location = job.result_url;
+        return;
+    }
+    if (job.status === 'failed') {
+        jobFailed(job);
+        return;
+    }
+    showJobStatus(job.status === 'running' ? '⏳ Analyzing rice disease...' : '⏳ Waiting in queue...');
+    
+    if (window.EventSource) {
+        const events = new EventSource(job.events_url);
+        events.addEventListener('status', function(e) {
+            const update = JSON.parse(e.data);
+            if (update.status === 'done' || update.status === 'failed') {
+                events.close();
+            }
+            followJobUpdate(update);
+        });
+        events.onerror = function() {
+            // Stream dropped (proxy timeout, network switch) - keep going by polling
+            events.close();
+            pollJob(job.poll_url);
+        };
+    } else {
+        pollJob(job.poll_url);
+    }
+}
+
+function followJobUpdate(update) {
+    if (update.status === 'done') {
+        window.location = update.result_url;
+    } else if (update.status === 'failed') {
+        jobFailed(update);
+    } else {
+        showJobStatus(update.status === 'running' ? '⏳ Analyzing rice disease...' : '⏳ Waiting in queue...');
+    }
+}
+
+function pollJob(pollUrl) {
+    setTimeout(function() {
+        fetch(pollUrl, { credentials: 'same-origin' })
+            .then(function(response) { return response.json(); })
+            .then(function(update) {
+                followJobUpdate(update);
+                if (update.status === 'queued' || update.status === 'running') {
+                    pollJob(pollUrl);
+                }
+            })
+            .catch(function() { pollJob(pollUrl); });
+    }, 2000);
+}
+
+function jobFailed(job) {
+    submitBtn.innerHTML = '🔍 Detect Rice Disease';
+    submitBtn.disabled = false;
+    alert(job.rejected ? job.error : '⚠️ Diagnosis failed: ' + (job.error || 'please try again'));
+}
+})();
@@ -1,15 +1,18 @@
 import json
 import random
-import re
 from pathlib import Path
+from utils.intent_matcher import IntentMatcher
 
 class ChatbotService:
-    def __init__(self):
+    def __init__(self, intents_file='data/chatbot_intents.json', fuzzy_threshold=0.6):
+        self.intents_file = intents_file
         self.intents = self.load_intents()
+        # Compile every pattern once instead of building a regex per pattern per message
+        self.matcher = IntentMatcher(self.intents['intents'], fuzzy_threshold=fuzzy_threshold)
     
     def load_intents(self):
         """Load chatbot intents and responses"""
-        intents_file = Path('data/chatbot_intents.json')
+        intents_file = Path(self.intents_file)
         try:
             with open(intents_file, 'r', encoding='utf-8') as f:
                 return json.load(f)
@@ -78,11 +81,9 @@ class ChatbotService:
     
     def get_response(self, user_message):
         """Get chatbot response based on user input"""
-        user_message = user_message.lower()
+        intent_index = self.matcher.match(user_message)
         
-        for intent in self.intents['intents']:
-            for pattern in intent['patterns']:
-                if re.search(r'\b' + pattern + r'\b', user_message):
-                    return random.choice(intent['responses'])
+        if intent_index is not None:
+            return random.choice(self.intents['intents'][intent_index]['responses'])
         
         return "I am not sure about that. Please ask about rice varieties, fertilizers, diseases, or specific problems like blast, bacterial blight, or tungro."
@@ -0,0 +1,125 @@
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+FINISHED_STATUSES = ('done', 'failed')
+
+
+class JobQueueFull(Exception):
+    """Too many diagnosis jobs are waiting; the client should retry later"""
+
+
+class DiagnosisJobs:
+    """Diagnosis jobs persisted in SQLite and run by a bounded worker pool"""
+
+    def __init__(self, db, handler, max_workers=2, max_pending=100):
+        self.db = db
+        self.handler = handler
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='diagnosis-job')
+        self._pending = 0
+        self._changed = threading.Condition()
+        self._stats = {'submitted': 0, 'deduplicated': 0, 'retried': 0, 'completed': 0,
+                       'failed': 0, 'recovered': 0, 'rejected': 0}
+
+    @staticmethod
+    def job_id(user_id, image_hash):
+        """The same user uploading the same bytes always gets the same job"""
+        return hashlib.sha256(f"{user_id}:{image_hash}".encode('utf-8')).hexdigest()[:32]
+
+    def _count(self, key, amount=1):
+        with self._changed:
+            self._stats[key] += amount
+
+    def submit(self, user_id, image_hash, store_upload, latitude=None, longitude=None, timestamp=None):
+        """Return (job, created); store_upload() writes the image and returns its path, only for new work"""
+        job_id = self.job_id(user_id, image_hash)
+        job = self.db.get_job(job_id)
+        if job and job['status'] != 'failed':
+            self._count('deduplicated')
+            return job, False
+
+        with self._changed:
+            if self._pending >= self.max_pending:
+                self._stats['rejected'] += 1
+                raise JobQueueFull()
+
+        image_path = str(store_upload())
+        if job:
+            created = self.db.retry_failed_job(job_id, image_path, latitude, longitude, timestamp)
+            key = 'retried'
+        else:
+            created = self.db.create_job(job_id, user_id, image_hash, image_path, latitude, longitude, timestamp)
+            key = 'submitted'
+
+        if not created:
+            # A concurrent identical upload won the race
+            self._count('deduplicated')
+            return self.db.get_job(job_id), False
+
+        self._count(key)
+        self._enqueue(job_id)
+        return self.db.get_job(job_id), True
+
+    def _enqueue(self, job_id):
+        with self._changed:
+            self._pending += 1
+        self.executor.submit(self._run, job_id)
+
+    def _run(self, job_id):
+        try:
+            # With several server processes, a recovered job may already have been picked up elsewhere
+            if not self.db.claim_job(job_id):
+                return
+            job = self.db.get_job(job_id)
+            self._notify()
+            try:
+                result = self.handler(job)
+            except Exception as e:
+                print(f"❌ Diagnosis job {job_id} failed: {e}")
+                self._set_status(job_id, 'failed', error=str(e))
+                self._count('failed')
+            else:
+                self._set_status(job_id, 'done', result=result)
+                self._count('completed')
+        finally:
+            with self._changed:
+                self._pending -= 1
+
+    def _set_status(self, job_id, status, result=None, error=None):
+        self.db.update_job(job_id, status, result=result, error=error)
+        self._notify()
+
+    def _notify(self):
+        with self._changed:
+            self._changed.notify_all()
+
+    def recover(self, requeue_running=True):
+        """Queue jobs left over from before a restart; 'running' ones too unless other workers may own them"""
+        if requeue_running:
+            self.db.requeue_running_jobs()
+        jobs = self.db.get_queued_jobs()
+        for job in jobs:
+            self._enqueue(job['id'])
+        if jobs:
+            self._count('recovered', len(jobs))
+            print(f"♻️ Recovered {len(jobs)} unfinished diagnosis jobs")
+        return len(jobs)
+
+    def shutdown(self):
+        """Let running jobs finish and drop the ones not started; they stay queued for the next worker"""
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def get(self, job_id):
+        return self.db.get_job(job_id)
+
+    def wait_for_change(self, timeout):
+        """Block until any job changes status (or timeout); returns False on timeout"""
+        with self._changed:
+            return self._changed.wait(timeout)
+
+    def get_stats(self):
+        with self._changed:
+            stats = dict(self._stats)
+            stats['pending'] = self._pending
+        return stats
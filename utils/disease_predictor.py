@@ -1,40 +1,133 @@
-import tensorflow as tf
 import numpy as np
 from PIL import Image
+import hashlib
 import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
 from pathlib import Path
+from utils.inference_backends import load_backend
+from utils.metrics import metrics
+
+# Model input size (width, height)
+INPUT_SIZE = (224, 224)
+
+
+class BatchScheduler:
+    """Merge concurrent single-image requests into one forward pass"""
+
+    def __init__(self, predict_fn, max_batch_size=16, max_wait_ms=10):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, max_wait_ms / 1000.0)
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._stats = {
+            'requests': 0,
+            'batches': 0,
+            'max_batch_size': 0,
+            'total_queue_wait_ms': 0.0,
+            'max_queue_wait_ms': 0.0,
+            'batch_size_counts': {}
+        }
+
+    def submit(self, image_batch):
+        """Queue a preprocessed (1, H, W, C) array and block until its predictions are ready"""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((image_batch, future, time.perf_counter()))
+        return future.result()
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='batch-scheduler', daemon=True)
+                self._worker.start()
+
+    def _collect(self):
+        """Wait for the first request, then gather more until the batch is full or the window closes"""
+        items = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(items) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                items.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return items
+
+    def _run(self):
+        while True:
+            items = self._collect()
+            started = time.perf_counter()
+            waits = [(started - queued_at) * 1000 for _, _, queued_at in items]
+            self._record(len(items), waits)
+
+            try:
+                batch = np.concatenate([image for image, _, _ in items], axis=0)
+                predictions = self.predict_fn(batch)
+            except Exception as e:
+                for _, future, _ in items:
+                    future.set_exception(e)
+                continue
+
+            for i, (_, future, _) in enumerate(items):
+                future.set_result(predictions[i:i + 1])
+
+    def _record(self, batch_size, waits):
+        with self._lock:
+            stats = self._stats
+            stats['requests'] += batch_size
+            stats['batches'] += 1
+            stats['max_batch_size'] = max(stats['max_batch_size'], batch_size)
+            stats['total_queue_wait_ms'] += sum(waits)
+            stats['max_queue_wait_ms'] = max(stats['max_queue_wait_ms'], max(waits))
+            counts = stats['batch_size_counts']
+            counts[batch_size] = counts.get(batch_size, 0) + 1
+
+    def get_stats(self):
+        """Batch size and queue wait counters"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['batch_size_counts'] = dict(self._stats['batch_size_counts'])
+        requests = stats['requests']
+        stats['avg_batch_size'] = round(requests / stats['batches'], 2) if stats['batches'] else 0.0
+        stats['avg_queue_wait_ms'] = round(stats['total_queue_wait_ms'] / requests, 3) if requests else 0.0
+        stats['max_batch'] = self.max_batch_size
+        stats['max_wait_ms'] = self.max_wait * 1000
+        return stats
 
-# Custom InputLayer to handle batch_shape parameter
-class CustomInputLayer(tf.keras.layers.InputLayer):
-    def __init__(self, batch_shape=None, input_shape=None, **kwargs):
-        if batch_shape is not None and input_shape is None:
-            input_shape = batch_shape[1:]
-        super().__init__(input_shape=input_shape, **kwargs)
 
 class DiseasePredictor:
-    def __init__(self, model_path):
+    def __init__(self, model_path, max_batch_size=16, max_wait_ms=10, batching=True, backend=None, num_threads=None):
         self.model_path = model_path
+        self.backend = backend
+        self.num_threads = num_threads
         self.model = None
+        self.model_version = 'fallback'
         self.load_model()
         self.disease_info = self.load_disease_info()
-        
+        self.scheduler = None
+        if batching:
+            self.scheduler = BatchScheduler(self._forward, max_batch_size, max_wait_ms)
+
     def load_model(self):
-        """Load the pre-trained rice disease model"""
+        """Load the pre-trained rice disease model with the configured backend (keras, tflite or onnx)"""
         model_file = Path(self.model_path)
         if model_file.exists():
             try:
-                # Register custom InputLayer
-                custom_objects = {'InputLayer': CustomInputLayer}
-                
-                print("🔄 Loading rice disease detection model...")
-                self.model = tf.keras.models.load_model(
-                    str(model_file), 
-                    custom_objects=custom_objects,
-                    compile=False
-                )
-                print("✅ Rice disease detection model loaded successfully!")
+                print(f"🔄 Loading rice disease detection model ({self.backend or 'auto'} backend)...")
+                self.model = load_backend(model_file, self.backend, num_threads=self.num_threads)
+                print(f"✅ Rice disease detection model loaded successfully! ({self.model.name})")
                 print(f"📊 Model input shape: {self.model.input_shape}")
-                print(f"📊 Model output classes: {self.model.output_shape[-1]}")
+                print(f"📊 Model output classes: {self.model.output_classes}")
+                self.model_version = self.compute_model_version(model_file)
                 
             except Exception as e:
                 print(f"❌ Error loading model: {e}")
@@ -45,7 +138,14 @@ class DiseasePredictor:
             print("📁 Please place your 'crop_disease_model.h5' file in the 'models' folder")
             self.model = None
     
-    def load_disease_info(self):
+    def compute_model_version(self, model_file):
+        """Short fingerprint of the weights file, used to key cached predictions"""
+        stat = model_file.stat()
+        fingerprint = f"{model_file.resolve()}:{stat.st_size}:{stat.st_mtime_ns}"
+        return hashlib.sha1(fingerprint.encode('utf-8')).hexdigest()[:12]
+    
+    @staticmethod
+    def load_disease_info():
         """Load rice disease information and treatment details"""
         disease_file = Path('data/disease_info.json')
         try:
@@ -53,9 +153,10 @@ class DiseasePredictor:
                 return json.load(f)
         except FileNotFoundError:
             print("⚠️ disease_info.json not found. Using default information.")
-            return self.get_default_disease_info()
+            return DiseasePredictor.get_default_disease_info()
     
-    def get_default_disease_info(self):
+    @staticmethod
+    def get_default_disease_info():
         """Comprehensive rice disease information for all 10 classes"""
         return {
             'bacterial_leaf_blight': {
@@ -110,41 +211,95 @@ class DiseasePredictor:
             }
         }
     
-    def preprocess_image(self, image_path):
-        """Preprocess image for prediction"""
+    @staticmethod
+    def is_model_sized(size):
+        """Whether an image is no bigger than the model input, so nothing needs scaling down"""
+        return size[0] <= INPUT_SIZE[0] and size[1] <= INPUT_SIZE[1]
+    
+    @staticmethod
+    def load_image(image_source):
+        """Open an image path or file-like object as a 224x224 RGB image"""
+        img = Image.open(image_source)
+        
+        # Let the JPEG decoder downscale by 1/2, 1/4 or 1/8 while decoding,
+        # so a 12 MP phone photo never gets decoded at full resolution
+        if img.format == 'JPEG' and not DiseasePredictor.is_model_sized(img.size):
+            img.draft('RGB', INPUT_SIZE)
+        
+        # Convert RGBA / grayscale / palette images to RGB
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        
+        # Resize to model's expected input size
+        if img.size != INPUT_SIZE:
+            img = img.resize(INPUT_SIZE)
+        
+        return img
+    
+    @staticmethod
+    def preprocess_into(image_source, out):
+        """Decode an image and write normalized pixels into a preallocated (224, 224, 3) float32 array"""
         try:
-            img = Image.open(image_path)
+            img = DiseasePredictor.load_image(image_source)
             
-            # Convert RGBA to RGB if necessary
-            if img.mode == 'RGBA':
-                img = img.convert('RGB')
+            # Normalize pixel values to 0-1 straight into the output buffer
+            np.divide(np.asarray(img), np.float32(255.0), out=out)
+            return True
             
-            # Resize to model's expected input size
-            img = img.resize((224, 224))
-            img_array = np.array(img)
-            
-            # Handle grayscale images
-            if len(img_array.shape) == 2:
-                img_array = np.stack([img_array] * 3, axis=-1)
-            
-            # Normalize pixel values to 0-1
-            img_array = img_array.astype('float32') / 255.0
+        except Exception as e:
+            print(f"❌ Error preprocessing image: {e}")
+            return False
+    
+    def preprocess_image(self, image_source):
+        """Preprocess an image path or file-like object into a (1, 224, 224, 3) batch"""
+        img_array = np.empty((1, INPUT_SIZE[1], INPUT_SIZE[0], 3), dtype='float32')
+        with metrics.timer('preprocess'):
+            if not self.preprocess_into(image_source, img_array[0]):
+                return None
+        return img_array
+    
+    def _forward(self, batch):
+        """Run one forward pass over a (N, H, W, C) batch"""
+        with metrics.timer('model_predict'):
+            return self.model.predict(batch)
+
+    def run_inference(self, processed_image):
+        """Get class probabilities, sharing a forward pass with concurrent callers when batching is on"""
+        if self.scheduler is not None:
+            return self.scheduler.submit(processed_image)
+        return self._forward(processed_image)
+
+    def get_batch_stats(self):
+        """Counters from the batching scheduler (empty when batching is off)"""
+        if self.scheduler is None:
+            return {}
+        return self.scheduler.get_stats()
+
+    def predict_batch(self, images, batch_size=32):
+        """Yield one result per row of a preprocessed (N, H, W, C) array, running fixed-size batches"""
+        for start in range(0, len(images), batch_size):
+            chunk = images[start:start + batch_size]
             
-            # Add batch dimension
-            img_array = np.expand_dims(img_array, axis=0)
+            if self.model is None:
+                for _ in range(len(chunk)):
+                    yield self._get_fallback_result('blast')
+                continue
             
-            return img_array
+            try:
+                predictions = self._forward(chunk)
+            except Exception as e:
+                print(f"❌ Batch prediction error: {e}")
+                for _ in range(len(chunk)):
+                    yield self._get_fallback_result('blast')
+                continue
             
-        except Exception as e:
-            print(f"❌ Error preprocessing image: {e}")
-            return None
+            for row in predictions:
+                yield self._build_result(row)
     
-    def predict(self, image_path):
-        """Make prediction on the rice plant image"""
-        from config import Config
-        
+    def predict(self, image_source):
+        """Make prediction on the rice plant image (path or file-like object)"""
         # Preprocess the image
-        processed_image = self.preprocess_image(image_path)
+        processed_image = self.preprocess_image(image_source)
         
         if processed_image is None:
             return self._get_fallback_result('blast')
@@ -152,32 +307,10 @@ class DiseasePredictor:
         # Make prediction
         if self.model is not None:
             try:
-                predictions = self.model.predict(processed_image, verbose=0)
-                predicted_class_index = np.argmax(predictions[0])
-                confidence = float(predictions[0][predicted_class_index]) * 100
-                
-                disease_name = Config.DISEASE_CLASSES[predicted_class_index]
-                
-                print(f"✅ Prediction: {disease_name} (Confidence: {confidence:.2f}%)")
-                
-                # Get disease information
-                info = self.disease_info.get(disease_name, {
-                    'symptoms': 'Symptoms information not available.',
-                    'treatment': 'Consult with agricultural expert for specific treatment.',
-                    'prevention': 'Maintain proper rice crop management practices.'
-                })
-                
-                # Format disease name for display
-                display_name = disease_name.replace('_', ' ').title()
-                
-                return {
-                    'disease': display_name,
-                    'raw_disease': disease_name,
-                    'confidence': round(confidence, 2),
-                    'symptoms': info.get('symptoms', 'Not available'),
-                    'treatment': info.get('treatment', 'Not available'),
-                    'prevention': info.get('prevention', 'Not available')
-                }
+                # Includes any wait for a shared batch, unlike model_predict
+                with metrics.timer('inference'):
+                    predictions = self.run_inference(processed_image)
+                return self._build_result(predictions[0])
                 
             except Exception as e:
                 print(f"❌ Prediction error: {e}")
@@ -186,8 +319,39 @@ class DiseasePredictor:
             print("⚠️ Model not loaded. Using fallback prediction.")
             return self._get_fallback_result('blast')
     
+    def _build_result(self, probabilities):
+        """Turn one row of class probabilities into a result dict"""
+        from config import Config
+        
+        predicted_class_index = np.argmax(probabilities)
+        confidence = float(probabilities[predicted_class_index]) * 100
+        
+        disease_name = Config.DISEASE_CLASSES[predicted_class_index]
+        
+        print(f"✅ Prediction: {disease_name} (Confidence: {confidence:.2f}%)")
+        
+        # Get disease information
+        info = self.disease_info.get(disease_name, {
+            'symptoms': 'Symptoms information not available.',
+            'treatment': 'Consult with agricultural expert for specific treatment.',
+            'prevention': 'Maintain proper rice crop management practices.'
+        })
+        
+        # Format disease name for display
+        display_name = disease_name.replace('_', ' ').title()
+        
+        return {
+            'disease': display_name,
+            'raw_disease': disease_name,
+            'confidence': round(confidence, 2),
+            'symptoms': info.get('symptoms', 'Not available'),
+            'treatment': info.get('treatment', 'Not available'),
+            'prevention': info.get('prevention', 'Not available')
+        }
+    
     def _get_fallback_result(self, disease_name):
         """Return fallback result when model fails"""
+        metrics.increment('predictions_fallback_total')
         info = self.disease_info.get(disease_name, {
             'symptoms': 'Symptoms information not available.',
             'treatment': 'Consult with agricultural expert for specific treatment.',
@@ -202,5 +366,6 @@ class DiseasePredictor:
             'confidence': 0.0,
             'symptoms': info.get('symptoms', 'Not available'),
             'treatment': info.get('treatment', 'Not available'),
-            'prevention': info.get('prevention', 'Not available')
+            'prevention': info.get('prevention', 'Not available'),
+            'fallback': True
         }
@@ -0,0 +1,232 @@
+"""Bulk export and import of diagnosis_history for state agriculture departments and offline field teams.
+
+    python -m utils.history_export export --month 2026-09 -o september.csv
+    python -m utils.history_export export --format parquet --since 2026-01-01 --region Telangana -o 2026.parquet
+    python -m utils.history_export import field_survey.csv
+
+Exports stream one keyset-paginated chunk at a time, so memory stays flat however many rows match.
+Imports take the export columns (user_id, disease and confidence are required) and insert in chunked transactions.
+Parquet needs pyarrow (pip install pyarrow).
+"""
+import argparse
+import csv
+import io
+import sys
+import time
+from datetime import datetime, timedelta
+from itertools import islice
+
+from ml_models import EXPORT_COLUMNS
+
+FORMATS = {
+    'csv': {'mimetype': 'text/csv', 'extension': 'csv'},
+    'parquet': {'mimetype': 'application/vnd.apache.parquet', 'extension': 'parquet'}
+}
+# Rows per fetch; Parquet writes each chunk as a row group, and small row groups compress and scan poorly
+EXPORT_CHUNK_ROWS = {'csv': 5000, 'parquet': 65536}
+IMPORT_CHUNK_ROWS = 50000  # Rows per transaction
+
+
+def export_window(since=None, until=None, month=None):
+    """(since, until) created_at bounds from YYYY-MM-DD days (until inclusive) or a YYYY-MM month; raises ValueError"""
+    if month:
+        start = datetime.strptime(month, '%Y-%m')
+        end = (start + timedelta(days=32)).replace(day=1)
+        return start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')
+    since = datetime.strptime(since, '%Y-%m-%d').strftime('%Y-%m-%d') if since else None
+    if until:
+        until = (datetime.strptime(until, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+    return since, until
+
+
+def export_filename(fmt, since=None, until=None):
+    return f"diagnoses_{since or 'start'}_{until or 'now'}.{FORMATS[fmt]['extension']}"
+
+
+def csv_chunks(chunks):
+    """CSV text, header first, one piece per chunk of rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()  # Header of an empty export
+
+
+class _DrainingSink:
+    """Write-only file object that hands back what was written since the last drain()"""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def parquet_schema():
+    import pyarrow as pa
+
+    types = {'id': pa.int64(), 'user_id': pa.int64(), 'confidence': pa.float64(),
+             'latitude': pa.float64(), 'longitude': pa.float64()}
+    return pa.schema([(name, types.get(name, pa.string())) for name in EXPORT_COLUMNS])
+
+
+def parquet_chunks(chunks):
+    """Parquet bytes, one row group per chunk of rows, footer last"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = parquet_schema()
+    sink = _DrainingSink()
+    writer = pq.ParquetWriter(sink, schema, compression='zstd')
+    try:
+        for rows in chunks:
+            columns = list(zip(*rows))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def export_chunks(db, fmt='csv', since=None, until=None, region=None, disease=None):
+    """Encoded export as an iterator of str (CSV) or bytes (Parquet) pieces"""
+    chunks = db.iter_history_export(since, until, region=region, disease=disease, chunk_size=EXPORT_CHUNK_ROWS[fmt])
+    return csv_chunks(chunks) if fmt == 'csv' else parquet_chunks(chunks)
+
+
+def read_records(path, fmt=None):
+    """Yield dicts from a CSV or Parquet file, a batch at a time"""
+    fmt = fmt or ('parquet' if str(path).endswith('.parquet') else 'csv')
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=IMPORT_CHUNK_ROWS):
+            yield from batch.to_pylist()
+    else:
+        with open(path, newline='', encoding='utf-8') as f:
+            yield from csv.DictReader(f)
+
+
+def normalize_record(record):
+    """Typed copy of an import row, or None when a required field is missing or malformed"""
+    try:
+        normalized = {
+            'user_id': int(record['user_id']),
+            'disease': str(record['disease']).strip(),
+            'confidence': float(record['confidence'])
+        }
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not normalized['disease']:
+        return None
+
+    created_at = record.get('created_at')
+    if created_at not in (None, ''):
+        if not isinstance(created_at, datetime):
+            try:
+                created_at = datetime.fromisoformat(str(created_at))  # Several times faster than strptime
+            except ValueError:
+                return None
+        normalized['created_at'] = created_at.strftime('%Y-%m-%d %H:%M:%S')
+
+    for field in ('timestamp', 'disease_key', 'image_path', 'region', 'address'):
+        if record.get(field) not in (None, ''):
+            normalized[field] = str(record[field])
+    for field in ('latitude', 'longitude'):
+        if record.get(field) not in (None, ''):
+            try:
+                normalized[field] = float(record[field])
+            except (TypeError, ValueError):
+                pass
+    return normalized
+
+
+def import_history(db, path, fmt=None, chunk_size=IMPORT_CHUNK_ROWS, disease_info=None):
+    """Load a CSV / Parquet file into diagnosis_history, chunk_size rows per transaction.
+    Diseases without advice in the database get it from disease_info (default: the predictor's disease info)."""
+    if disease_info is None:
+        from utils.disease_predictor import DiseasePredictor
+        disease_info = DiseasePredictor.load_disease_info()
+    stats = {'read': 0, 'inserted': 0, 'invalid': 0, 'skipped': 0}
+    started = time.perf_counter()
+    records = read_records(path, fmt)
+    while True:
+        raw = list(islice(records, chunk_size))
+        if not raw:
+            break
+        chunk = [record for record in map(normalize_record, raw) if record is not None]
+        inserted = db.import_diagnoses(chunk, disease_info) if chunk else 0
+        stats['read'] += len(raw)
+        stats['invalid'] += len(raw) - len(chunk)
+        stats['skipped'] += len(chunk) - inserted  # Unknown user, or a disease with no advice
+        stats['inserted'] += inserted
+        print(f"📥 Imported {stats['inserted']:,} of {stats['read']:,} rows")
+    seconds = time.perf_counter() - started
+    stats['seconds'] = round(seconds, 2)
+    stats['rows_per_sec'] = round(stats['inserted'] / seconds) if seconds else None
+    return stats
+
+
+if __name__ == '__main__':
+    from config import Config
+    from ml_models import Database
+
+    parser = argparse.ArgumentParser(description='Bulk export / import of diagnosis history')
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    export_parser = subcommands.add_parser('export')
+    export_parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+    export_parser.add_argument('--since', help='First day, YYYY-MM-DD (UTC)')
+    export_parser.add_argument('--until', help='Last day, YYYY-MM-DD (UTC, inclusive)')
+    export_parser.add_argument('--month', help='YYYY-MM, instead of --since / --until')
+    export_parser.add_argument('--region', help='Part of the region name, e.g. Telangana')
+    export_parser.add_argument('--disease', help='Disease name or key, e.g. "Brown Spot"')
+    export_parser.add_argument('-o', '--output', help='Output file (CSV defaults to stdout)')
+    import_parser = subcommands.add_parser('import')
+    import_parser.add_argument('path')
+    import_parser.add_argument('--format', choices=sorted(FORMATS), help='Default: from the file extension')
+    import_parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_ROWS, help='Rows per transaction')
+    args = parser.parse_args()
+
+    db = Database(Config.DATABASE_PATH)
+    if args.command == 'import':
+        print(f"✅ {import_history(db, args.path, args.format, args.chunk_size)}")
+        sys.exit(0)
+
+    if args.format == 'parquet' and not args.output:
+        parser.error('--output is required for Parquet')
+    since, until = export_window(args.since, args.until, args.month)
+    pieces = export_chunks(db, args.format, since, until, region=args.region, disease=args.disease)
+    started = time.perf_counter()
+    if args.output:
+        mode, encoding = ('w', 'utf-8') if args.format == 'csv' else ('wb', None)
+        with open(args.output, mode, encoding=encoding, newline='' if encoding else None) as f:
+            for piece in pieces:
+                f.write(piece)
+        print(f"✅ Exported to {args.output} in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    else:
+        for piece in pieces:
+            sys.stdout.write(piece)
@@ -0,0 +1,95 @@
+import base64
+import json
+import threading
+import time
+
+
+class HistorySync:
+    """Delta sync of a user's history for offline clients: each call returns what changed since the client's cursor.
+
+    A cursor is (user, last diagnosis id, last change seq, when its tombstones were last read). Tombstones older
+    than retention_days are pruned, so an older cursor gets reset=True and a full download instead.
+    """
+
+    def __init__(self, db, page_size=200, max_page_size=1000, retention_days=90, prune_interval_seconds=3600):
+        self.db = db
+        self.page_size = page_size
+        self.max_page_size = max_page_size
+        self.retention_days = retention_days
+        self.prune_interval_seconds = prune_interval_seconds
+        self._next_prune = 0.0
+        self._lock = threading.Lock()
+        self._stats = {'syncs': 0, 'resets': 0, 'empty': 0, 'upserts': 0, 'deleted': 0, 'pruned': 0,
+                       'bytes_raw': 0, 'bytes_sent': 0}
+
+    @staticmethod
+    def encode_cursor(user_id, last_id, change_seq, issued_at):
+        raw = json.dumps([user_id, last_id, change_seq, int(issued_at)]).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii')
+
+    @staticmethod
+    def decode_cursor(cursor):
+        """(user_id, last_id, change_seq, issued_at), or None for a missing or malformed cursor"""
+        if not cursor:
+            return None
+        try:
+            user_id, last_id, change_seq, issued_at = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            return int(user_id), int(last_id), int(change_seq), int(issued_at)
+        except (ValueError, TypeError):
+            return None
+
+    def sync(self, user_id, cursor=None, limit=None):
+        """One page of changes since the cursor. With reset=True the client drops its copy and applies the page
+        to an empty one; it keeps calling with the returned cursor while has_more is set."""
+        self._maybe_prune()
+        now = time.time()
+        limit = min(max(int(limit or self.page_size), 1), self.max_page_size)
+        position = self.decode_cursor(cursor)
+        reset = (position is None or position[0] != user_id
+                 or now - position[3] > self.retention_days * 86400)
+        if reset:
+            page = self.db.get_history_changes(user_id, limit=limit)
+            issued_at = now
+        else:
+            _, last_id, change_seq, issued_at = position
+            page = self.db.get_history_changes(user_id, last_id, change_seq, limit=limit)
+            if not page['has_more']:
+                issued_at = now  # Every tombstone up to now has been read
+
+        page['cursor'] = self.encode_cursor(user_id, page.pop('last_id'), page.pop('change_seq'), issued_at)
+        page['reset'] = reset
+        with self._lock:
+            self._stats['syncs'] += 1
+            self._stats['resets'] += reset
+            self._stats['empty'] += not (page['upserts'] or page['deleted'])
+            self._stats['upserts'] += len(page['upserts'])
+            self._stats['deleted'] += len(page['deleted'])
+        return page
+
+    def record_response(self, raw_bytes, sent_bytes):
+        """Body size before and after compression, for the transfer ratio in get_stats()"""
+        with self._lock:
+            self._stats['bytes_raw'] += raw_bytes
+            self._stats['bytes_sent'] += sent_bytes
+
+    def _maybe_prune(self):
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_prune:
+                return
+            self._next_prune = now + self.prune_interval_seconds
+        pruned = self.db.prune_diagnosis_changes(self.retention_days)
+        if pruned:
+            print(f"🧹 Pruned {pruned} sync tombstones older than {self.retention_days} days")
+            with self._lock:
+                self._stats['pruned'] += pruned
+
+    def get_stats(self):
+        """Sync counts, rows and tombstones sent, and bytes per sync before / after gzip"""
+        with self._lock:
+            stats = dict(self._stats)
+        syncs = stats['syncs']
+        stats['bytes_per_sync'] = round(stats['bytes_sent'] / syncs) if syncs else None
+        stats['compression_ratio'] = round(stats['bytes_sent'] / stats['bytes_raw'], 3) if stats['bytes_raw'] else None
+        stats['retention_days'] = self.retention_days
+        return stats
@@ -0,0 +1,117 @@
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+from utils.metrics import metrics
+
+# Shown to the user instead of running the model
+REJECTION_MESSAGES = {
+    'unreadable': "⚠️ The uploaded file could not be read as an image. Please upload a JPG or PNG photo.",
+    'too_dark': "⚠️ The photo is too dark. Please take it again in daylight.",
+    'too_bright': "⚠️ The photo is overexposed. Please avoid pointing the camera at the sun or a bright sky.",
+    'blurry': "⚠️ The photo is too blurry. Please hold the phone steady and tap the leaf to focus.",
+    'not_plant': "⚠️ The photo doesn't appear to show a rice plant. Please photograph the affected leaves."
+}
+
+
+class ImagePrefilter:
+    """Millisecond checks on a small copy of an upload that reject photos which can't be a usable rice leaf"""
+
+    def __init__(self, enabled=True, size=128, min_plant_ratio=0.12, min_sharpness=40.0,
+                 min_brightness=30, max_brightness=235, max_clipped_ratio=0.5):
+        self.enabled = enabled
+        self.size = size
+        self.min_plant_ratio = min_plant_ratio
+        self.min_sharpness = min_sharpness
+        self.min_brightness = min_brightness
+        self.max_brightness = max_brightness
+        self.max_clipped_ratio = max_clipped_ratio
+        self._lock = threading.Lock()
+        self._stats = {'checked': 0, 'passed': 0, 'rejected': 0, 'total_ms': 0.0}
+        self._reasons = {reason: 0 for reason in REJECTION_MESSAGES}
+
+    def load_small(self, image_source):
+        """RGB uint8 array at most size x size; JPEGs are decoded at 1/2-1/8 scale straight away"""
+        with Image.open(image_source) as img:
+            if img.format == 'JPEG':
+                img.draft('RGB', (self.size, self.size))
+            img = img.convert('RGB')
+            img.thumbnail((self.size, self.size))
+            return np.asarray(img)
+
+    @staticmethod
+    def scores(rgb):
+        """Exposure, sharpness and vegetation scores of an RGB uint8 array"""
+        pixels = rgb.astype('float32')
+        gray = pixels @ np.array([0.299, 0.587, 0.114], dtype='float32')
+
+        # Variance of the 4-neighbour Laplacian: low when there are no edges, i.e. out of focus or shaken
+        laplacian = (gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:]) - 4 * gray[1:-1, 1:-1]
+
+        # Vegetation: saturated, not too dark, and green at least about as strong as red and above blue.
+        # The 0.9 lets yellowing (tungro, ripening) leaves still count as plant.
+        red, green, blue = pixels[..., 0], pixels[..., 1], pixels[..., 2]
+        high = pixels.max(axis=-1)
+        low = pixels.min(axis=-1)
+        chroma = high - low
+        saturated = (chroma > 0.15 * high) & (high > 40)
+        green_dominant = (green >= red * 0.9) & (green > blue)
+
+        return {
+            'brightness': round(float(gray.mean()), 1),
+            'clipped_ratio': round(float(((gray < 8) | (gray > 247)).mean()), 3),
+            'sharpness': round(float(laplacian.var()), 1),
+            'plant_ratio': round(float((saturated & green_dominant).mean()), 3)
+        }
+
+    def reason(self, scores):
+        """First failed check, or None"""
+        if scores['brightness'] < self.min_brightness:
+            return 'too_dark'
+        if scores['brightness'] > self.max_brightness or scores['clipped_ratio'] > self.max_clipped_ratio:
+            return 'too_bright'
+        if scores['sharpness'] < self.min_sharpness:
+            return 'blurry'
+        if scores['plant_ratio'] < self.min_plant_ratio:
+            return 'not_plant'
+        return None
+
+    @metrics.timed('prefilter')
+    def check(self, image_source):
+        """(reason, scores) for an image path, file-like object or load_small() array;
+        reason is None when the image may go on to the model"""
+        if not self.enabled:
+            return None, {}
+        started = time.perf_counter()
+        try:
+            rgb = image_source if isinstance(image_source, np.ndarray) else self.load_small(image_source)
+            scores = self.scores(rgb)
+            reason = self.reason(scores)
+        except Exception as e:
+            print(f"❌ Prefilter could not decode image: {e}")
+            scores, reason = {}, 'unreadable'
+
+        with self._lock:
+            self._stats['checked'] += 1
+            self._stats['total_ms'] += (time.perf_counter() - started) * 1000
+            if reason is None:
+                self._stats['passed'] += 1
+            else:
+                self._stats['rejected'] += 1
+                self._reasons[reason] += 1
+        if reason is not None:
+            metrics.increment('prefilter_rejections_total', reason=reason)
+            print(f"🚫 Prefilter rejected upload: {reason} {scores}")
+        return reason, scores
+
+    def get_stats(self):
+        """Check counts, rejections per reason (each one an inference not run) and mean check time"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['rejected_by_reason'] = dict(self._reasons)
+        stats['rejection_ratio'] = round(stats['rejected'] / stats['checked'], 4) if stats['checked'] else 0.0
+        stats['mean_ms'] = round(stats.pop('total_ms') / stats['checked'], 3) if stats['checked'] else None
+        stats['enabled'] = self.enabled
+        return stats
@@ -0,0 +1,165 @@
+import threading
+from pathlib import Path
+
+import numpy as np
+
+# Backends are imported lazily so that a TFLite / ONNX worker never pays for importing TensorFlow
+BACKENDS = ('keras', 'tflite', 'onnx')
+
+# Backends loaded by preload_backend(), keyed by (resolved path, backend name)
+_preloaded = {}
+
+
+def configure_tensorflow_threads(intra_op=None, inter_op=None):
+    """Size TensorFlow's thread pools; only possible before TensorFlow runs its first op"""
+    import tensorflow as tf
+
+    try:
+        if intra_op:
+            tf.config.threading.set_intra_op_parallelism_threads(intra_op)
+        if inter_op:
+            tf.config.threading.set_inter_op_parallelism_threads(inter_op)
+    except RuntimeError as e:
+        print(f"⚠️ TensorFlow thread counts unchanged: {e}")
+        return False
+    return True
+
+
+class KerasBackend:
+    """Full tf.keras model loaded from the .h5 file"""
+
+    name = 'keras'
+
+    def __init__(self, model_path):
+        import tensorflow as tf
+
+        # Custom InputLayer to handle batch_shape parameter
+        class CustomInputLayer(tf.keras.layers.InputLayer):
+            def __init__(self, batch_shape=None, input_shape=None, **kwargs):
+                if batch_shape is not None and input_shape is None:
+                    input_shape = batch_shape[1:]
+                super().__init__(input_shape=input_shape, **kwargs)
+
+        self.model = tf.keras.models.load_model(
+            str(model_path),
+            custom_objects={'InputLayer': CustomInputLayer},
+            compile=False
+        )
+        self.input_shape = tuple(self.model.input_shape)
+        self.output_classes = self.model.output_shape[-1]
+
+    def predict(self, batch):
+        # A direct call runs on the calling thread; model.predict() starts tf.data machinery per call,
+        # which is slower for small batches and hangs in a worker forked after the model was loaded
+        return np.asarray(self.model(batch, training=False))
+
+
+class TFLiteBackend:
+    """TensorFlow Lite interpreter (float32, float16 or int8-quantized artifacts)"""
+
+    name = 'tflite'
+
+    def __init__(self, model_path, num_threads=None):
+        Interpreter = self._interpreter_class()
+        self.interpreter = Interpreter(model_path=str(model_path), num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self.input_detail = self.interpreter.get_input_details()[0]
+        self.output_detail = self.interpreter.get_output_details()[0]
+        self.input_shape = (None,) + tuple(int(d) for d in self.input_detail['shape'][1:])
+        self.output_classes = int(self.output_detail['shape'][-1])
+        self._batch_size = int(self.input_detail['shape'][0])
+        # The interpreter holds mutable tensor buffers, so calls must not overlap
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _interpreter_class():
+        try:
+            from tflite_runtime.interpreter import Interpreter
+            return Interpreter
+        except ImportError:
+            pass
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+            return Interpreter
+        except ImportError:
+            pass
+        import tensorflow as tf
+        return tf.lite.Interpreter
+
+    def _quantize(self, batch, detail):
+        scale, zero_point = detail['quantization']
+        if detail['dtype'] in (np.int8, np.uint8) and scale:
+            info = np.iinfo(detail['dtype'])
+            batch = np.clip(np.round(batch / scale + zero_point), info.min, info.max)
+        return batch.astype(detail['dtype'])
+
+    def _dequantize(self, output, detail):
+        scale, zero_point = detail['quantization']
+        if detail['dtype'] in (np.int8, np.uint8) and scale:
+            return (output.astype('float32') - zero_point) * scale
+        return output.astype('float32')
+
+    def predict(self, batch):
+        with self._lock:
+            if batch.shape[0] != self._batch_size:
+                self.interpreter.resize_tensor_input(self.input_detail['index'], batch.shape)
+                self.interpreter.allocate_tensors()
+                self._batch_size = batch.shape[0]
+            self.interpreter.set_tensor(self.input_detail['index'], self._quantize(batch, self.input_detail))
+            self.interpreter.invoke()
+            output = self.interpreter.get_tensor(self.output_detail['index'])
+        return self._dequantize(output, self.output_detail)
+
+
+class OnnxBackend:
+    """ONNX Runtime session on CPU"""
+
+    name = 'onnx'
+
+    def __init__(self, model_path, num_threads=None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(str(model_path), options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        input_shape = self.session.get_inputs()[0].shape
+        self.input_shape = (None,) + tuple(input_shape[1:])
+        self.output_classes = self.session.get_outputs()[0].shape[-1]
+
+    def predict(self, batch):
+        return self.session.run(None, {self.input_name: batch.astype('float32', copy=False)})[0]
+
+
+def guess_backend(model_path):
+    """Pick a backend from the artifact's file extension"""
+    suffix = Path(model_path).suffix.lower()
+    if suffix == '.tflite':
+        return 'tflite'
+    if suffix == '.onnx':
+        return 'onnx'
+    return 'keras'
+
+
+def load_backend(model_path, backend=None, num_threads=None):
+    """Load a model artifact with the requested (or inferred) backend"""
+    backend = backend or guess_backend(model_path)
+    preloaded = _preloaded.get((str(Path(model_path).resolve()), backend))
+    if preloaded is not None:
+        return preloaded
+    if backend == 'keras':
+        return KerasBackend(model_path)
+    if backend == 'tflite':
+        return TFLiteBackend(model_path, num_threads=num_threads)
+    if backend == 'onnx':
+        return OnnxBackend(model_path, num_threads=num_threads)
+    raise ValueError(f"Unknown inference backend '{backend}'. Choose one of: {', '.join(BACKENDS)}")
+
+
+def preload_backend(model_path, backend=None, num_threads=None):
+    """Load a backend once so that load_backend() hands out the same instance, e.g. to forked workers"""
+    backend = backend or guess_backend(model_path)
+    instance = load_backend(model_path, backend, num_threads=num_threads)
+    _preloaded[(str(Path(model_path).resolve()), backend)] = instance
+    return instance
@@ -0,0 +1,180 @@
+import math
+from collections import Counter, deque
+
+import numpy as np
+
+
+def is_word_char(char):
+    """Same definition of a word character as the regex \\w used by the old matcher"""
+    return char.isalnum() or char == '_'
+
+
+def at_word_boundary(text, index):
+    """Equivalent of regex \\b at position index"""
+    before = index > 0 and is_word_char(text[index - 1])
+    after = index < len(text) and is_word_char(text[index])
+    return before != after
+
+
+class PatternAutomaton:
+    """Aho-Corasick automaton over all intent patterns; one pass over the message finds every match"""
+
+    def __init__(self):
+        self.goto = [{}]
+        self.fail = [0]
+        self.outputs = [[]]
+        self.output_link = [0]  # Nearest fail-chain state that has outputs
+        self.patterns = []  # (length, intent index)
+
+    def add(self, pattern, intent_index):
+        state = 0
+        for char in pattern:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.outputs.append([])
+                self.output_link.append(0)
+            state = next_state
+        self.outputs[state].append(len(self.patterns))
+        self.patterns.append((len(pattern), intent_index))
+
+    def build(self):
+        """Compute failure links breadth-first (children of the root keep failing to the root)"""
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                target = self.fail[child]
+                self.output_link[child] = target if self.outputs[target] else self.output_link[target]
+
+    def best_intent(self, text):
+        """Lowest intent index with a pattern matching on word boundaries, or None"""
+        best = None
+        state = 0
+        for end, char in enumerate(text):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+
+            match_state = state if self.outputs[state] else self.output_link[state]
+            while match_state:
+                for pattern_id in self.outputs[match_state]:
+                    length, intent_index = self.patterns[pattern_id]
+                    if best is not None and intent_index >= best:
+                        continue
+                    start = end - length + 1
+                    if at_word_boundary(text, start) and at_word_boundary(text, end + 1):
+                        best = intent_index
+                match_state = self.output_link[match_state]
+
+            if best == 0:
+                break
+        return best
+
+
+class FuzzyIndex:
+    """TF-IDF over character trigrams of each pattern, scored with NumPy for misspelled queries"""
+
+    def __init__(self, patterns, min_length=4):
+        self.intents = []
+        self.vocabulary = {}
+        documents = []
+        for pattern, intent_index in patterns:
+            if len(pattern) < min_length:
+                continue
+            documents.append(Counter(self.ngrams(pattern)))
+            self.intents.append(intent_index)
+
+        document_frequency = Counter(gram for grams in documents for gram in grams)
+        for gram in document_frequency:
+            self.vocabulary[gram] = len(self.vocabulary)
+        total = len(documents)
+        self.idf = np.array([
+            math.log((1 + total) / (1 + document_frequency[gram])) + 1 for gram in self.vocabulary
+        ], dtype='float32')
+
+        # Postings (CSR by n-gram): which patterns contain each n-gram and that n-gram's share of the pattern's weight
+        rows = []
+        cols = []
+        weights = []
+        for row, grams in enumerate(documents):
+            ids = np.array([self.vocabulary[gram] for gram in grams], dtype='int64')
+            tf = 1 + np.log(np.array(list(grams.values()), dtype='float32'))
+            vector = tf * self.idf[ids]
+            rows.append(np.full(len(ids), row, dtype='int64'))
+            cols.append(ids)
+            weights.append(vector ** 2 / float(np.dot(vector, vector)))
+
+        if documents:
+            rows = np.concatenate(rows)
+            cols = np.concatenate(cols)
+            weights = np.concatenate(weights)
+        else:
+            rows = cols = np.empty(0, dtype='int64')
+            weights = np.empty(0, dtype='float32')
+        order = np.argsort(cols, kind='stable')
+        self.posting_rows = rows[order]
+        self.posting_weights = weights[order].astype('float32')
+        self.indptr = np.searchsorted(cols[order], np.arange(len(self.vocabulary) + 1))
+        self.intents = np.array(self.intents, dtype='int64')
+
+    @staticmethod
+    def ngrams(text, n=3):
+        grams = []
+        for word in text.split():
+            padded = f" {word} "
+            grams.extend(padded[i:i + n] for i in range(max(1, len(padded) - n + 1)))
+        return grams
+
+    def best_intent(self, text, threshold):
+        """Intent whose pattern is best covered by the message's trigrams, if coverage >= threshold"""
+        if not len(self.intents):
+            return None
+        ids = {self.vocabulary[gram] for gram in self.ngrams(text) if gram in self.vocabulary}
+        if not ids:
+            return None
+
+        slices = [slice(self.indptr[i], self.indptr[i + 1]) for i in ids]
+        rows = np.concatenate([self.posting_rows[s] for s in slices])
+        weights = np.concatenate([self.posting_weights[s] for s in slices])
+        coverage = np.bincount(rows, weights=weights, minlength=len(self.intents))
+
+        best = int(np.argmax(coverage))
+        if coverage[best] < threshold:
+            return None
+        # Among equally good patterns prefer the earliest intent, like the exact matcher
+        tied = np.flatnonzero(coverage >= coverage[best] - 1e-6)
+        return int(self.intents[tied].min())
+
+
+class IntentMatcher:
+    """Compiled index over every intent pattern, built once when intents are loaded"""
+
+    def __init__(self, intents, fuzzy_threshold=0.6):
+        self.fuzzy_threshold = fuzzy_threshold
+        self.automaton = PatternAutomaton()
+        patterns = []
+        for intent_index, intent in enumerate(intents):
+            for pattern in intent.get('patterns', []):
+                pattern = pattern.lower().strip()
+                if pattern:
+                    self.automaton.add(pattern, intent_index)
+                    patterns.append((pattern, intent_index))
+        self.automaton.build()
+        self.fuzzy = FuzzyIndex(patterns)
+
+    def match(self, message):
+        """Index of the matching intent (exact word match first, then fuzzy), or None"""
+        message = message.lower()
+        intent_index = self.automaton.best_intent(message)
+        if intent_index is None and self.fuzzy_threshold:
+            intent_index = self.fuzzy.best_intent(message, self.fuzzy_threshold)
+        return intent_index
@@ -1,9 +1,133 @@
-from geopy.geocoders import Nominatim
+import json
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from utils.metrics import metrics
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def geohash(latitude, longitude, precision=6):
+    """Geohash cell of a point; precision 6 is roughly a 1.2 km x 0.6 km cell"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    cell = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(cell) < precision:
+        value, bounds = (longitude, lon_range) if even else (latitude, lat_range)
+        mid = (bounds[0] + bounds[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            bounds[0] = mid
+        else:
+            bounds[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            cell.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(cell)
+
+
+class StubGeocoder:
+    """Offline stand-in for Nominatim, for tests and air-gapped development"""
+
+    class Location:
+        def __init__(self, address):
+            self.address = address
+
+    def __init__(self, address='Test Village, Test District, India'):
+        self.address = address
+        self.calls = 0
+
+    def reverse(self, query, **kwargs):
+        self.calls += 1
+        return self.Location(f"{self.address} ({query})")
+
+
+class RegionIndex:
+    """Region polygons from a data file, bucketed on a 1-degree grid so a lookup only tests nearby polygons"""
+
+    def __init__(self, regions, default, cell_size=1.0):
+        self.regions = regions
+        self.default = default
+        self.cell_size = cell_size
+        self.cells = {}
+        for index, region in enumerate(regions):
+            lats = [point[0] for point in region['polygon']]
+            lons = [point[1] for point in region['polygon']]
+            region['bbox'] = (min(lats), max(lats), min(lons), max(lons))
+            for lat_cell in range(self._cell(min(lats)), self._cell(max(lats)) + 1):
+                for lon_cell in range(self._cell(min(lons)), self._cell(max(lons)) + 1):
+                    self.cells.setdefault((lat_cell, lon_cell), []).append(index)
+
+    @classmethod
+    def from_file(cls, path):
+        with open(Path(path), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data['regions'], data['default'])
+
+    def _cell(self, value):
+        return int(value // self.cell_size)
+
+    @staticmethod
+    def contains(polygon, lat, lon):
+        """Point-in-polygon by ray casting; points on an edge count as inside"""
+        inside = False
+        count = len(polygon)
+        for i in range(count):
+            lat1, lon1 = polygon[i]
+            lat2, lon2 = polygon[(i + 1) % count]
+            # On the edge
+            cross = (lat2 - lat1) * (lon - lon1) - (lon2 - lon1) * (lat - lat1)
+            if (cross == 0 and min(lat1, lat2) <= lat <= max(lat1, lat2)
+                    and min(lon1, lon2) <= lon <= max(lon1, lon2)):
+                return True
+            if (lon1 > lon) != (lon2 > lon):
+                crossing = (lat2 - lat1) * (lon - lon1) / (lon2 - lon1) + lat1
+                if lat < crossing:
+                    inside = not inside
+        return inside
+
+    def lookup(self, lat, lon):
+        """First region (in file order) whose polygon contains the point, else the default"""
+        candidates = set()
+        # Points on a cell edge may belong to polygons bucketed only in the neighbouring cell
+        for lat_cell in {self._cell(lat), self._cell(lat - 1e-9)}:
+            for lon_cell in {self._cell(lon), self._cell(lon - 1e-9)}:
+                candidates.update(self.cells.get((lat_cell, lon_cell), ()))
+
+        for index in sorted(candidates):
+            region = self.regions[index]
+            min_lat, max_lat, min_lon, max_lon = region['bbox']
+            if min_lat <= lat <= max_lat and min_lon <= lon <= max_lon and self.contains(region['polygon'], lat, lon):
+                return region
+        return self.default
+
 
 class LocationService:
-    def __init__(self):
-        self.geolocator = Nominatim(user_agent="scdas_rice_app_v1")
-    
+    def __init__(self, geocoder=None, db=None, regions_file='data/rice_regions.json',
+                 cache_ttl_seconds=30 * 24 * 3600, precision=6, timeout=3, max_entries=10000):
+        if geocoder is None:
+            from geopy.geocoders import Nominatim
+            geocoder = Nominatim(user_agent="scdas_rice_app_v1", timeout=timeout)
+        self.geolocator = geocoder
+        self.db = db
+        self.cache_ttl_seconds = cache_ttl_seconds
+        self.precision = precision
+        self.max_entries = max(1, int(max_entries))
+        self.region_index = RegionIndex.from_file(regions_file)
+        self._cache = OrderedDict()  # LRU of cell -> (address, fetched_at); SQLite keeps the rest
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'db_hits': 0, 'misses': 0, 'errors': 0}
+
+    @metrics.timed('location')
     def get_location_info(self, latitude, longitude):
         if not latitude or not longitude:
             return {
@@ -12,13 +136,12 @@ class LocationService:
                 'climate_info': 'Enable location services for region-specific rice cultivation advice',
                 'crop_advice': 'General rice cultivation practices apply'
             }
-        
+
         try:
-            location = self.geolocator.reverse(f"{latitude}, {longitude}")
-            address = location.address if location else 'Address not found'
-            
+            address = self.reverse_geocode(float(latitude), float(longitude))
+
             region_info = self.get_regional_rice_advice(latitude, longitude)
-            
+
             return {
                 'address': address,
                 'latitude': latitude,
@@ -28,62 +151,63 @@ class LocationService:
                 'crop_advice': region_info['advice']
             }
         except Exception as e:
+            with self._lock:
+                self._stats['errors'] += 1
             return {
                 'address': 'Error retrieving location',
                 'region': 'Unknown',
                 'climate_info': 'Unable to fetch location data',
                 'crop_advice': 'Consult local agricultural office'
             }
-    
+
+    def reverse_geocode(self, lat, lon):
+        """Address for a point, cached per geohash cell (memory, then SQLite) with a TTL"""
+        cell = geohash(lat, lon, self.precision)
+        now = time.time()
+
+        with self._lock:
+            cached = self._cache.get(cell)
+            if cached and now - cached[1] < self.cache_ttl_seconds:
+                self._cache.move_to_end(cell)
+                self._stats['hits'] += 1
+                return cached[0]
+
+        if self.db is not None:
+            stored = self.db.get_geocode(cell)
+            if stored and now - stored[1] < self.cache_ttl_seconds:
+                with self._lock:
+                    self._remember(cell, stored)
+                    self._stats['db_hits'] += 1
+                return stored[0]
+
+        with metrics.timer('nominatim'):
+            location = self.geolocator.reverse(f"{lat}, {lon}")
+        address = location.address if location else 'Address not found'
+
+        with self._lock:
+            self._remember(cell, (address, now))
+            self._stats['misses'] += 1
+        if self.db is not None:
+            self.db.save_geocode(cell, address, now)
+        return address
+
+    def _remember(self, cell, entry):
+        self._cache[cell] = entry
+        self._cache.move_to_end(cell)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    def get_stats(self):
+        """Geocode cache counters"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['cells'] = len(self._cache)
+        return stats
+
     def get_regional_rice_advice(self, latitude, longitude):
-        lat = float(latitude)
-        lon = float(longitude)
-        
-        if 8 <= lat <= 13 and 76 <= lon <= 80:
-            return {
-                'region': 'South India (Tamil Nadu/Kerala)',
-                'climate': 'Tropical climate with high rainfall. Suitable for year-round rice cultivation.',
-                'advice': 'Grow Samba Mahsuri, ADT-43, CR-1009 varieties. Watch for blast and bacterial blight. Practice SRI (System of Rice Intensification) for water conservation. Two to three crops per year possible.'
-            }
-        
-        elif 15 <= lat <= 19 and 77 <= lon <= 84:
-            return {
-                'region': 'Andhra Pradesh/Telangana',
-                'climate': 'Semi-arid to tropical. Kharif and Rabi seasons suitable for rice.',
-                'advice': 'Recommended varieties: MTU-1010, BPT-5204, RNR-15048. Focus on tungro and brown spot management. Use Alternate Wetting Drying (AWD) irrigation method.'
-            }
-        
-        elif 18 <= lat <= 27 and 82 <= lon <= 92:
-            return {
-                'region': 'Eastern India (West Bengal/Odisha)',
-                'climate': 'High rainfall zone, humid subtropical. Major rice bowl of India.',
-                'advice': 'Grow Swarna, Lalat, Naveen, Improved Samba Mahsuri. Blast and bacterial blight are major concerns. Ensure good drainage during monsoon. Practice direct seeded rice (DSR) in suitable areas.'
-            }
-        
-        elif 26 <= lat <= 32 and 74 <= lon <= 84:
-            return {
-                'region': 'North India (Punjab/Haryana/UP)',
-                'climate': 'Subtropical with hot summers. Kharif season (June-Nov) ideal for rice.',
-                'advice': 'Popular varieties: Pusa-44, PR-126, Pusa Basmati 1509, 1121. Manage bacterial blight and blast. Transplant in June-July. Practice straw management to reduce stubble burning.'
-            }
-        
-        elif 23 <= lat <= 28 and 88 <= lon <= 97:
-            return {
-                'region': 'North-Eastern India (Assam/Tripura)',
-                'climate': 'High rainfall, hilly terrain. Traditional rice cultivation region.',
-                'advice': 'Grow Ranjit, Bahadur, Gitesh varieties for lowland. Blast disease is major problem due to high humidity. Practice terrace cultivation in hilly areas. Use organic farming methods.'
-            }
-        
-        elif 20 <= lat <= 25 and 75 <= lon <= 85:
-            return {
-                'region': 'Central India (Madhya Pradesh/Chhattisgarh)',
-                'climate': 'Semi-arid climate with moderate rainfall.',
-                'advice': 'Suitable varieties: MTU-1010, Mahamaya, Rajeshwari. Manage brown spot and sheath blight. Grow rice in Kharif season. Practice integrated nutrient management.'
-            }
-        
-        else:
-            return {
-                'region': 'General Rice Growing Region',
-                'climate': 'Variable climate conditions',
-                'advice': 'Use locally adapted rice varieties. Monitor for blast, bacterial blight, and tungro. Practice proper water management (5-7cm during critical stages). Consult nearest Krishi Vigyan Kendra (KVK) for specific recommendations.'
-            }
\ No newline at end of file
+        region = self.region_index.lookup(float(latitude), float(longitude))
+        return {
+            'region': region['region'],
+            'climate': region['climate'],
+            'advice': region['advice']
+        }
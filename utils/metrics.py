@@ -0,0 +1,143 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# Histogram bucket upper bounds in seconds (Prometheus 'le' labels)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Stage timings of the request being handled; executor stages inherit it through copy_context()
+_current_trace = contextvars.ContextVar('metrics_trace', default=None)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total += value
+        self.count += 1
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+
+class Metrics:
+    """In-process counters and latency histograms rendered in the Prometheus text format"""
+
+    def __init__(self, prefix='scdas', buckets=DEFAULT_BUCKETS):
+        self.prefix = prefix
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._histograms = {}  # (name, labels) -> Histogram
+        self._counters = {}  # (name, labels) -> value
+        self._help = {}
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def increment(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe_stage(self, stage, seconds):
+        """Record a pipeline stage duration, and add it to the current request's trace if there is one"""
+        self.observe('stage_duration_seconds', seconds, stage=stage)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.append((stage, round(seconds * 1000, 2)))
+
+    @contextmanager
+    def timer(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_stage(stage, time.perf_counter() - started)
+
+    def timed(self, stage):
+        """Decorator form of timer()"""
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.timer(stage):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @staticmethod
+    def start_trace():
+        """Begin collecting (stage, ms) pairs for the current request; returns the list being filled"""
+        trace = []
+        _current_trace.set(trace)
+        return trace
+
+    @staticmethod
+    def end_trace():
+        _current_trace.set(None)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            histograms = [(key, list(h.counts), h.total, h.count) for key, h in self._histograms.items()]
+            counters = list(self._counters.items())
+
+        lines = []
+        described = set()
+
+        def header(name, kind):
+            full = f"{self.prefix}_{name}"
+            if full not in described:
+                described.add(full)
+                if name in self._help:
+                    lines.append(f"# HELP {full} {self._help[name]}")
+                lines.append(f"# TYPE {full} {kind}")
+            return full
+
+        for (name, labels), value in sorted(counters):
+            full = header(name, 'counter')
+            lines.append(f"{full}{format_labels(labels)} {value}")
+
+        for (name, labels), counts, total, count in sorted(histograms, key=lambda item: item[0]):
+            full = header(name, 'histogram')
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                lines.append(f"{full}_bucket{format_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{full}_sum{format_labels(labels)} {total}")
+            lines.append(f"{full}_count{format_labels(labels)} {count}")
+
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+metrics.describe('stage_duration_seconds', 'Time spent in each pipeline stage')
+metrics.describe('request_duration_seconds', 'Request latency by endpoint')
+metrics.describe('predictions_fallback_total', 'Predictions answered by the fallback result instead of the model')
+metrics.describe('predictions_low_confidence_total', 'Uploads rejected for confidence below MIN_CONFIDENCE_THRESHOLD')
+metrics.describe('prefilter_rejections_total', 'Uploads rejected by the prefilter before inference, by reason')
+metrics.describe('uploads_model_sized_total', 'Uploads already at model input size, stored without a resampled model copy')
+metrics.describe('slow_requests_total', 'Requests slower than SLOW_REQUEST_MS')
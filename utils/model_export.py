@@ -0,0 +1,176 @@
+"""Convert the Keras model to lighter inference artifacts and check they agree with it.
+
+    python -m utils.model_export convert --model models/crop_disease_model.h5 --calibration-dir static/uploads
+    python -m utils.model_export parity --reference models/crop_disease_model.h5 \
+        --candidate models/crop_disease_model_int8.tflite --images static/uploads
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from config import Config
+from utils.disease_predictor import DiseasePredictor, INPUT_SIZE
+from utils.inference_backends import KerasBackend, guess_backend
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg'}
+
+
+def find_images(folder, limit=None):
+    """Image files under a folder, sorted for repeatable runs"""
+    images = sorted(p for p in Path(folder).rglob('*') if p.suffix.lower() in IMAGE_EXTENSIONS)
+    return images[:limit] if limit else images
+
+
+def representative_dataset(images):
+    """Calibration batches for full-integer quantization"""
+    def generate():
+        batch = np.empty((1, INPUT_SIZE[1], INPUT_SIZE[0], 3), dtype='float32')
+        for path in images:
+            if DiseasePredictor.preprocess_into(str(path), batch[0]):
+                yield [batch]
+    return generate
+
+
+def write_artifact(path, data):
+    Path(path).write_bytes(data)
+    print(f"✅ Wrote {path} ({len(data) / 1024 / 1024:.2f} MB)")
+
+
+def convert(args):
+    import tensorflow as tf
+
+    model_path = Path(args.model)
+    out_dir = Path(args.out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    stem = model_path.stem
+
+    print(f"🔄 Loading {model_path}...")
+    model = KerasBackend(model_path).model
+    print(f"📊 Keras model: {model_path.stat().st_size / 1024 / 1024:.2f} MB")
+
+    # float16 weights: half the size, float32 compute, no calibration needed
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.target_spec.supported_types = [tf.float16]
+    write_artifact(out_dir / f"{stem}_fp16.tflite", converter.convert())
+
+    # int8 weights and activations, calibrated on real leaf photos; input/output stay float32
+    calibration = find_images(args.calibration_dir, args.calibration_limit) if args.calibration_dir else []
+    if calibration:
+        print(f"🔄 Calibrating int8 model on {len(calibration)} images...")
+        converter = tf.lite.TFLiteConverter.from_keras_model(model)
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset(calibration)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8, tf.lite.OpsSet.TFLITE_BUILTINS]
+        write_artifact(out_dir / f"{stem}_int8.tflite", converter.convert())
+    else:
+        print("⚠️ No calibration images found, skipping int8 TFLite export (use --calibration-dir)")
+
+    if args.onnx:
+        export_onnx(model, out_dir / f"{stem}.onnx")
+
+
+def export_onnx(model, onnx_path):
+    import tensorflow as tf
+    try:
+        import tf2onnx
+    except ImportError:
+        print("⚠️ tf2onnx is not installed, skipping ONNX export (pip install tf2onnx)")
+        return
+
+    spec = (tf.TensorSpec((None, INPUT_SIZE[1], INPUT_SIZE[0], 3), tf.float32, name='input'),)
+    tf2onnx.convert.from_keras(model, input_signature=spec, output_path=str(onnx_path))
+    print(f"✅ Wrote {onnx_path} ({onnx_path.stat().st_size / 1024 / 1024:.2f} MB)")
+
+    try:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+    except ImportError:
+        print("⚠️ onnxruntime is not installed, skipping int8 ONNX export")
+        return
+
+    int8_path = onnx_path.with_name(f"{onnx_path.stem}_int8.onnx")
+    quantize_dynamic(str(onnx_path), str(int8_path), weight_type=QuantType.QInt8)
+    print(f"✅ Wrote {int8_path} ({int8_path.stat().st_size / 1024 / 1024:.2f} MB)")
+
+
+def parity(args):
+    images = find_images(args.images, args.limit)
+    if not images:
+        print(f"❌ No images found in {args.images}")
+        return 1
+
+    reference = DiseasePredictor(args.reference, batching=False, backend=guess_backend(args.reference))
+    candidate = DiseasePredictor(args.candidate, batching=False, backend=guess_backend(args.candidate))
+    if reference.model is None or candidate.model is None:
+        print("❌ Both models must load for a parity check")
+        return 1
+
+    agree = 0
+    drifts = []
+    timings = {'reference': 0.0, 'candidate': 0.0}
+    for path in images:
+        batch = reference.preprocess_image(str(path))
+        if batch is None:
+            continue
+
+        started = time.perf_counter()
+        expected = reference.run_inference(batch)[0]
+        timings['reference'] += time.perf_counter() - started
+
+        started = time.perf_counter()
+        actual = candidate.run_inference(batch)[0]
+        timings['candidate'] += time.perf_counter() - started
+
+        top1 = int(np.argmax(expected))
+        agree += int(np.argmax(actual)) == top1
+        drifts.append(abs(float(actual[top1]) - float(expected[top1])) * 100)
+
+    checked = len(drifts)
+    agreement = agree / checked if checked else 0.0
+    print("\n" + "=" * 60)
+    print(f"📊 Parity: {args.candidate} vs {args.reference}")
+    print("=" * 60)
+    print(f"Images compared:        {checked}")
+    print(f"Top-1 agreement:        {agreement * 100:.2f}%")
+    print(f"Confidence drift (pts): mean {np.mean(drifts):.3f}, max {np.max(drifts):.3f}")
+    print(f"Latency per image (ms): reference {timings['reference'] / checked * 1000:.2f}, "
+          f"candidate {timings['candidate'] / checked * 1000:.2f}")
+
+    if agreement < args.min_agreement:
+        print(f"❌ Agreement below {args.min_agreement * 100:.1f}%")
+        return 1
+    print("✅ Parity check passed")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export and verify lightweight SCDAS inference artifacts')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    convert_cmd = commands.add_parser('convert', help='Convert the .h5 model to float16 / int8 artifacts')
+    convert_cmd.add_argument('--model', default=Config.MODEL_PATH)
+    convert_cmd.add_argument('--out-dir', default='models')
+    convert_cmd.add_argument('--calibration-dir', default=Config.UPLOAD_FOLDER,
+                             help='Folder of leaf photos used to calibrate int8 quantization')
+    convert_cmd.add_argument('--calibration-limit', type=int, default=200)
+    convert_cmd.add_argument('--onnx', action='store_true', help='Also export ONNX (needs tf2onnx)')
+
+    parity_cmd = commands.add_parser('parity', help='Compare a converted artifact against the reference model')
+    parity_cmd.add_argument('--reference', default=Config.MODEL_PATH)
+    parity_cmd.add_argument('--candidate', required=True)
+    parity_cmd.add_argument('--images', default=Config.UPLOAD_FOLDER)
+    parity_cmd.add_argument('--limit', type=int, default=None)
+    parity_cmd.add_argument('--min-agreement', type=float, default=0.95)
+
+    args = parser.parse_args(argv)
+    if args.command == 'convert':
+        convert(args)
+        return 0
+    return parity(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
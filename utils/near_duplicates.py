@@ -0,0 +1,130 @@
+import threading
+import time
+from collections import OrderedDict
+from itertools import combinations
+
+import numpy as np
+from PIL import Image
+
+HASH_BITS = 64
+HASH_SIZE = 32  # pHash is taken from the DCT of a HASH_SIZE x HASH_SIZE grayscale copy
+
+
+def _dct_matrix(n):
+    k = np.arange(n)
+    matrix = np.sqrt(2 / n) * np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * n))
+    matrix[0] /= np.sqrt(2)
+    return matrix.astype('float32')
+
+
+DCT_MATRIX = _dct_matrix(HASH_SIZE)
+
+
+def perceptual_hash(rgb):
+    """64-bit pHash of an RGB uint8 array: signs of the 8x8 lowest DCT frequencies against their median.
+    Recompression, resizing and small exposure changes move it by a few bits at most."""
+    gray = Image.fromarray(rgb).convert('L').resize((HASH_SIZE, HASH_SIZE), Image.BILINEAR)
+    frequencies = (DCT_MATRIX @ np.asarray(gray, dtype='float32') @ DCT_MATRIX.T)[:8, :8].ravel()
+    bits = frequencies > np.median(frequencies[1:])  # The DC term only says how bright the photo is
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+def to_signed(phash):
+    """SQLite integers are signed 64-bit"""
+    return phash - (1 << HASH_BITS) if phash >= 1 << (HASH_BITS - 1) else phash
+
+
+def to_unsigned(value):
+    return value + (1 << HASH_BITS) if value < 0 else value
+
+
+class NearDuplicateIndex:
+    """Multi-index hashing over 64-bit perceptual hashes: the most recent max_entries keys, searchable by Hamming distance.
+
+    The hash is split into `chunks` substrings, each with its own table. Two hashes within max_distance bits
+    agree to within max_distance // chunks bits on at least one substring (pigeonhole), so a lookup only
+    probes the buckets that close to the query's substrings and checks the full distance of what it finds.
+    """
+
+    def __init__(self, max_entries=100000, max_distance=6, chunks=4):
+        self.max_entries = max(1, int(max_entries))
+        self.max_distance = max_distance
+        self.chunks = chunks
+        self.chunk_bits = HASH_BITS // chunks
+        self._mask = (1 << self.chunk_bits) - 1
+        # Every way of flipping up to max_distance // chunks bits of one substring
+        self._probes = [sum(1 << bit for bit in flipped)
+                        for flips in range(max_distance // chunks + 1)
+                        for flipped in combinations(range(self.chunk_bits), flips)]
+        self._entries = OrderedDict()  # key -> hash, oldest first
+        self._tables = [{} for _ in range(chunks)]
+        self._lock = threading.Lock()
+        self._stats = {'lookups': 0, 'matches': 0, 'candidates': 0, 'total_ms': 0.0}
+
+    def _substrings(self, phash):
+        return [(phash >> (i * self.chunk_bits)) & self._mask for i in range(self.chunks)]
+
+    def add(self, key, phash):
+        """Index a key, replacing its previous hash; the oldest key is dropped beyond max_entries"""
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = phash
+            for table, substring in zip(self._tables, self._substrings(phash)):
+                table.setdefault(substring, []).append(key)
+            while len(self._entries) > self.max_entries:
+                self._discard(next(iter(self._entries)))
+
+    def remove(self, key):
+        with self._lock:
+            self._discard(key)
+
+    def _discard(self, key):
+        phash = self._entries.pop(key, None)
+        if phash is None:
+            return
+        for table, substring in zip(self._tables, self._substrings(phash)):
+            bucket = table[substring]
+            bucket.remove(key)
+            if not bucket:
+                del table[substring]
+
+    def nearest(self, phash):
+        """(key, distance) of the closest indexed hash within max_distance bits, or None"""
+        started = time.perf_counter()
+        best, best_distance, seen = None, self.max_distance + 1, set()
+        with self._lock:
+            for table, substring in zip(self._tables, self._substrings(phash)):
+                for probe in self._probes:
+                    for key in table.get(substring ^ probe, ()):
+                        if key in seen:
+                            continue
+                        seen.add(key)
+                        distance = hamming_distance(phash, self._entries[key])
+                        if distance < best_distance:
+                            best, best_distance = key, distance
+            self._stats['lookups'] += 1
+            self._stats['candidates'] += len(seen)
+            self._stats['total_ms'] += (time.perf_counter() - started) * 1000
+            if best is not None:
+                self._stats['matches'] += 1
+        return (best, best_distance) if best is not None else None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_stats(self):
+        """Lookups, matches, hashes compared per lookup and mean lookup time"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        lookups = stats['lookups']
+        stats['match_ratio'] = round(stats['matches'] / lookups, 4) if lookups else 0.0
+        stats['candidates_per_lookup'] = round(stats.pop('candidates') / lookups, 1) if lookups else 0.0
+        stats['mean_ms'] = round(stats.pop('total_ms') / lookups, 3) if lookups else None
+        stats['max_entries'] = self.max_entries
+        stats['max_distance'] = self.max_distance
+        return stats
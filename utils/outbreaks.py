@@ -0,0 +1,89 @@
+import math
+from datetime import datetime, timedelta
+
+from ml_models import ROLLUP_RESOLUTIONS
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = 111.32
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def bounding_box(lat, lon, radius_km):
+    """(min_lat, max_lat, min_lon, max_lon) enclosing a circle"""
+    d_lat = radius_km / KM_PER_DEGREE_LAT
+    d_lon = radius_km / (KM_PER_DEGREE_LAT * max(math.cos(math.radians(lat)), 1e-6))
+    return (max(lat - d_lat, -90.0), min(lat + d_lat, 90.0),
+            max(lon - d_lon, -180.0), min(lon + d_lon, 180.0))
+
+
+class OutbreakService:
+    """Radius / bounding-box + time-window disease counts for district alerts and the heatmap"""
+
+    def __init__(self, db, max_days=90, max_radius_km=200, max_cells=2500):
+        self.db = db
+        self.max_days = max_days
+        self.max_radius_km = max_radius_km
+        self.max_cells = max_cells
+
+    def window(self, days, now=None):
+        """(since, until, days) created_at bounds (UTC, like CURRENT_TIMESTAMP) for the last N days, capped at max_days"""
+        days = min(max(days, 1), self.max_days)
+        until = now or datetime.utcnow()
+        since = until - timedelta(days=days)
+        return since.strftime('%Y-%m-%d %H:%M:%S'), until.strftime('%Y-%m-%d %H:%M:%S'), days
+
+    def resolution(self, box):
+        """Finest rollup grid (cells per degree) that covers the box in at most max_cells cells"""
+        min_lat, max_lat, min_lon, max_lon = box
+        for resolution in sorted(ROLLUP_RESOLUTIONS, reverse=True):
+            cells = (int((max_lat - min_lat) * resolution) + 2) * (int((max_lon - min_lon) * resolution) + 2)
+            if cells <= self.max_cells:
+                return resolution
+        return min(ROLLUP_RESOLUTIONS)
+
+    def heatmap(self, box=None, center=None, radius_km=None, days=7, disease=None, now=None):
+        """Per-cell counts from the rollups; with a center + radius, cells whose center is outside the circle are dropped"""
+        if center is not None:
+            radius_km = min(radius_km, self.max_radius_km)
+            box = bounding_box(center[0], center[1], radius_km)
+        since, until, days = self.window(days, now)
+        resolution = self.resolution(box)
+        cells = self.db.outbreak_heatmap(*box, since[:10], until[:10], disease=disease, resolution=resolution)
+        if center is not None:
+            cells = [cell for cell in cells if haversine_km(center[0], center[1], cell['lat'], cell['lon']) <= radius_km]
+
+        totals = {}
+        for cell in cells:
+            totals[cell['disease']] = totals.get(cell['disease'], 0) + cell['cases']
+        return {
+            'window': {'since_day': since[:10], 'until_day': until[:10], 'days': days},
+            'bounding_box': dict(zip(('min_lat', 'max_lat', 'min_lon', 'max_lon'), box)),
+            'cell_degrees': 1 / resolution,
+            'cells': cells,
+            'totals': totals
+        }
+
+    def nearby_cases(self, lat, lon, radius_km, days=7, disease=None, now=None):
+        """Exact case counts within radius_km over the last N days, from the R*Tree"""
+        radius_km = min(radius_km, self.max_radius_km)
+        since, until, days = self.window(days, now)
+        rows = self.db.cases_in_box(*bounding_box(lat, lon, radius_km), since, until, disease=disease)
+        counts = {}
+        for _, case_lat, case_lon, disease_key in rows:
+            if haversine_km(lat, lon, case_lat, case_lon) <= radius_km:
+                counts[disease_key] = counts.get(disease_key, 0) + 1
+        return {
+            'center': {'lat': lat, 'lon': lon},
+            'radius_km': radius_km,
+            'window': {'since': since, 'until': until, 'days': days},
+            'cases': counts,
+            'total': sum(counts.values())
+        }
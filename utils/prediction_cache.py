@@ -0,0 +1,131 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from utils.near_duplicates import NearDuplicateIndex
+
+
+class PredictionCache:
+    """In-process LRU of predictions keyed by image bytes, backed by the prediction_cache table.
+    Uploads that differ in bytes but not in content can be matched by perceptual hash with get_similar."""
+
+    def __init__(self, db, max_entries=1024, near_duplicate_distance=0, near_duplicate_entries=100000,
+                 near_duplicate_sync_seconds=30):
+        self.db = db
+        self.max_entries = max(1, int(max_entries))
+        self.near_duplicate_distance = near_duplicate_distance
+        self.near_duplicate_entries = near_duplicate_entries
+        self.near_duplicate_sync_seconds = near_duplicate_sync_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'memory_hits': 0, 'db_hits': 0, 'misses': 0, 'stores': 0, 'near_duplicate_hits': 0}
+        self._similar = None  # NearDuplicateIndex of one model version, loaded on first use
+        self._similar_version = None
+        self._similar_rowid = 0
+        self._similar_synced = 0.0
+        self._similar_lock = threading.Lock()
+
+    @staticmethod
+    def hash_bytes(data):
+        """Content hash of the uploaded image"""
+        return hashlib.sha256(data).hexdigest()
+
+    def get(self, image_hash, model_version):
+        """Return {'image_path', 'prediction'} for a previously seen image, or None"""
+        key = (image_hash, model_version)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+        source = 'memory_hits'
+        if entry is not None and not Path(entry['image_path']).exists():
+            # Upload compaction may have moved the file; the table has the current path
+            entry = None
+        if entry is None:
+            entry = self.db.get_cached_prediction(image_hash, model_version)
+            source = 'db_hits'
+
+        # The stored upload is reused on a hit, so it has to still be on disk
+        if entry is not None and not Path(entry['image_path']).exists():
+            self._forget(key)
+            entry = None
+
+        with self._lock:
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._stats['hits'] += 1
+            self._stats[source] += 1
+            self._remember(key, entry)
+        return entry
+
+    def put(self, image_hash, model_version, image_path, prediction, phash=None):
+        """Remember the prediction for an image both in memory and in SQLite"""
+        entry = {'image_path': image_path, 'prediction': prediction}
+        self.db.save_cached_prediction(image_hash, model_version, image_path, prediction, phash=phash)
+        with self._lock:
+            self._stats['stores'] += 1
+            self._remember((image_hash, model_version), entry)
+        if phash is not None and self._similar is not None and self._similar_version == model_version:
+            self._similar.add(image_hash, phash)
+
+    def get_similar(self, phash, model_version):
+        """Return {'image_path', 'prediction', 'distance'} of the closest earlier image by perceptual hash, or None"""
+        if not self.near_duplicate_distance or phash is None:
+            return None
+        index = self._near_duplicate_index(model_version)
+        match = index.nearest(phash)
+        if match is None:
+            return None
+
+        image_hash, distance = match
+        entry = self.db.get_cached_prediction(image_hash, model_version)
+        if entry is None or not Path(entry['image_path']).exists():
+            index.remove(image_hash)
+            return None
+        with self._lock:
+            self._stats['near_duplicate_hits'] += 1
+        entry['distance'] = distance
+        return entry
+
+    def _near_duplicate_index(self, model_version):
+        """The index for model_version, topped up every near_duplicate_sync_seconds with hashes other processes stored"""
+        with self._similar_lock:
+            if self._similar is None or self._similar_version != model_version:
+                self._similar = NearDuplicateIndex(self.near_duplicate_entries, self.near_duplicate_distance)
+                self._similar_version = model_version
+                self._similar_rowid = 0
+                self._similar_synced = 0.0
+            if time.monotonic() - self._similar_synced >= self.near_duplicate_sync_seconds:
+                rows = self.db.get_perceptual_hashes(model_version, self._similar_rowid, self.near_duplicate_entries)
+                for rowid, image_hash, phash in rows:
+                    self._similar.add(image_hash, phash)
+                    self._similar_rowid = rowid
+                self._similar_synced = time.monotonic()
+            return self._similar
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _forget(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+        self.db.delete_cached_prediction(*key)
+
+    def get_stats(self):
+        """Hit/miss counters"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        stats['max_entries'] = self.max_entries
+        stats['near_duplicates'] = self._similar.get_stats() if self._similar is not None else {}
+        return stats
@@ -0,0 +1,100 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+
+class StageTimeout(Exception):
+    """A pipeline stage did not finish within its timeout"""
+
+
+class Stage:
+    """Handle to a stage running on the pipeline's executors"""
+
+    def __init__(self, pipeline, name, future, started):
+        self.pipeline = pipeline
+        self.name = name
+        self.future = future
+        self.started = started
+
+    def result(self, timeout=None, default=None, raise_on_timeout=False):
+        """Wait for the stage; on timeout or error return default (or raise StageTimeout)"""
+        try:
+            value = self.future.result(timeout=timeout)
+        except TimeoutError:
+            self.pipeline._count(self.name, 'timeouts')
+            print(f"⏱️ Stage {self.name} timed out after {timeout}s")
+            if raise_on_timeout:
+                raise StageTimeout(self.name)
+            return default
+        except Exception as e:
+            self.pipeline._count(self.name, 'errors')
+            print(f"❌ Stage {self.name} failed: {e}")
+            if raise_on_timeout:
+                raise
+            return default
+        return value
+
+
+class RequestPipeline:
+    """Executors for the independent stages of a request (inference, geocoding, lookups, writes).
+
+    Stages named in stage_workers get a bounded pool of their own, so a stage whose timed-out calls keep running
+    (a slow geocoder) can't occupy the threads another stage (inference) needs; the rest share one executor.
+    """
+
+    def __init__(self, max_workers=16, stage_workers=None):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='pipeline')
+        self._executors = {
+            name: ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'pipeline-{name}')
+            for name, workers in (stage_workers or {}).items()
+        }
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _count(self, name, key, amount=1):
+        with self._lock:
+            stage = self._stats.setdefault(name, {'runs': 0, 'timeouts': 0, 'errors': 0, 'total_ms': 0.0})
+            stage[key] += amount
+
+    def start(self, name, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) as a named stage; returns a Stage to wait on"""
+        started = time.perf_counter()
+
+        def run():
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._count(name, 'runs')
+                self._count(name, 'total_ms', (time.perf_counter() - started) * 1000)
+
+        # Run in a copy of the caller's context so stage timings land in the request's trace
+        context = contextvars.copy_context()
+        executor = self._executors.get(name, self.executor)
+        return Stage(self, name, executor.submit(context.run, run), started)
+
+    def background(self, name, fn, *args, **kwargs):
+        """Run a stage nobody waits on; failures are logged and counted"""
+        def run():
+            try:
+                fn(*args, **kwargs)
+            except Exception as e:
+                self._count(name, 'errors')
+                print(f"❌ Background stage {name} failed: {e}")
+
+        return self.start(name, run)
+
+    def shutdown(self):
+        """Wait for stages already submitted, e.g. history writes, before the process exits"""
+        for executor in (self.executor, *self._executors.values()):
+            executor.shutdown(wait=True)
+
+    def get_stats(self):
+        """Per-stage run, timeout and error counts with mean duration"""
+        with self._lock:
+            stats = {}
+            for name, stage in self._stats.items():
+                stats[name] = dict(stage)
+                stats[name]['mean_ms'] = round(stage['total_ms'] / stage['runs'], 2) if stage['runs'] else None
+                stats[name]['total_ms'] = round(stage['total_ms'], 1)
+        return stats
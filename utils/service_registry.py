@@ -0,0 +1,85 @@
+import threading
+import time
+
+
+class ServiceRegistry:
+    """Create heavy services on first use (or in a background warmup) and record how long each took"""
+
+    def __init__(self):
+        self._factories = {}
+        self._instances = {}
+        self._locks = {}
+        self._timings = {}
+        self._errors = {}
+        self._warmup_thread = None
+
+    def register(self, name, factory):
+        """Register a zero-argument factory for a service"""
+        self._factories[name] = factory
+        self._locks[name] = threading.Lock()
+        return LazyService(self, name)
+
+    def get(self, name):
+        """Return the service instance, creating it on first use"""
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+
+        with self._locks[name]:
+            if name not in self._instances:
+                started = time.perf_counter()
+                try:
+                    self._instances[name] = self._factories[name]()
+                except Exception as e:
+                    self._errors[name] = str(e)
+                    raise
+                finally:
+                    self._timings[name] = round((time.perf_counter() - started) * 1000, 1)
+                self._errors.pop(name, None)
+                print(f"✅ {name} ready in {self._timings[name]} ms")
+        return self._instances[name]
+
+    def is_ready(self, name):
+        return name in self._instances
+
+    def record(self, name, milliseconds):
+        """Record a startup step that is not a registered service"""
+        self._timings[name] = round(milliseconds, 1)
+
+    def warmup(self, names=None):
+        """Create services in a background thread so the first request doesn't pay for them"""
+        names = list(names or self._factories)
+
+        def run():
+            for name in names:
+                try:
+                    self.get(name)
+                except Exception as e:
+                    print(f"⚠️ Warmup of {name} failed: {e}")
+
+        self._warmup_thread = threading.Thread(target=run, name='service-warmup', daemon=True)
+        self._warmup_thread.start()
+        return self._warmup_thread
+
+    def status(self):
+        """Readiness and init time of every service, plus other startup steps"""
+        services = {}
+        for name in self._factories:
+            services[name] = {
+                'ready': name in self._instances,
+                'init_ms': self._timings.get(name),
+                'error': self._errors.get(name)
+            }
+        startup = {name: ms for name, ms in self._timings.items() if name not in self._factories}
+        return {'services': services, 'startup_ms': startup}
+
+
+class LazyService:
+    """Stand-in that forwards attribute access to the real service, creating it on first use"""
+
+    def __init__(self, registry, name):
+        self._registry = registry
+        self._name = name
+
+    def __getattr__(self, attr):
+        return getattr(self._registry.get(self._name), attr)
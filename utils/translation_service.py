@@ -0,0 +1,127 @@
+import argparse
+import asyncio
+import hashlib
+import inspect
+import json
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from utils.metrics import metrics
+
+
+class TranslationService:
+    """Translate text through an in-process LRU and a persistent SQLite memo before touching the network"""
+
+    def __init__(self, db, max_entries=2048):
+        self.db = db
+        self.max_entries = max(1, int(max_entries))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._loop = None
+        self._stats = {'memory_hits': 0, 'db_hits': 0, 'network_calls': 0, 'failures': 0}
+
+    @staticmethod
+    def text_hash(text):
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def translate(self, text, src='en', dest='te'):
+        """Translated text, or None when it is not memoized and the translation service fails"""
+        if not text or src == dest:
+            return text
+
+        key = (self.text_hash(text), src, dest)
+        with self._lock:
+            translated = self._entries.get(key)
+            if translated is not None:
+                self._entries.move_to_end(key)
+                self._stats['memory_hits'] += 1
+                return translated
+
+        translated = self.db.get_translation(*key)
+        if translated is not None:
+            stat = 'db_hits'
+        else:
+            translated = self._translate_online(text, src, dest)
+            if translated is None:
+                with self._lock:
+                    self._stats['failures'] += 1
+                return None
+            self.db.save_translation(*key, translated)
+            stat = 'network_calls'
+
+        with self._lock:
+            self._stats[stat] += 1
+            self._entries[key] = translated
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return translated
+
+    @metrics.timed('translation')
+    def _translate_online(self, text, src, dest):
+        """One shared googletrans client; calls are serialized since the client is not thread-safe"""
+        with self._client_lock:
+            try:
+                if self._client is None:
+                    from googletrans import Translator
+                    self._client = Translator()
+                result = self._client.translate(text, src=src, dest=dest)
+                # googletrans >= 4.0.2 is async; keep one event loop for the shared client
+                if inspect.isawaitable(result):
+                    if self._loop is None:
+                        self._loop = asyncio.new_event_loop()
+                    result = self._loop.run_until_complete(result)
+                return result.text
+            except Exception as e:
+                print(f"❌ Translation error: {e}")
+                return None
+
+    def get_stats(self):
+        """Memo hit / network call counters"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        return stats
+
+
+def corpus_texts(disease_info, intents):
+    """Every fixed English text the app may need in another language"""
+    from utils.tts_service import TTSService
+
+    texts = []
+    for disease_name, info in disease_info.items():
+        result = {
+            'disease': disease_name.replace('_', ' ').title(),
+            'symptoms': info.get('symptoms', 'Not available'),
+            'treatment': info.get('treatment', 'Not available'),
+            'prevention': info.get('prevention', 'Not available')
+        }
+        texts += [TTSService.build_advice_text(result), result['symptoms'], result['treatment'], result['prevention']]
+    for intent in intents.get('intents', []):
+        texts += intent.get('responses', [])
+    return texts
+
+
+if __name__ == '__main__':
+    from ml_models import Database
+
+    parser = argparse.ArgumentParser(description='Pre-translate disease advice and chatbot responses')
+    parser.add_argument('command', choices=['build'])
+    parser.add_argument('--dest', nargs='+', default=['te'])
+    args = parser.parse_args()
+
+    with open(Path('data/disease_info.json'), 'r', encoding='utf-8') as f:
+        disease_info = json.load(f)
+    with open(Path('data/chatbot_intents.json'), 'r', encoding='utf-8') as f:
+        intents = json.load(f)
+
+    service = TranslationService(Database())
+    texts = corpus_texts(disease_info, intents)
+    failed = 0
+    for dest in args.dest:
+        for text in texts:
+            if service.translate(text, 'en', dest) is None:
+                failed += 1
+    print(f"✅ {len(texts) * len(args.dest) - failed} translations memoized, {failed} failed ({service.get_stats()})")
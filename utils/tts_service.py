@@ -1,31 +1,119 @@
-import pyttsx3
 from gtts import gTTS
-from datetime import datetime
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+import threading
 from pathlib import Path
+from utils.metrics import metrics
 
 class TTSService:
-    def __init__(self):
-        self.engine = pyttsx3.init()
-        self.audio_folder = Path('static/audio')
+    def __init__(self, audio_folder='static/audio', max_cache_mb=200, tld='com'):
+        self._engine = None
+        self.audio_folder = Path(audio_folder)
         self.audio_folder.mkdir(parents=True, exist_ok=True)
-    
+        self.max_cache_bytes = int(max_cache_mb * 1024 * 1024)
+        self.tld = tld
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evicted': 0}
+
+    @staticmethod
+    def build_advice_text(result):
+        """The spoken advice for a diagnosis; pre-rendered audio is keyed on exactly this text"""
+        return (f"Disease detected: {result['disease']}. Symptoms: {result['symptoms']}. "
+                f"Treatment: {result['treatment']}. Prevention: {result['prevention']}")
+
+    def cache_key(self, text, language):
+        """Content hash of (text, language, voice)"""
+        voice = f"gtts:{self.tld}"
+        return hashlib.sha256(f"{voice}|{language}|{text}".encode('utf-8')).hexdigest()[:24]
+
+    def audio_path(self, text, language):
+        return self.audio_folder / f"tts_{self.cache_key(text, language)}.mp3"
+
+    @metrics.timed('tts')
     def convert_to_speech(self, text, language='en'):
-        """Convert text to speech and save as audio file"""
+        """Convert text to speech, reusing the cached audio file for text seen before"""
+        filepath = self.audio_path(text, language)
+        url = f"/static/audio/{filepath.name}"
+
+        if filepath.exists():
+            os.utime(filepath)  # Mark as recently used for eviction
+            with self._lock:
+                self._stats['hits'] += 1
+            return url
+
         try:
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"advice_{timestamp}.mp3"
-            filepath = self.audio_folder / filename
-            
             # Use Google Text-to-Speech for better quality
-            tts = gTTS(text=text, lang=language, slow=False)
-            tts.save(str(filepath))
-            
-            print(f"✅ Audio file created: {filename}")
-            return f"/static/audio/{filename}"
+            tts = gTTS(text=text, lang=language, tld=self.tld, slow=False)
+
+            # Write to a temp file and rename, so a concurrent request never serves a half-written file
+            # The tts_ prefix keeps a leftover temp file within reach of evict()
+            fd, tmp_path = tempfile.mkstemp(prefix='tts_', suffix='.mp3', dir=self.audio_folder)
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    tts.write_to_fp(f)
+                os.replace(tmp_path, filepath)
+            except Exception:
+                try:
+                    os.unlink(tmp_path)
+                except FileNotFoundError:
+                    pass
+                raise
+
+            with self._lock:
+                self._stats['misses'] += 1
+            print(f"✅ Audio file created: {filepath.name}")
+            self.evict()
+            return url
         except Exception as e:
             print(f"❌ TTS Error: {e}")
             return None
-    
+
+    def evict(self):
+        """Delete least recently used cached audio until the cache fits its size bound"""
+        files = []
+        total = 0
+        for path in self.audio_folder.glob('tts_*.mp3'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        if total <= self.max_cache_bytes:
+            return 0
+
+        removed = 0
+        for _, size, path in sorted(files):
+            if total <= self.max_cache_bytes:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                continue
+            total -= size
+            removed += 1
+
+        with self._lock:
+            self._stats['evicted'] += removed
+        return removed
+
+    def get_stats(self):
+        """Audio cache hit/miss/eviction counters"""
+        with self._lock:
+            return dict(self._stats)
+
+    @property
+    def engine(self):
+        """pyttsx3 engine, started on first offline use since init probes audio drivers"""
+        if self._engine is None:
+            import pyttsx3
+            self._engine = pyttsx3.init()
+        return self._engine
+
     def convert_offline(self, text):
         """Offline TTS using pyttsx3 (for areas with low connectivity)"""
         try:
@@ -35,3 +123,50 @@ class TTSService:
         except Exception as e:
             print(f"❌ Offline TTS Error: {e}")
             return False
+
+
+def prerender(tts_service, disease_info, languages, translate):
+    """Render every disease's advice (full result-page text plus each section) ahead of time"""
+    rendered = 0
+    for disease_name, info in disease_info.items():
+        result = {
+            'disease': disease_name.replace('_', ' ').title(),
+            'symptoms': info.get('symptoms', 'Not available'),
+            'treatment': info.get('treatment', 'Not available'),
+            'prevention': info.get('prevention', 'Not available')
+        }
+        texts = [TTSService.build_advice_text(result), result['symptoms'], result['treatment'], result['prevention']]
+
+        for language in languages:
+            for text in texts:
+                if language != 'en':
+                    text = translate(text, language)
+                    if text is None:
+                        continue
+                if tts_service.convert_to_speech(text, language):
+                    rendered += 1
+    return rendered
+
+
+if __name__ == '__main__':
+    from config import Config
+
+    parser = argparse.ArgumentParser(description='Pre-render advice audio for every disease')
+    parser.add_argument('command', choices=['prerender'])
+    parser.add_argument('--languages', nargs='+', default=['en', 'te'])
+    args = parser.parse_args()
+
+    with open('data/disease_info.json', 'r', encoding='utf-8') as f:
+        disease_info = json.load(f)
+
+    from ml_models import Database
+    from utils.translation_service import TranslationService
+
+    translation_service = TranslationService(Database())
+
+    def translate(text, language):
+        return translation_service.translate(text, src='en', dest=language)
+
+    service = TTSService(max_cache_mb=Config.TTS_CACHE_MAX_MB, tld=Config.TTS_TLD)
+    count = prerender(service, disease_info, args.languages, translate)
+    print(f"✅ {count} audio files ready in {service.audio_folder} ({service.get_stats()})")
@@ -0,0 +1,97 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+
+class UserProfileCache:
+    """Process-level TTL map of user profiles, so page renders don't query the users table every time.
+    Call invalidate() wherever a profile changes; the TTL bounds how long other workers can serve the old one."""
+
+    def __init__(self, db, ttl_seconds=300, max_entries=10000):
+        self.db = db
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max(1, int(max_entries))
+        self._entries = OrderedDict()  # user_id -> (profile, expires_at)
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'expired': 0, 'invalidations': 0}
+
+    def get(self, user_id):
+        """The user's profile dict, or None for an unknown user"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(user_id)
+                self._stats['hits'] += 1
+                return entry[0]
+            self._stats['expired' if entry is not None else 'misses'] += 1
+
+        profile = self.db.get_user_info(user_id)
+        if profile is not None:
+            with self._lock:
+                self._entries[user_id] = (profile, now + self.ttl_seconds)
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return profile
+
+    def invalidate(self, user_id):
+        with self._lock:
+            if self._entries.pop(user_id, None) is not None:
+                self._stats['invalidations'] += 1
+
+    def get_stats(self):
+        """Hit/miss counters; expired entries count as misses in hit_ratio"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses'] + stats['expired']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        stats['ttl_seconds'] = self.ttl_seconds
+        return stats
+
+
+class HistoryValidators:
+    """ETag / Last-Modified for a user's history views, so an unchanged page is answered with 304.
+
+    The validator is the user's latest diagnosis id plus a count of deletes and rewrites, which triggers keep
+    on the users row. Reading it is one primary-key lookup instead of the history query and a template render,
+    and it is never stale, whichever worker or background job wrote the history.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._lock = threading.Lock()
+        self._stats = {}  # endpoint -> {'requests', 'not_modified'}
+
+    def validators(self, user_id, view):
+        """(etag, last_modified) of one view (path + query) of the user's history"""
+        last_id, changes, modified_at = self.db.get_history_version(user_id)
+        etag = f'{user_id}-{last_id}-{changes}-{hashlib.md5(view.encode()).hexdigest()[:12]}'
+        last_modified = None
+        if modified_at:
+            last_modified = datetime.strptime(modified_at, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+        return etag, last_modified
+
+    def is_fresh(self, endpoint, etag, last_modified, if_none_match, if_modified_since):
+        """Whether the client's copy is current; If-None-Match wins over If-Modified-Since, as in RFC 9110"""
+        if if_none_match:
+            fresh = etag in if_none_match
+        else:
+            # Last-Modified has one-second resolution, so it is only trusted without an ETag to compare
+            fresh = bool(last_modified and if_modified_since and last_modified <= if_modified_since)
+        with self._lock:
+            counts = self._stats.setdefault(endpoint, {'requests': 0, 'not_modified': 0})
+            counts['requests'] += 1
+            counts['not_modified'] += fresh
+        return fresh
+
+    def get_stats(self):
+        """Requests and 304s per endpoint"""
+        with self._lock:
+            stats = {endpoint: dict(counts) for endpoint, counts in self._stats.items()}
+        for counts in stats.values():
+            counts['not_modified_ratio'] = round(counts['not_modified'] / counts['requests'], 4)
+        return stats